@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmarks of the engine hot paths.
+
+Every case runs on the board sizes 3, 7, 10, 15 and 19 over positions made of random moves from a fixed seed, so
+two runs do the same work. A case repeats its work until min_time seconds have passed and the best rate of the
+repeats is reported: ops/s for the board operations, nodes/s for the alpha-beta search and simulations/s for MCTS.
+
+Results are written as JSON and compared with a baseline (benchmark_baseline.json, measured on the machine that
+committed it). A case is a regression when its rate falls more than the threshold below the baseline, and the exit
+status is then 1. Rates depend on the machine, so refresh the baseline with --update_baseline when moving to another.
+
+From the project directory, run everything and compare with the committed baseline:
+python benchmark.py
+Only the heuristic on 15x15 and 19x19:
+python benchmark.py --cases heuristic_with_features --sizes 15 19
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+import gameLogic as gl
+from bots.mcts import MCTSBot
+from bots.minimax import AlphaBetaBot
+from bots.utils.batchHeuristic import batch_heuristic, stack_game_states
+from bots.utils.minimaxUtils import heuristic_with_features, prune_possible_moves
+
+SIZES = (3, 7, 10, 15, 19)
+# Marks needed to win on each benchmarked board size.
+END_CONDITION_LENGTHS = {3: 3, 7: 4, 10: 5, 15: 5, 19: 5}
+SEED = 12345
+# Random positions per board size and the share of the board filled in them (at most).
+NUM_POSITIONS = 20
+MAX_FILL = 0.3
+PASSES = 20
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# A rate more than this fraction below the baseline is a regression.
+THRESHOLD = 0.25
+
+
+def end_condition_length(dimension):
+    return END_CONDITION_LENGTHS.get(dimension, min(dimension, 5))
+
+
+# Positions of random moves (the game still running), the same for the same seed.
+def random_positions(dimension, seed=SEED, num_positions=NUM_POSITIONS):
+    rng = random.Random("{}/{}".format(seed, dimension))
+    k = end_condition_length(dimension)
+    positions = []
+    while len(positions) < num_positions:
+        game_state = gl.GameState(dimension, "X", k, 1)
+        free = [(r, c) for r in range(0, dimension) for c in range(0, dimension)]
+        rng.shuffle(free)
+        for move in free[:rng.randint(1, max(1, int(MAX_FILL * dimension**2)))]:
+            game_state.play_turn(move)
+            if not game_state.game_running:
+                game_state.backtrack_move(move)
+                break
+        positions.append(game_state)
+    return positions
+
+
+# Free squares of a position in a fixed random order, at most limit of them.
+def sample_free(game_state, rng, limit=16):
+    free = sorted(game_state.grid.possible_moves)
+    rng.shuffle(free)
+    return free[:limit]
+
+
+# The cases below do one pass of work over the positions and return (work done, seconds spent on it). The cheap ones
+# go over their work PASSES times, so that the clock is read around milliseconds of work rather than microseconds.
+
+def bench_test_coordinate_for_win(positions, seed):
+    rng = random.Random(seed)
+    work = [(p.grid, p.turn, p.end_condition_length, sample_free(p, rng)) for p in positions]
+    count = 0
+    start = time.perf_counter()
+    for _ in range(0, PASSES):
+        for grid, mark, k, coords in work:
+            for coord in coords:
+                grid.test_coordinate_for_win(coord, mark, k, look_ahead=True)
+            count += len(coords)
+    return count, time.perf_counter() - start
+
+
+def bench_play_and_backtrack(positions, seed):
+    rng = random.Random(seed)
+    work = [(p, sample_free(p, rng)) for p in positions]
+    count = 0
+    start = time.perf_counter()
+    for _ in range(0, PASSES):
+        for game_state, coords in work:
+            for coord in coords:
+                game_state.play_turn(coord)
+                game_state.backtrack_move(coord)
+            count += len(coords)
+    return count, time.perf_counter() - start
+
+
+def bench_prune_possible_moves(positions, seed):
+    start = time.perf_counter()
+    for _ in range(0, PASSES):
+        for game_state in positions:
+            prune_possible_moves(game_state)
+    return PASSES * len(positions), time.perf_counter() - start
+
+
+def bench_heuristic_with_features(positions, seed):
+    start = time.perf_counter()
+    for _ in range(0, PASSES):
+        for game_state in positions:
+            heuristic_with_features(game_state)
+    return PASSES * len(positions), time.perf_counter() - start
+
+
+# The positions stacked PASSES times over into one batch, scored in one call.
+def bench_batch_heuristic(positions, seed):
+    boards, to_move = stack_game_states(positions * PASSES)
+    start = time.perf_counter()
+    batch_heuristic(boards, positions[0].end_condition_length, to_move)
+    return len(boards), time.perf_counter() - start
+
+
+# Fixed depth searches without the table, book and threat-search shortcuts, so only alpha-beta is timed.
+def bench_alpha_beta(positions, seed):
+    nodes = 0
+    elapsed = 0.0
+    for game_state in positions[:4]:
+        max_depth = None if game_state.grid.dimension == 3 else 2
+        bot = AlphaBetaBot(computation_time_ms=10**9, max_depth=max_depth, use_solved_tables=False, use_book=False,
+                           threat_search_budget=None)
+        start = time.perf_counter()
+        bot.get_move(game_state)
+        elapsed += time.perf_counter() - start
+        nodes += bot.nodes
+    return nodes, elapsed
+
+
+def bench_mcts(positions, seed):
+    np.random.seed(seed)
+    sims = 0
+    elapsed = 0.0
+    for game_state in positions[:2]:
+        bot = MCTSBot(computation_time_ms=10**9, max_sims=100, use_book=False)
+        start = time.perf_counter()
+        bot.get_move(game_state)
+        elapsed += time.perf_counter() - start
+        sims += bot.num_sims
+    return sims, elapsed
+
+
+# name -> (function, unit of its rate)
+CASES = {"test_coordinate_for_win": (bench_test_coordinate_for_win, "ops/s"),
+         "play_and_backtrack": (bench_play_and_backtrack, "ops/s"),
+         "prune_possible_moves": (bench_prune_possible_moves, "ops/s"),
+         "heuristic_with_features": (bench_heuristic_with_features, "ops/s"),
+         "batch_heuristic": (bench_batch_heuristic, "ops/s"),
+         "alpha_beta": (bench_alpha_beta, "nodes/s"),
+         "mcts": (bench_mcts, "sims/s")}
+
+
+# Best rate of repeats runs of a case, each repeating its pass until min_time seconds of work.
+def run_case(name, positions, seed=SEED, min_time=0.2, repeats=5):
+    function, unit = CASES[name]
+    best = 0.0
+    for _ in range(0, repeats):
+        count, elapsed = 0, 0.0
+        while elapsed < min_time:
+            done, seconds = function(positions, seed)
+            count += done
+            elapsed += seconds
+            if done == 0:
+                break
+        best = max(best, count / elapsed if elapsed > 0 else 0.0)
+    return {"unit": unit, "rate": best}
+
+
+# Runs the cases on the sizes, returns the results keyed "case/size". on_result(key, result) is called per result.
+def run_benchmarks(cases=None, sizes=SIZES, seed=SEED, min_time=0.2, repeats=5, on_result=None):
+    cases = list(CASES) if cases is None else cases
+    results = {}
+    for dimension in sizes:
+        positions = random_positions(dimension, seed)
+        for name in cases:
+            key = "{}/{}".format(name, dimension)
+            results[key] = run_case(name, positions, seed, min_time, repeats)
+            if on_result is not None:
+                on_result(key, results[key])
+    return {"seed": seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results}
+
+
+# Cases of results more than threshold below their baseline rate, as (key, baseline rate, rate) tuples.
+def regressions(results, baseline, threshold=THRESHOLD):
+    slower = []
+    for key, result in sorted(results["results"].items()):
+        expected = baseline["results"].get(key)
+        if expected is not None and result["rate"] < (1 - threshold) * expected["rate"]:
+            slower.append((key, expected["rate"], result["rate"]))
+    return slower
+
+
+def format_result(key, result, baseline=None):
+    line = "{:32s} {:14.1f} {}".format(key, result["rate"], result["unit"])
+    expected = None if baseline is None else baseline["results"].get(key)
+    if expected is not None and expected["rate"] > 0:
+        line += "  ({:+.1f}% vs baseline)".format(100 * (result["rate"] / expected["rate"] - 1))
+    return line
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the engine hot paths.")
+    parser.add_argument("--cases", metavar="c", type=str, nargs="*", default=None, choices=list(CASES),
+                        help="Cases to run (default: all).")
+    parser.add_argument("--sizes", metavar="N", type=int, nargs="*", default=list(SIZES), help="Board sizes.")
+    parser.add_argument("--seed", metavar="s", type=int, default=SEED, help="Seed of the benchmark positions.")
+    parser.add_argument("--min_time", metavar="t", type=float, default=0.2, help="Seconds of work per repeat.")
+    parser.add_argument("--repeats", metavar="n", type=int, default=5, help="Repeats per case, the best one counts.")
+    parser.add_argument("--output", metavar="file", type=str, default=None, help="Write the results as JSON to file.")
+    parser.add_argument("--baseline", metavar="file", type=str, default=BASELINE_PATH, help="Baseline to compare to.")
+    parser.add_argument("--threshold", metavar="f", type=float, default=THRESHOLD,
+                        help="Allowed slowdown against the baseline (0.25 = 25%%).")
+    parser.add_argument("--update_baseline", action="store_true", help="Write the results as the new baseline.")
+    args = parser.parse_args()
+
+    baseline = None
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = run_benchmarks(args.cases, args.sizes, args.seed, args.min_time, args.repeats,
+                            lambda key, result: print(format_result(key, result, baseline), flush=True))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("Wrote baseline {}".format(args.baseline))
+    elif baseline is not None:
+        slower = regressions(report, baseline, args.threshold)
+        for key, expected, rate in slower:
+            print("REGRESSION {}: {:.1f} -> {:.1f} ({:.1f}% slower)".format(key, expected, rate,
+                                                                          100 * (1 - rate / expected)))
+        if slower:
+            sys.exit(1)
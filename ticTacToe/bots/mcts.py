@@ -1,135 +1,438 @@
 """
 Implements a Monte-Carlo Tree Search.
+
+The tree is stored in preallocated NumPy arrays indexed by node number: visit/win/loss counters, the move leading to
+the node, who made it, and the contiguous index range of the node's children. Selection and expansion play moves
+directly on the game state handed to get_move (make/unmake with play_turn/backtrack_move) instead of copying it,
+and the state is restored before the move is returned. Moves that lead to rotations/reflections of each other get a
+single child (only possible while the position itself is symmetric, e.g. in the opening).
+
+Between moves the tree is kept: when the bot moves again, the node reached by its own move and the opponent's reply
+becomes the new root and everything else is dropped (the subtree is compacted to the front of the arrays), so the
+search starts with the simulations already spent on the position. The tree never grows beyond max_nodes.
 """
 
 import gameLogic as gl
+from bots.utils.batchRollout import batch_rollout
+from bots.utils.openingBook import book_move
+from bots.utils.ponder import Ponder, PONDER_TIME_MS
+from bots.utils.searchStats import new_timers, timed, timer_fields
 import numpy as np
 import random as rand
 import time
-from copy import deepcopy
+
+MARKS = {"X": 1, "O": 2}
+
+# Per node arrays, widest types first so that every array stays aligned when they share one buffer.
+NODE_FIELDS = (("visits", np.float64),
+               # wins and losses are from the point of view of the player who made the move leading to the node
+               ("wins", np.float64),
+               ("losses", np.float64),
+               ("move", np.int32),  # cell index
+               ("parent", np.int32),
+               ("first_child", np.int32),  # -1 = not expanded
+               ("num_children", np.int32),
+               ("num_tried", np.int32),  # children visited at least once
+               ("mover", np.int8))  # MARKS value, 0 for the root
+
+
+# Cell indexes of the free squares, one per class of moves that lead to symmetric positions (the smallest index).
+def unique_moves(grid):
+    dimension = grid.dimension
+    moves = [move[0] * dimension + move[1] for move in grid.possible_moves]
+    symmetries = grid.symmetries()
+    if len(symmetries) == 1:
+        return moves
+    maps = [gl.symmetry_maps(dimension)[symmetry] for symmetry in symmetries]
+    return [move for move in moves if all(images[move] >= move for images in maps)]
+
+
+class MCTSTree:
+
+    # The arrays are views into buffer (e.g. shared memory) if given, otherwise into private memory. lock is only
+    # needed when several processes expand the same tree.
+    def __init__(self, max_nodes, buffer=None, lock=None):
+        self.max_nodes = max_nodes
+        self.lock = lock
+        initialize = buffer is None
+        if buffer is None:
+            buffer = bytearray(MCTSTree.buffer_size(max_nodes))
+        # header[0] = number of allocated nodes
+        self.header = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=0)
+        offset = self.header.nbytes
+        for name, dtype in NODE_FIELDS:
+            array = np.ndarray((max_nodes,), dtype=dtype, buffer=buffer, offset=offset)
+            setattr(self, name, array)
+            offset += array.nbytes
+        if initialize:
+            self.clear()
+
+    @staticmethod
+    def buffer_size(max_nodes):
+        return 8 + sum(max_nodes * np.dtype(dtype).itemsize for _, dtype in NODE_FIELDS)
+
+    @property
+    def size(self):
+        return int(self.header[0])
+
+    @size.setter
+    def size(self, value):
+        self.header[0] = value
+
+    def clear(self):
+        self.size = self.max_nodes
+        self.reset()
+        self.size = 0
+
+    def reset(self):
+        self.clear_nodes(0, self.size)
+        self.size = 1  # root
+
+    def clear_nodes(self, start, end):
+        self.visits[start:end] = 0
+        self.wins[start:end] = 0
+        self.losses[start:end] = 0
+        self.move[start:end] = -1
+        self.mover[start:end] = 0
+        self.parent[start:end] = -1
+        self.first_child[start:end] = -1
+        self.num_children[start:end] = 0
+        self.num_tried[start:end] = 0
+
+    # Allocates the children of node unless another process already did. Returns False if the tree is full.
+    def expand(self, node, game_state):
+        if self.lock is None:
+            return self.allocate_children(node, game_state)
+        with self.lock:
+            if self.first_child[node] >= 0:
+                return True
+            return self.allocate_children(node, game_state)
+
+    # Allocates one child per legal move in random order. Returns False if the tree is full.
+    def allocate_children(self, node, game_state):
+        moves = unique_moves(game_state.grid)
+        start = self.size
+        end = start + len(moves)
+        if end > self.max_nodes:
+            return False
+        self.move[start:end] = np.random.permutation(moves)
+        self.mover[start:end] = MARKS[game_state.turn]
+        self.parent[start:end] = node
+        self.size = end
+        # first_child last, it is what tells other processes the children are ready
+        self.num_children[node] = end - start
+        self.first_child[node] = start
+        return True
+
+    # Claims the next child of node that has not been tried yet and returns it, or -1 if all have been. Under the lock
+    # when there is one, so that two processes never get the same child.
+    def try_child(self, node):
+        if self.lock is None:
+            return self.claim_child(node)
+        with self.lock:
+            return self.claim_child(node)
+
+    def claim_child(self, node):
+        tried = self.num_tried[node]
+        if tried >= self.num_children[node]:
+            return -1
+        self.num_tried[node] = tried + 1
+        return int(self.first_child[node] + tried)
+
+    def children(self, node):
+        start = self.first_child[node]
+        return start, start + self.num_children[node]
+
+    # Child of node reached by the move (cell index), or -1 if there is no such child.
+    def child(self, node, move):
+        if self.first_child[node] < 0:
+            return -1
+        start, end = self.children(node)
+        found = np.flatnonzero(self.move[start:end] == move)
+        return start + int(found[0]) if len(found) else -1
+
+    # Keeps only the subtree under node, renumbered breadth first so that node becomes the root and every child
+    # range stays contiguous. The freed nodes are cleared for new expansions.
+    def reroot(self, node):
+        levels = [np.array([node])]
+        while len(levels[-1]):
+            level = levels[-1]
+            expanded = level[self.first_child[level] >= 0]
+            counts = self.num_children[expanded].astype(np.int64)
+            ends = np.cumsum(counts)
+            # first_child[parent] + 0, 1, ..., num_children[parent] - 1 for every expanded parent, in order
+            offsets = np.repeat(self.first_child[expanded] - (ends - counts), counts)
+            levels.append(offsets + np.arange(len(offsets)))
+        order = np.concatenate(levels)
+        size = len(order)
+        new_index = np.full(self.size, -1, dtype=np.int64)
+        new_index[order] = np.arange(size)
+        for name, _ in NODE_FIELDS:
+            array = getattr(self, name)
+            array[:size] = array[order]
+        expanded = self.first_child[:size] >= 0
+        self.first_child[:size][expanded] = new_index[self.first_child[:size][expanded]]
+        self.parent[1:size] = new_index[self.parent[1:size]]
+        self.parent[0] = -1
+        self.move[0] = -1
+        self.mover[0] = 0
+        self.clear_nodes(size, self.size)
+        self.size = size
 
 
 class MCTSBot(gl.Player):
 
-    def __init__(self):
+    def __init__(self, computation_time_ms=2000, max_sims=1000, max_nodes=200000, c=np.sqrt(2), virtual_loss=0,
+                 rollout_batch_size=1, use_book=True, reuse_tree=True):
         super(MCTSBot, self).__init__()
-        self.states = {}  # holds tuples (wins, losses, visits)
+        # Play from the opening book of the configuration (see buildBook.py) while it covers the position.
+        self.use_book = use_book
+        # Random playouts per tree traversal. Above 1 the playouts run vectorized and are backpropagated together.
+        self.rollout_batch_size = rollout_batch_size
+        self.computation_time_ms = computation_time_ms
+        self.max_sims = max_sims
+        self.c = c
+        # Losses added to a node while a simulation through it is in flight, so that searches sharing the tree
+        # spread out. 0 for a single searcher.
+        self.virtual_loss = virtual_loss
+        self.tree = MCTSTree(max_nodes)
         self.num_sims = 0
-        self.root = None
-        self.turn = None
+        # Keep the subtree of the position reached since the last search instead of starting from an empty tree.
+        self.reuse_tree = reuse_tree
+        # (dimension, end_condition_length, moves) of the position at the root of the tree, None = nothing to reuse
+        self.root_position = None
+        self.reused_sims = 0
+        # Background search on the opponent's time, it grows the tree under the position after the bot's move.
+        self.pondering = Ponder()
+        self.ponder_sims = 0
+        # Visits of the ponder root's children (by move) when pondering started.
+        self.ponder_base = {}
+        # Where the last move came from: "book" or "search".
+        self.source = None
+        self.timers = new_timers()
 
     def reset_state(self, game_state):
         self.num_sims = 0
-        self.turn = game_state.turn
-        self.root = hash(game_state)
-        self.states = dict()
-        self.states[hash(game_state)] = [0, 0, 0]
+        self.reused_sims = 0
+        self.timers = new_timers()
+        self.tree.reset()
+        self.root_position = None
 
     def get_move(self, game_state):
-        self.reset_state(game_state)
-        return self.mcts(game_state)
+        self.ponder_sims = self.num_sims if self.pondering.hand_off() else 0
+        move = book_move(game_state) if self.use_book else None
+        self.source = "book"
+        if move is not None:
+            self.reset_state(game_state)
+            return move
+        self.source = "search"
+        pondered_sims = self.pondered_sims(game_state) if self.ponder_sims > 0 else 0
+        if not (self.reuse_tree and self.advance_root(game_state)):
+            self.reset_state(game_state)
+        if pondered_sims > 0 and self.reused_sims > 0:
+            # the pondering spent under the actual reply counts towards the budget of the move, the visits left from
+            # earlier searches do not
+            share = min(1.0, pondered_sims / self.ponder_sims)
+            move = self.mcts(game_state, max(1, self.computation_time_ms - share * 1000 * self.pondering.elapsed),
+                             max(1, self.max_sims - pondered_sims))
+        else:
+            move = self.mcts(game_state)
+        if self.reuse_tree:
+            grid = game_state.grid
+            self.root_position = (grid.dimension, game_state.end_condition_length, list(game_state.moves))
+        return move
+
+    # Searches the position after the bot's move until the opponent's move arrives. Needs tree reuse, which is what
+    # hands the work over to get_move.
+    def start_pondering(self, game_state):
+        self.stop_pondering()
+        if not self.reuse_tree or not game_state.game_running:
+            return
+        if not self.advance_root(game_state):
+            self.reset_state(game_state)
+        grid = game_state.grid
+        self.root_position = (grid.dimension, game_state.end_condition_length, list(game_state.moves))
+        tree = self.tree
+        self.ponder_base = {}
+        if tree.first_child[0] >= 0:
+            start, end = tree.children(0)
+            self.ponder_base = dict(zip(tree.move[start:end].tolist(), tree.visits[start:end].tolist()))
+        self.pondering.start(lambda position: self.mcts(position, PONDER_TIME_MS, float("inf")), game_state)
+
+    def stop_pondering(self):
+        self.pondering.stop()
+
+    # Simulations of the last pondering that went into the subtree of the opponent's reply that was played (0 if the
+    # position is not one reply after the ponder root).
+    def pondered_sims(self, game_state):
+        if self.root_position is None:
+            return 0
+        dimension, _, moves = self.root_position
+        if len(game_state.moves) != len(moves) + 1 or game_state.moves[:len(moves)] != moves:
+            return 0
+        row, col = game_state.moves[-1]
+        node = self.tree.child(0, row * dimension + col)
+        if node < 0:
+            return 0
+        return int(self.tree.visits[node]) - int(self.ponder_base.get(row * dimension + col, 0))
 
-    def mcts(self, root, computation_time_ms=2000, max_sims=1000):
+    # Makes the node of the current position (reached by the moves played since the last search) the root of the
+    # tree. Returns False if the tree has nothing for it.
+    def advance_root(self, game_state):
+        if self.root_position is None:
+            return False
+        dimension, end_condition_length, moves = self.root_position
+        if (dimension, end_condition_length) != (game_state.grid.dimension, game_state.end_condition_length) or \
+                game_state.moves[:len(moves)] != moves:
+            return False
+        node = 0
+        for move in game_state.moves[len(moves):]:
+            node = self.tree.child(node, move[0] * dimension + move[1])
+            if node < 0:
+                return False
+        if node != 0:
+            self.tree.reroot(node)
+        self.num_sims = 0
+        self.reused_sims = int(self.tree.visits[0])
+        self.timers = new_timers()
+        return True
+
+    def search_stats(self):
+        stats = {"source": self.source,
+                 "simulations": self.num_sims,
+                 "reused_simulations": self.reused_sims,
+                 "ponder_simulations": self.ponder_sims,
+                 "tree_nodes": 0 if self.tree is None else self.tree.size}
+        stats.update(timer_fields(self.timers))
+        return stats
+
+    # Root visit distribution and the mean result of the root's simulations for the side to move. The root only has
+    # one child per class of symmetric moves (see unique_moves), its visits are spread evenly over the whole class.
+    def search_policy(self, game_state):
+        tree = self.tree
+        if self.source != "search" or tree is None or tree.first_child[0] < 0:
+            return None
+        start, end = tree.children(0)
+        visits = tree.visits[start:end]
+        if visits.sum() <= 0:
+            return None
+        grid = game_state.grid
+        symmetries = grid.symmetries()
+        maps = np.array(gl.symmetry_maps(grid.dimension))[symmetries]
+        policy = np.zeros(grid.num_cells)
+        # the symmetries of the position form a group, so every image of a move is hit equally often
+        for images in maps:
+            np.add.at(policy, images[tree.move[start:end]], visits / (len(symmetries) * visits.sum()))
+        # the children's movers are the side to move at the root
+        value = float((tree.wins[start:end] - tree.losses[start:end]).sum() / visits.sum())
+        return value, policy
+
+    def mcts(self, root, computation_time_ms=None, max_sims=None):
+        computation_time_ms = self.computation_time_ms if computation_time_ms is None else computation_time_ms
+        max_sims = self.max_sims if max_sims is None else max_sims
+        expand, rollout, rollouts = self.tree.expand, self.rollout, batch_rollout
+        if self.collect_stats:
+            expand = timed(expand, self.timers, "movegen")
+            rollout = timed(rollout, self.timers, "evaluation")
+            rollouts = timed(rollouts, self.timers, "evaluation")
         start_time = int(round(time.time() * 1000))
-        while int(round(time.time() * 1000)) - start_time < computation_time_ms and self.num_sims < max_sims:
-            leaf = self.traverse(deepcopy(root))  # leaf = unvisited node
-            simulation_result = self.rollout(deepcopy(leaf))
-            self.backpropagate(leaf, simulation_result)
-            self.num_sims += 1
+        stopping = self.pondering.stopping
+        while int(round(time.time() * 1000)) - start_time < computation_time_ms and self.num_sims < max_sims and \
+                not stopping.is_set():
+            path = self.traverse(root, expand)  # path[-1] = unvisited node
+            if self.rollout_batch_size > 1:
+                x_wins, o_wins, draws = rollouts(root, self.rollout_batch_size)
+                self.backpropagate_counts(root, path, x_wins, o_wins, draws)
+                self.num_sims += self.rollout_batch_size
+            else:
+                simulation_result = rollout(root)
+                self.backpropagate(root, path, simulation_result)
+                self.num_sims += 1
         return self.best_child(root)
 
-    # check if node is fully expanded
-    def fully_expanded(self, node):
-        expanded = 0
-        for move in node.grid.possible_moves:
-            node.play_turn(move)
-            if hash(node) in self.states:
-                expanded += 1
-            node.backtrack_move(move)
-        return expanded == len(node.grid.possible_moves)
-
-    # calculate utc scores
-    def best_uct(self, node, c=np.sqrt(2)):
-        best = -999999999
-        best_node = deepcopy(node)
-        best_move = None
-        parent_visits = self.states.get(hash(node))[2]
-        for move in node.grid.possible_moves:
-            candidate = deepcopy(node)
-            candidate.play_turn(move)
-            if hash(candidate) in self.states:
-                wins, losses, visits = self.states.get(hash(candidate))
-                uct = (wins - losses) / visits + c * np.sqrt(np.log(parent_visits) / visits)
-                if uct > best:
-                    best = uct
-                    best_node = candidate
-                    best_move = move
-        return best_node, best_move
-
-    # traverse to leaf node
-    def traverse(self, node):
-        while node.game_running and self.fully_expanded(node) and len(node.grid.possible_moves) > 0:
-            # pick from children
-            node, move = self.best_uct(node)
-        if node.game_running:
-            # pick unvisited child randomly
-            moves_list = deepcopy(node.grid.possible_moves)
-            while len(moves_list) > 0:
-                move = rand.sample(moves_list, 1)[0]
-                node.play_turn(move)
-                if hash(node) in self.states:
-                    node.backtrack_move(move)
-                    moves_list.remove(move)
-                else:
-                    break
-        if hash(node) not in self.states:
-            self.states[hash(node)] = [0, 0, 0]
-        return node
+    # calculate uct scores of the children of a fully expanded node
+    def best_uct(self, node):
+        tree = self.tree
+        start, end = tree.children(node)
+        # visits can still be 0 while another process is on its way to the child
+        visits = np.maximum(tree.visits[start:end], 1)
+        uct = (tree.wins[start:end] - tree.losses[start:end]) / visits + \
+            self.c * np.sqrt(np.log(tree.visits[node]) / visits)
+        return start + int(np.argmax(uct))
 
-    @staticmethod
-    def rollout_policy(node):
-        return rand.sample(node.grid.possible_moves, 1)[0]
+    # Traverse to leaf node, playing the moves on game_state. Returns the visited nodes from the root.
+    def traverse(self, game_state, expand=None):
+        tree = self.tree
+        expand = tree.expand if expand is None else expand
+        dimension = game_state.grid.dimension
+        node = 0
+        path = [node]
+        while game_state.game_running:
+            if tree.first_child[node] < 0 and not expand(node, game_state):
+                # tree is full, simulate from here
+                break
+            # pick unvisited child (children are in random order)
+            child = tree.try_child(node)
+            new_leaf = child >= 0
+            if not new_leaf:
+                child = self.best_uct(node)
+            move = int(tree.move[child])
+            game_state.play_turn((move // dimension, move % dimension))
+            node = child
+            path.append(node)
+            if self.virtual_loss:
+                tree.visits[node] += self.virtual_loss
+                tree.losses[node] += self.virtual_loss
+            if new_leaf:
+                break
+        return path
 
+    # rollout function (simulate playout), played on copies of the bitboards so game_state is not touched
     @staticmethod
-    def rollout_policy_minimax(node):
-        from bots.minimax import AlphaBetaBot
-        return AlphaBetaBot().get_move(node)
-
-    # rollout function (simulate playout)
-    def rollout(self, node):
-        while node.game_running:  # non terminal
-            move = self.rollout_policy(node)
-            # move = self.rollout_policy_minimax(deepcopy(node))
-            node.play_turn(move)
-        return node.winner
-
-    # update statistics of node
-    def update_node_stats(self, node, winner):
-        key = hash(node)
-        self.states.get(key)[0] += 1 if self.turn == winner else 0
-        self.states.get(key)[1] += 1 if winner is not None and self.turn != winner else 0
-        self.states.get(key)[2] += 1
-
-    # backpropagate playout result
-    def backpropagate(self, node, result):
-        self.update_node_stats(node, result)
-        if hash(node) == self.root:
-            return
-        last_move = node.moves[len(node.moves) - 1]
-        node.backtrack_move(last_move)
-        self.backpropagate(node, result)
+    def rollout(game_state):
+        if not game_state.game_running:
+            return game_state.winner
+        grid = game_state.grid
+        lines = gl.cell_lines(grid.dimension, game_state.end_condition_length)
+        moves = np.random.permutation(grid.mask_to_indexes(grid.free_bits())).tolist()
+        marks = {"X": grid.x_bits, "O": grid.o_bits}
+        turn, other = game_state.turn, "O" if game_state.turn == "X" else "X"
+        for index in moves:
+            bits = marks[turn] | (1 << index)
+            marks[turn] = bits
+            for mask, _ in lines[index]:
+                if bits & mask == mask:
+                    return turn
+            turn, other = other, turn
+        return None
+
+    # backpropagate playout result and undo the tree moves
+    def backpropagate(self, game_state, path, winner):
+        self.backpropagate_counts(game_state, path, 1 if winner == "X" else 0, 1 if winner == "O" else 0,
+                                  1 if winner is None else 0)
+
+    # backpropagate a batch of playout results in one step and undo the tree moves
+    def backpropagate_counts(self, game_state, path, x_wins, o_wins, draws):
+        tree = self.tree
+        path = np.array(path)
+        tree.visits[path] += x_wins + o_wins + draws
+        if self.virtual_loss:
+            tree.visits[path[1:]] -= self.virtual_loss
+            tree.losses[path[1:]] -= self.virtual_loss
+        movers = tree.mover[path]
+        x_nodes, o_nodes = path[movers == MARKS["X"]], path[movers == MARKS["O"]]
+        tree.wins[x_nodes] += x_wins
+        tree.losses[x_nodes] += o_wins
+        tree.wins[o_nodes] += o_wins
+        tree.losses[o_nodes] += x_wins
+        for move in reversed(game_state.moves[len(game_state.moves) - len(path) + 1:]):
+            game_state.backtrack_move(move)
 
     # final evaluation
-    def best_child(self, node):
-        best = -1
-        best_move = None
-        for move in node.grid.possible_moves:
-            node.play_turn(move)
-            key = hash(node)
-            if key in self.states:
-                current = max(best, self.states.get(key)[2])
-                if current > best:
-                    best = current
-                    best_move = move
-            node.backtrack_move(move)
-        return best_move
+    def best_child(self, game_state):
+        tree = self.tree
+        if tree.first_child[0] < 0:
+            return rand.choice(list(game_state.grid.possible_moves))
+        start, end = tree.children(0)
+        move = int(tree.move[start + int(np.argmax(tree.visits[start:end]))])
+        return move // game_state.grid.dimension, move % game_state.grid.dimension
@@ -2,74 +2,334 @@
 Implements minimax search with alpha-beta pruning using a handcrafted (not very good) heuristic for board
 evaluation.
 
+The search is driven by iterative deepening under a time budget. Moves are ordered by the transposition table move
+(the previous iteration's best move at the root), killer moves and a history heuristic, and searched with
+principal variation (null window) search inside an aspiration window around the previous iteration's score.
+Transposition table entries are shared by the 8 rotations/reflections of a position. Configurations solved offline
+by bots/solver.py are played straight from the solved table, and positions in the opening book (buildBook.py) straight
+from the book, without searching. On boards with 4 or more to win, a threat-space search (bots/threatSearch.py) runs
+before the alpha-beta search: a win by continuous fours is played at once, the first move of a win by continuous
+threats (not a proof) is only searched first.
+
 For this to work (better) on bigger board would need:
 a) Better heuristic to evaluate game state.
 b) Perhaps a more clever way of pruning candidate moves, so can recurse deeper in game tree.
-c) Ordering of the candidate moves in order to prune the search tree as much as possible.
 """
 
+import time
+import numpy as np
 import gameLogic as gl
-from bots.utils.minimaxUtils import simple_heuristic, heuristic_with_features, prune_possible_moves
+from bots.solver import solved_move
+from bots.threatSearch import ThreatSearch
+from bots.utils.openingBook import book_move
+from bots.utils.ponder import Ponder, PONDER_TIME_MS
+from bots.utils.searchStats import new_timers, timed, timer_fields
+from bots.utils.minimaxUtils import simple_heuristic, heuristic_with_features, prune_possible_moves, MAX_REWARD
+from bots.utils.transpositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, REPLACE_DEPTH
+
+INFINITY = 999
+# Half width of the aspiration window around the previous iteration's score.
+ASPIRATION_WINDOW = 5
+# Width of the null window used to test moves after the first one.
+NULL_WINDOW = 1e-4
+# Number of nodes searched between looks at the clock.
+TIME_CHECK_INTERVAL = 256
+# Killer moves remembered per ply.
+NUM_KILLERS = 2
+
+
+class SearchTimeout(Exception):
+    pass
 
 
 class AlphaBetaBot(gl.Player):
 
-    def __init__(self):
+    def __init__(self, computation_time_ms=1000, max_depth=None, tt_size_mb=16, tt_replacement=REPLACE_DEPTH,
+                 use_solved_tables=True, use_book=True, threat_search_budget=5000):
         super(AlphaBetaBot, self).__init__()
+        self.computation_time_ms = computation_time_ms
+        # Play straight from the solver's table on configurations that have one (see bots/solver.py).
+        self.use_solved_tables = use_solved_tables
+        # Play from the opening book of the configuration (see buildBook.py) while it covers the position.
+        self.use_book = use_book
+        # Wins by continuous fours/threats are looked for before searching (None = never).
+        self.threat_search = None if threat_search_budget is None else ThreatSearch(node_budget=threat_search_budget)
+        self.max_depth = max_depth
+        # Kept between moves (and games) of the same board configuration.
+        self.tt = TranspositionTable(size_mb=tt_size_mb, replacement=tt_replacement)
+        self.tt_config = None
+        self.killers = []
+        self.history = {"X": {}, "O": {}}
+        self.deadline = None
+        # Move searched first at the root (the start of a win by continuous threats), or None.
+        self.first_move = None
+        self.nodes = 0
+        self.evaluations = 0
+        self.cutoffs = 0
+        self.depth_reached = -1
+        # Move and score (X's point of view) of the last finished search iteration.
+        self.best_move = None
+        self.score = None
+        # Where the last move came from: "table", "book", "threat" or "search".
+        self.source = None
+        # Move generation and position hashing of the search, swapped for timed versions while collecting stats.
+        self.generate_moves = prune_possible_moves
+        self.position_key = gl.GameState.canonical_key
+        self.timers = new_timers()
+        # Background search on the opponent's time, it leaves its results in the transposition table.
+        self.pondering = Ponder()
+        self.ponder_nodes = 0
 
     def get_move(self, game_state):
+        self.ponder_nodes = self.nodes if self.pondering.hand_off() else 0
         if len(game_state.grid.possible_moves) > 0:
-            # Use optimal play under the classic 3x3 tic-tac-toe. Depth 5 = optimal play as it forces draw always.
-            if game_state.grid.dimension == 3:
-                if game_state.turn == "X":
-                    return self.alpha_beta(game_state, 5, True, simple_heuristic)
-                else:
-                    return self.alpha_beta(game_state, 5, False, simple_heuristic)
-            else:
-                # For bigger game use smaller depth and more complex heuristic.
-                if game_state.turn == "X":
-                    return self.alpha_beta(game_state, 0, True, heuristic_with_features)
-                else:
-                    return self.alpha_beta(game_state, 0, False, heuristic_with_features)
+            self.nodes = 0
+            self.evaluations = 0
+            self.cutoffs = 0
+            self.depth_reached = -1
+            self.best_move, self.score = None, None
+            self.timers = new_timers()
+            self.tt.reset_counters()
+            if self.threat_search is not None:
+                self.threat_search.nodes = 0
+            move, threat_move = None, None
+            if self.use_solved_tables:
+                move = solved_move(game_state)
+                self.source = "table"
+            if move is None and self.use_book:
+                move = book_move(game_state)
+                self.source = "book"
+            if move is None and self.threat_search is not None:
+                move, threat_move = self.threat_moves(game_state)
+                self.source = "threat"
+            if move is not None:
+                self.best_move = move
+                return move
+            self.source = "search"
+            h = self.prepare_search(game_state)
+            if not self.collect_stats:
+                return self.iterative_deepening(game_state, game_state.turn == "X", h, first_move=threat_move)
+            self.generate_moves = timed(prune_possible_moves, self.timers, "movegen")
+            self.position_key = timed(gl.GameState.canonical_key, self.timers, "hashing")
+            try:
+                return self.iterative_deepening(game_state, game_state.turn == "X", timed(h, self.timers, "evaluation"),
+                                                first_move=threat_move)
+            finally:
+                self.generate_moves = prune_possible_moves
+                self.position_key = gl.GameState.canonical_key
         else:
             raise IndexError("Bot trying to pick move from empty set of free possible moves.")
 
-    # Main alpha-beta routine.
-    def alpha_beta(self, node, depth, maximizing_player, h):
-        # We actually run alpha-beta on the children of the root node to find optimal action.
-        best_move = None
-        best = -999 if maximizing_player else 999
-        for move in prune_possible_moves(node):
-            node.play_turn(move)
-            # Returns the final value of the child node.
-            value = self.alpha_beta_iter(node, depth, -999, 999, not maximizing_player, h)
-            node.backtrack_move(move)
-            # Update best found value, move tuple.
-            if maximizing_player and value >= best:
-                best = value
-                best_move = move
-            elif not maximizing_player and value <= best:
-                best = value
-                best_move = move
+    # (VCF move, VCT move) of the side to move, at most one of them not None. A win by continuous fours is forced and
+    # played without searching, a win by continuous threats does not search all defences and is only tried first.
+    def threat_moves(self, game_state):
+        line = self.threat_search.vcf(game_state)
+        if line is not None:
+            return line[0], None
+        vcf_nodes = self.threat_search.nodes
+        line = self.threat_search.vct(game_state)
+        self.threat_search.nodes += vcf_nodes
+        return None, None if line is None else line[0]
+
+    # Starts a new search of game_state in the transposition table and returns the heuristic to search with.
+    def prepare_search(self, game_state):
+        config = (game_state.grid.dimension, game_state.end_condition_length)
+        if config != self.tt_config:
+            self.tt.clear()
+            self.tt_config = config
+        self.tt.new_search()
+        # The classic 3x3 game is searched to the end, so the exact heuristic is enough. For bigger games use
+        # the more complex heuristic.
+        return simple_heuristic if game_state.grid.dimension == 3 else heuristic_with_features
+
+    # Searches the position after the bot's move (the opponent to move) until the opponent's move arrives. The
+    # replies are searched on the way, so get_move finds their results and best moves in the transposition table.
+    def start_pondering(self, game_state):
+        self.stop_pondering()
+        if not game_state.game_running:
+            return
+        h = self.prepare_search(game_state)
+        self.pondering.start(lambda position: self.iterative_deepening(position, position.turn == "X", h,
+                                                                       PONDER_TIME_MS), game_state)
+
+    def stop_pondering(self):
+        self.pondering.stop()
+
+    def search_stats(self):
+        stats = {"source": self.source,
+                 "nodes": self.nodes,
+                 "leaf_evaluations": self.evaluations,
+                 "cutoffs": self.cutoffs,
+                 "tt_probes": self.tt.hits + self.tt.misses,
+                 "tt_hit_rate": round(self.tt.hit_rate(), 4),
+                 "depth_reached": self.depth_reached,
+                 "threat_nodes": 0 if self.threat_search is None else self.threat_search.nodes,
+                 "ponder_nodes": self.ponder_nodes}
+        stats.update(timer_fields(self.timers))
+        return stats
+
+    # The searched score scaled by the win reward, all weight on the played move. A win by continuous fours is a win.
+    def search_policy(self, game_state):
+        if self.source == "threat" and self.best_move is not None:
+            value = 1.0
+        elif self.source == "search" and self.score is not None:
+            value = max(-1.0, min(1.0, self.score / MAX_REWARD))
+            if game_state.turn == "O":
+                value = -value
+        else:
+            return None
+        policy = np.zeros(game_state.grid.num_cells)
+        policy[game_state.grid.coord_to_index(self.best_move)] = 1.0
+        return value, policy
+
+    # Search depth 0, 1, 2, ... until the time budget is spent and play the best move of the last finished depth.
+    # first_move (if given) is searched first at the root of every depth.
+    def iterative_deepening(self, node, maximizing_player, h, computation_time_ms=None, first_move=None):
+        computation_time_ms = self.computation_time_ms if computation_time_ms is None else computation_time_ms
+        self.first_move = first_move
+        start_time = time.time()
+        root_moves = len(node.moves)
+        max_depth = len(node.grid.possible_moves) - 1
+        if self.max_depth is not None:
+            max_depth = min(max_depth, self.max_depth)
+        self.killers = []
+        self.history = {"X": {}, "O": {}}
+
+        best_move, score = None, None
+        for depth in range(0, max_depth + 1):
+            # Always finish depth 0 so there is a move to play.
+            self.deadline = None if depth == 0 else start_time + computation_time_ms / 1000
+            try:
+                if score is None:
+                    move, value = self.search_root(node, depth, -INFINITY, INFINITY, maximizing_player, h)
+                else:
+                    alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+                    move, value = self.search_root(node, depth, alpha, beta, maximizing_player, h)
+                    if value <= alpha or value >= beta:
+                        move, value = self.search_root(node, depth, -INFINITY, INFINITY, maximizing_player, h)
+            except SearchTimeout:
+                # unwind the moves of the interrupted search
+                while len(node.moves) > root_moves:
+                    node.backtrack_move(node.moves[-1])
+                break
+            best_move, score = move, value
+            self.depth_reached = depth
+            # Game theoretic result found, searching deeper will not change it.
+            if abs(score) >= MAX_REWARD:
+                break
+        self.deadline = None
+        self.best_move, self.score = best_move, score
         return best_move
 
+    # Main alpha-beta routine. Returns the best move after depth + 1 plies.
+    def alpha_beta(self, node, depth, maximizing_player, h):
+        return self.search_root(node, depth, -INFINITY, INFINITY, maximizing_player, h)[0]
+
+    # We actually run alpha-beta on the children of the root node to find optimal action.
+    def search_root(self, node, depth, alpha, beta, maximizing_player, h):
+        value, best_move = self.search_moves(node, depth + 1, alpha, beta, maximizing_player, h, 0)
+        return best_move, value
+
     # One iteration of alpha-beta algorithm.
-    def alpha_beta_iter(self, node, depth, alpha, beta, maximizing_player, h):
-        value = 999 if not maximizing_player else -999
+    def alpha_beta_iter(self, node, depth, alpha, beta, maximizing_player, h, ply=1):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % TIME_CHECK_INTERVAL == 0 and \
+                (time.time() > self.deadline or self.pondering.stopping.is_set()):
+            raise SearchTimeout()
         if depth == 0 or not node.game_running:
+            self.evaluations += 1
             return h(node)
+        return self.search_moves(node, depth, alpha, beta, maximizing_player, h, ply)[0]
+
+    # Searches the children of node and returns (value, best move).
+    def search_moves(self, node, depth, alpha, beta, maximizing_player, h, ply):
+        # Look up earlier results of this position (possibly reached through another move order).
+        # Bounds are only used to cut off, not to narrow the window: a fail-low move searched under a narrowed
+        # window would otherwise be stored as the best move.
+        # Symmetric positions share one entry, its move is stored in the canonical orientation.
+        key, symmetry = self.position_key(node)
+        to_canonical = gl.symmetry_maps(node.grid.dimension)[symmetry]
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_score, tt_bound, tt_move_index = entry
+            if tt_move_index >= 0:
+                from_canonical = gl.symmetry_maps(node.grid.dimension)[gl.INVERSE_SYMMETRY[symmetry]]
+                tt_move = node.grid.index_to_coord(from_canonical[tt_move_index])
+            if tt_depth >= depth and tt_move is not None:
+                if tt_bound == EXACT or (tt_bound == LOWER_BOUND and tt_score >= beta) or \
+                        (tt_bound == UPPER_BOUND and tt_score <= alpha):
+                    return tt_score, tt_move
 
-        for move in prune_possible_moves(node):
+        mover = node.turn
+        value = -INFINITY if maximizing_player else INFINITY
+        best_move = None
+        for i, move in enumerate(self.order_moves(node, self.generate_moves(node), tt_move, ply)):
             node.play_turn(move)
+            if i == 0:
+                child = self.alpha_beta_iter(node, depth - 1, alpha, beta, not maximizing_player, h, ply + 1)
+            else:
+                # Principal variation search: prove the move is no better than the best one with a null window and
+                # only search it properly if that fails.
+                if maximizing_player:
+                    child = self.alpha_beta_iter(node, depth - 1, alpha, alpha + NULL_WINDOW, False, h, ply + 1)
+                else:
+                    child = self.alpha_beta_iter(node, depth - 1, beta - NULL_WINDOW, beta, True, h, ply + 1)
+                if alpha < child < beta:
+                    child = self.alpha_beta_iter(node, depth - 1, alpha, beta, not maximizing_player, h, ply + 1)
+            node.backtrack_move(move)
+
             if maximizing_player:
-                value = max(value, self.alpha_beta_iter(node, depth-1, alpha, beta, False, h))
+                if child > value:
+                    value = child
+                    best_move = move
                 alpha = max(alpha, value)
             else:
-                value = min(value, self.alpha_beta_iter(node, depth-1, alpha, beta, True, h))
+                if child < value:
+                    value = child
+                    best_move = move
                 beta = min(beta, value)
-            node.backtrack_move(move)
             if alpha >= beta:
+                self.record_cutoff(node, mover, move, depth, ply)
                 break
-        return value
 
+        if value <= alpha_orig:
+            bound = UPPER_BOUND
+        elif value >= beta_orig:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, value, bound,
+                      -1 if best_move is None else to_canonical[node.grid.coord_to_index(best_move)])
+        return value, best_move
+
+    # At the root the given first move, then transposition table move, then killer moves of this ply, then the rest
+    # by history score.
+    def order_moves(self, node, moves, tt_move, ply):
+        first = []
+        if ply == 0 and self.first_move in moves:
+            first.append(self.first_move)
+        if tt_move in moves and tt_move not in first:
+            first.append(tt_move)
+        if ply < len(self.killers):
+            for killer in self.killers[ply]:
+                if killer in moves and killer not in first:
+                    first.append(killer)
+        history = self.history[node.turn]
+        dimension = node.grid.dimension
+        rest = sorted((move for move in moves if move not in first),
+                      key=lambda move: history.get(move[0] * dimension + move[1], 0), reverse=True)
+        return first + rest
 
+    def record_cutoff(self, node, mover, move, depth, ply):
+        self.cutoffs += 1
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[NUM_KILLERS:]
+        history = self.history[mover]
+        index = node.grid.coord_to_index(move)
+        history[index] = history.get(index, 0) + depth * depth
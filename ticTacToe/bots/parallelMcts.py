@@ -0,0 +1,179 @@
+"""
+Runs the Monte-Carlo Tree Search on several processes.
+
+Two modes are available:
+- "root": every worker grows its own tree from the same position and the visit/win/loss counts of the root children
+  are summed up before picking the move (root parallelism).
+- "tree": all workers grow one tree that lives in shared memory. Children are allocated and claimed under a lock,
+  statistics are updated without one, and virtual loss keeps the workers from all descending the same path (tree
+  parallelism).
+
+Every worker gets the full simulation budget, so the workers together run up to num_workers times max_sims
+simulations in the computation time.
+
+Workers rebuild the position from the move list, so nothing but plain data crosses process boundaries. The process
+pool is started on the first move and reused for the rest of the session.
+"""
+
+import atexit
+import multiprocessing as mp
+import random as rand
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import gameLogic as gl
+from bots.mcts import MCTSBot, MCTSTree
+from bots.utils.openingBook import book_move
+
+ROOT_PARALLEL = "root"
+TREE_PARALLEL = "tree"
+
+# Worker process state, set up once per process.
+_worker_bot = None
+_worker_lock = None
+_worker_trees = {}
+
+
+def _init_worker(lock):
+    global _worker_lock
+    _worker_lock = lock
+
+
+def _replay(dimension, end_condition_length, first_turn, moves):
+    game_state = gl.GameState(dimension, first_turn, end_condition_length, 1)
+    for move in moves:
+        game_state.play_turn(tuple(move))
+    return game_state
+
+
+def _seed(seed):
+    rand.seed(seed)
+    np.random.seed(seed % 2**32)
+
+
+# Grows a private tree and returns the statistics of the root children.
+def _root_search(dimension, end_condition_length, first_turn, moves, computation_time_ms, max_sims, max_nodes, c,
+                 rollout_batch_size, seed):
+    global _worker_bot
+    if _worker_bot is None or _worker_bot.tree.max_nodes != max_nodes:
+        _worker_bot = MCTSBot(max_nodes=max_nodes)
+    _worker_bot.c = c
+    _worker_bot.rollout_batch_size = rollout_batch_size
+    _seed(seed)
+    game_state = _replay(dimension, end_condition_length, first_turn, moves)
+    bot = _worker_bot
+    bot.reset_state(game_state)
+    bot.mcts(game_state, computation_time_ms, max_sims)
+    tree = bot.tree
+    if tree.first_child[0] < 0:
+        return bot.num_sims, np.zeros(0, dtype=np.int32), np.zeros(0), np.zeros(0), np.zeros(0)
+    start, end = tree.children(0)
+    return bot.num_sims, tree.move[start:end].copy(), tree.visits[start:end].copy(), \
+        tree.wins[start:end].copy(), tree.losses[start:end].copy()
+
+
+# Grows the shared tree in shm_name and returns the number of simulations run.
+def _tree_search(shm_name, max_nodes, dimension, end_condition_length, first_turn, moves,
+                 computation_time_ms, max_sims, c, rollout_batch_size, virtual_loss, seed):
+    if shm_name not in _worker_trees:
+        # one shared block per bot, attached once per worker process
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_trees[shm_name] = (shm, MCTSTree(max_nodes, buffer=shm.buf, lock=_worker_lock))
+    tree = _worker_trees[shm_name][1]
+    _seed(seed)
+    game_state = _replay(dimension, end_condition_length, first_turn, moves)
+    bot = MCTSBot(max_nodes=1, c=c, virtual_loss=virtual_loss, rollout_batch_size=rollout_batch_size)
+    bot.tree = tree
+    bot.mcts(game_state, computation_time_ms, max_sims)
+    return bot.num_sims
+
+
+class ParallelMCTSBot(MCTSBot):
+
+    def __init__(self, num_workers=mp.cpu_count(), mode=ROOT_PARALLEL, computation_time_ms=2000, max_sims=1000,
+                 max_nodes=200000, c=np.sqrt(2), virtual_loss=1, rollout_batch_size=1):
+        if mode not in (ROOT_PARALLEL, TREE_PARALLEL):
+            raise ValueError("Unknown parallel MCTS mode: {}".format(mode))
+        # c and rollout_batch_size are what the workers search with
+        super(ParallelMCTSBot, self).__init__(computation_time_ms=computation_time_ms, max_sims=max_sims,
+                                              max_nodes=1, c=c, rollout_batch_size=rollout_batch_size)
+        self.num_workers = num_workers
+        self.mode = mode
+        self.max_nodes = max_nodes
+        self.parallel_virtual_loss = virtual_loss
+        self.pool = None
+        self.shm = None
+        self.root_stats = None
+
+    def start_pool(self):
+        lock = mp.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker, initargs=(lock,))
+        if self.mode == TREE_PARALLEL:
+            self.shm = shared_memory.SharedMemory(create=True, size=MCTSTree.buffer_size(self.max_nodes))
+            self.tree = MCTSTree(self.max_nodes, buffer=self.shm.buf, lock=lock)
+            self.tree.clear()
+        atexit.register(self.close)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        if self.shm is not None:
+            self.tree = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    # The search runs in the worker processes, there is no tree in this process to ponder with.
+    def start_pondering(self, game_state):
+        pass
+
+    def get_move(self, game_state):
+        if len(game_state.grid.possible_moves) == 0:
+            raise IndexError("Bot trying to pick move from empty set of free possible moves.")
+        self.num_sims = 0
+        move = book_move(game_state) if self.use_book else None
+        self.source = "book"
+        if move is not None:
+            return move
+        self.source = "search"
+        if self.pool is None:
+            self.start_pool()
+        moves = list(game_state.moves)
+        # who made the first move, so that the workers can replay the game
+        first_turn = game_state.turn
+        if len(moves) % 2 == 1:
+            first_turn = "O" if game_state.turn == "X" else "X"
+        # every worker gets the full simulation budget, the computation time bounds the whole search
+        max_sims = self.max_sims
+        seeds = [rand.getrandbits(63) for _ in range(0, self.num_workers)]
+        args = (game_state.grid.dimension, game_state.end_condition_length, first_turn, moves)
+        if self.mode == ROOT_PARALLEL:
+            futures = [self.pool.submit(_root_search, *args, self.computation_time_ms, max_sims, self.max_nodes,
+                                        self.c, self.rollout_batch_size, seed)
+                       for seed in seeds]
+            return self.merge_root_stats(game_state, [future.result() for future in futures])
+        else:
+            self.tree.reset()
+            futures = [self.pool.submit(_tree_search, self.shm.name, self.max_nodes, *args, self.computation_time_ms,
+                                        max_sims, self.c, self.rollout_batch_size, self.parallel_virtual_loss, seed)
+                       for seed in seeds]
+            self.num_sims = sum(future.result() for future in futures)
+            return self.best_child(game_state)
+
+    # Sums up the root children statistics of all workers and picks the most visited move.
+    def merge_root_stats(self, game_state, results):
+        num_cells = game_state.grid.num_cells
+        visits, wins, losses = np.zeros(num_cells), np.zeros(num_cells), np.zeros(num_cells)
+        self.num_sims = 0
+        for num_sims, moves, child_visits, child_wins, child_losses in results:
+            self.num_sims += num_sims
+            np.add.at(visits, moves, child_visits)
+            np.add.at(wins, moves, child_wins)
+            np.add.at(losses, moves, child_losses)
+        self.root_stats = visits, wins, losses
+        if visits.max() == 0:
+            return rand.choice(list(game_state.grid.possible_moves))
+        return game_state.grid.index_to_coord(int(np.argmax(visits)))
@@ -0,0 +1,309 @@
+"""
+Depth-first proof-number search (df-pn) for solving positions.
+
+A search proves or disproves "attacker wins" from a position: OR nodes are the attacker's turns (one winning move is
+enough), AND nodes the defender's (every reply has to lose). Draws disprove the attacker's win, so a position is
+solved with up to two searches: the side to move wins, the opponent wins, or neither (draw).
+
+Proof and disproof numbers of searched positions live in a fixed size table (NumPy arrays indexed by zobrist key,
+like the alpha-beta transposition table), so memory stays bounded and solved subtrees survive between moves. A
+side that can complete a line wins at once, and a side facing a single completing square of the opponent only has
+the block to consider; both are exact and cut most of the width of the tree. Once every line holds a defender mark
+the attacker's win is disproven, and rotations/reflections of a position share one table entry.
+
+From the project directory, solve the empty 4x4 board with 4 to win (a draw, about 50000 nodes):
+python -m bots.pns -d 4 --score 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import gameLogic as gl
+
+INFINITY = 2**40
+# Bound types of a solved position.
+WIN = "win"
+LOSS = "loss"
+DRAW = "draw"
+# xor-ed into the keys of searches where O attacks, so that both attackers can share one table
+ATTACKER_O = 0x5851F42D4C957F2D
+# key (8) + proof number (8) + disproof number (8)
+ENTRY_BYTES = 24
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class ProofNumberTable:
+
+    def __init__(self, size_mb=64):
+        self.num_entries = max(1, int(size_mb * 2**20) // ENTRY_BYTES)
+        self.keys = np.zeros(self.num_entries, dtype=np.uint64)
+        self.proof = np.zeros(self.num_entries, dtype=np.int64)  # 0 in both numbers = empty slot
+        self.disproof = np.zeros(self.num_entries, dtype=np.int64)
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        self.proof.fill(0)
+        self.disproof.fill(0)
+        self.stores = 0
+        self.overwrites = 0
+
+    # Returns (proof number, disproof number) stored for key or None.
+    def probe(self, key):
+        i = key % self.num_entries
+        if self.keys[i] == key and (self.proof[i] or self.disproof[i]):
+            return int(self.proof[i]), int(self.disproof[i])
+        return None
+
+    # Solved positions are only replaced by other solved positions.
+    def store(self, key, proof, disproof):
+        i = key % self.num_entries
+        stored_proof, stored_disproof = self.proof[i], self.disproof[i]
+        if stored_proof or stored_disproof:
+            if self.keys[i] != key:
+                if (stored_proof == 0 or stored_disproof == 0) and proof != 0 and disproof != 0:
+                    return
+                self.overwrites += 1
+        self.keys[i] = key
+        self.proof[i] = proof
+        self.disproof[i] = disproof
+        self.stores += 1
+
+
+class ProofNumberSearch:
+
+    def __init__(self, size_mb=64, max_nodes=None, computation_time_ms=None):
+        self.table = ProofNumberTable(size_mb)
+        self.max_nodes = max_nodes
+        self.computation_time_ms = computation_time_ms
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.deadline = None
+        self.attacker = None
+
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    # Table key of the position, shared by its rotations/reflections.
+    def key(self, game_state):
+        key = game_state.canonical_key()[0]
+        return key ^ ATTACKER_O if self.attacker == "O" else key
+
+    # Time at which a search started now runs out of budget, or None without a time budget.
+    def new_deadline(self):
+        return None if self.computation_time_ms is None else time.time() + self.computation_time_ms / 1000
+
+    # (proof, disproof) numbers of "attacker wins" from game_state, searched until one of them is 0 or the budget
+    # runs out (BudgetExceeded, the position is restored). The time budget starts now unless deadline is given.
+    def prove(self, game_state, attacker, deadline=None):
+        self.attacker = attacker
+        self.nodes = 0
+        start_time = time.time()
+        self.deadline = self.new_deadline() if deadline is None else deadline
+        root_moves = len(game_state.moves)
+        try:
+            proof, disproof = self.mid(game_state, INFINITY, INFINITY)
+        except BudgetExceeded:
+            while len(game_state.moves) > root_moves:
+                game_state.backtrack_move(game_state.moves[-1])
+            raise
+        finally:
+            self.elapsed = time.time() - start_time
+        return proof, disproof
+
+    # WIN, LOSS or DRAW for the side to move, or None if the budget ran out. Both searches share one time budget.
+    def solve(self, game_state):
+        mover = game_state.turn
+        opponent = "O" if mover == "X" else "X"
+        deadline = self.new_deadline()
+        nodes, elapsed = 0, 0.0
+        try:
+            proof, _ = self.prove(game_state, mover, deadline)
+            nodes, elapsed = self.nodes, self.elapsed
+            if proof == 0:
+                return WIN
+            proof, _ = self.prove(game_state, opponent, deadline)
+            nodes, elapsed = nodes + self.nodes, elapsed + self.elapsed
+            return LOSS if proof == 0 else DRAW
+        except BudgetExceeded:
+            nodes, elapsed = nodes + self.nodes, elapsed + self.elapsed
+            return None
+        finally:
+            self.nodes, self.elapsed = nodes, elapsed
+
+    # Proof/disproof numbers of a position that are known without searching it, or None.
+    def evaluate(self, game_state):
+        if not game_state.game_running:
+            if game_state.winner == self.attacker:
+                return 0, INFINITY
+            return INFINITY, 0
+        grid = game_state.grid
+        k = game_state.end_condition_length
+        mover = game_state.turn
+        if k >= 2:
+            if grid.completing_cells(mover, k):
+                return (0, INFINITY) if mover == self.attacker else (INFINITY, 0)
+            if len(grid.completing_cells("O" if mover == "X" else "X", k)) >= 2:
+                return (INFINITY, 0) if mover == self.attacker else (0, INFINITY)
+        # every line holds a defender mark: the attacker can no longer win
+        _, x_counts, o_counts = grid.line_counts[k] if k in grid.line_counts else grid.track_lines(k)
+        defender_counts = o_counts if self.attacker == "X" else x_counts
+        if 0 not in defender_counts:
+            return INFINITY, 0
+        return None
+
+    # Moves worth searching: a winning move if there is one, the block if the opponent threatens to complete a line,
+    # otherwise every free square.
+    @staticmethod
+    def moves(game_state):
+        grid = game_state.grid
+        k = game_state.end_condition_length
+        if k >= 2:
+            for mark in (game_state.turn, "O" if game_state.turn == "X" else "X"):
+                cells = grid.completing_cells(mark, k)
+                if cells:
+                    return [grid.index_to_coord(index) for index in cells]
+        return sorted(grid.possible_moves)
+
+    # Proof/disproof numbers of the child after move (the move is played and taken back).
+    def child_numbers(self, game_state, move):
+        game_state.play_turn(move)
+        numbers = self.evaluate(game_state)
+        if numbers is None:
+            numbers = self.table.probe(self.key(game_state)) or (1, 1)
+        game_state.backtrack_move(move)
+        return numbers
+
+    # Multiple iterative deepening: searches game_state until its numbers reach the thresholds.
+    def mid(self, game_state, proof_threshold, disproof_threshold):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExceeded()
+        if self.deadline is not None and self.nodes % 256 == 0 and time.time() > self.deadline:
+            raise BudgetExceeded()
+        key = self.key(game_state)
+        numbers = self.evaluate(game_state)
+        if numbers is not None:
+            self.table.store(key, *numbers)
+            return numbers
+        or_node = game_state.turn == self.attacker
+        moves = self.moves(game_state)
+        children = [self.child_numbers(game_state, move) for move in moves]
+        while True:
+            if or_node:
+                proof = min(child[0] for child in children)
+                disproof = min(INFINITY, sum(child[1] for child in children))
+            else:
+                proof = min(INFINITY, sum(child[0] for child in children))
+                disproof = min(child[1] for child in children)
+            if proof >= proof_threshold or disproof >= disproof_threshold:
+                break
+            # most promising child (smallest proof number at OR nodes, disproof number at AND nodes) and the
+            # second smallest, which bounds how long the child may be searched before switching
+            index = 0 if or_node else 1
+            order = sorted(range(0, len(children)), key=lambda i: children[i][index])
+            best = order[0]
+            second = children[order[1]][index] if len(order) > 1 else INFINITY
+            child_proof, child_disproof = children[best]
+            if or_node:
+                child_thresholds = (min(proof_threshold, second + 1), disproof_threshold - disproof + child_disproof)
+            else:
+                child_thresholds = (proof_threshold - proof + child_proof, min(disproof_threshold, second + 1))
+            game_state.play_turn(moves[best])
+            children[best] = self.mid(game_state, *child_thresholds)
+            game_state.backtrack_move(moves[best])
+        self.table.store(key, proof, disproof)
+        return proof, disproof
+
+    # Move from a proven OR node that keeps the proof, or None.
+    def proof_move(self, game_state):
+        for move in self.moves(game_state):
+            if self.child_numbers(game_state, move)[0] == 0:
+                return move
+        return None
+
+    # Number of positions in the proof tree of a proven position (attacker to move or not). Positions whose
+    # entry was replaced in the table count as leaves.
+    def proof_tree_size(self, game_state):
+        if self.evaluate(game_state) is not None:
+            return 1
+        if game_state.turn == self.attacker:
+            moves = [self.proof_move(game_state)]
+            if moves[0] is None:
+                return 1
+        else:
+            moves = self.moves(game_state)
+        size = 1
+        for move in moves:
+            game_state.play_turn(move)
+            size += self.proof_tree_size(game_state)
+            game_state.backtrack_move(move)
+        return size
+
+
+class PNSBot(gl.Player):
+
+    def __init__(self, computation_time_ms=2000, max_nodes=None, size_mb=64):
+        super(PNSBot, self).__init__()
+        self.search = ProofNumberSearch(size_mb=size_mb, max_nodes=max_nodes, computation_time_ms=computation_time_ms)
+        self.result = None
+
+    # Plays the proof move of a proven win, a move that keeps the draw, or the most promising move if the search
+    # did not finish (or the proof no longer is in the table).
+    def get_move(self, game_state):
+        if len(game_state.grid.possible_moves) == 0:
+            raise IndexError("Bot trying to pick move from empty set of free possible moves.")
+        search = self.search
+        mover = game_state.turn
+        self.result = search.solve(game_state)
+        if self.result == WIN:
+            search.attacker = mover
+            move = search.proof_move(game_state)
+            if move is not None:
+                return move
+        # search.attacker is the opponent now (unless the first search ran out of budget)
+        moves = search.moves(game_state)
+        if search.attacker != mover:
+            numbers = [search.child_numbers(game_state, move) for move in moves]
+            # the opponent's win is disproven after a drawing move, and hardest to prove after the best losing one
+            return moves[max(range(0, len(moves)), key=lambda i: (numbers[i][1] == 0, numbers[i][0]))]
+        numbers = [search.child_numbers(game_state, move) for move in moves]
+        return moves[min(range(0, len(moves)), key=lambda i: numbers[i][0])]
+
+    # A proven win is worth 1 and its proof move is played, other results say nothing about the position's value.
+    def search_policy(self, game_state):
+        move = self.search.proof_move(game_state) if self.result == WIN else None
+        if move is None:
+            return None
+        policy = np.zeros(game_state.grid.num_cells)
+        policy[game_state.grid.coord_to_index(move)] = 1.0
+        return 1.0, policy
+
+    def search_stats(self):
+        return {"result": self.result,
+                "nodes": self.search.nodes,
+                "nodes_per_second": round(self.search.nodes_per_second(), 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solves a Tic Tac Toe position with proof-number search.")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=5, help="Board dimension.")
+    parser.add_argument("--score", metavar="s", type=int, default=4, help="How many marks straight are needed for win.")
+    parser.add_argument("--moves", metavar="r,c", type=str, nargs="*", default=[], help="Moves played before, X first.")
+    parser.add_argument("--size_mb", metavar="mb", type=int, default=256, help="Proof-number table size.")
+    args = parser.parse_args()
+
+    position = gl.GameState(args.dim, "X", args.score, 1)
+    for played in args.moves:
+        position.play_turn(tuple(int(x) for x in played.split(",")))
+    pns = ProofNumberSearch(size_mb=args.size_mb)
+    result = pns.solve(position)
+    print("{} for {} to move: {} nodes in {:.1f} s ({:.0f} nodes/s)".format(result, position.turn, pns.nodes,
+                                                                         pns.elapsed, pns.nodes_per_second()))
+    if result in (WIN, LOSS):
+        print("Proof tree size: {}".format(pns.proof_tree_size(position)))
@@ -0,0 +1,183 @@
+"""
+Solves small boards completely and plays them perfectly from a table on disk.
+
+Positions are seen from the side to move: each cell holds 0 (free), 1 (mover) or 2 (opponent), and the position
+index is the base-3 number sum(cell * 3**i). Every index whose stone counts can occur in a game (the opponent has as
+many stones as the mover or one more) is solved backwards from the full board, one layer of stone count at a time,
+with NumPy. The table stores one byte per index: the game-theoretic value in the top two bits and the best move
+(cell index, quickest win / slowest loss) in the low six bits.
+
+The table is memory-mapped when a bot first asks for it, so looking a move up costs nothing but the index
+computation. Boards up to 4x4 fit (3**16 bytes = 43 MB). From the project directory, solve 4x4 with 3 to win:
+python -m bots.solver -d 4 --score 3
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from bots.utils.batchRollout import line_cells
+
+# Values stored in the top two bits of a table entry (0 = position not in the table).
+LOSS = 1
+DRAW = 2
+WIN = 3
+MOVE_BITS = 6
+MAX_CELLS = 16
+
+MAGIC = b"TTTS"
+HEADER_BYTES = 8  # magic, dimension, end condition length, 2 bytes padding
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables")
+
+# Scores while solving: win/loss in d plies = +-(PLY_SCORE - d), draw 0.
+PLY_SCORE = 64
+UNSOLVED = -128
+# Positions solved at a time, bounds the (positions, lines, k) temporaries.
+CHUNK = 1 << 17
+
+# (dimension, end_condition_length) -> memory-mapped table, None if there is no table file.
+_tables = {}
+
+
+def table_path(dimension, end_condition_length):
+    return os.path.join(TABLE_DIR, "solved_{}_{}.bin".format(dimension, end_condition_length))
+
+
+# Stone counts (mover, opponent) of every position index, computed from the two halves of the index.
+def _stone_counts(num_cells):
+    low_cells = num_cells // 2
+    counts = []
+    for cells in (low_cells, num_cells - low_cells):
+        digits = (np.arange(3**cells)[:, None] // 3**np.arange(cells)[None, :]) % 3
+        counts.append((np.count_nonzero(digits == 1, axis=1).astype(np.int8),
+                       np.count_nonzero(digits == 2, axis=1).astype(np.int8)))
+    (mover_low, opponent_low), (mover_high, opponent_high) = counts
+    mover = (mover_high[:, None] + mover_low[None, :]).ravel()
+    opponent = (opponent_high[:, None] + opponent_low[None, :]).ravel()
+    return mover, opponent
+
+
+# Solves one (dimension, end_condition_length) configuration and returns the table as a uint8 array.
+def solve(dimension, end_condition_length, verbose=False):
+    num_cells = dimension**2
+    if num_cells > MAX_CELLS:
+        raise ValueError("Board too big to solve: {}x{}".format(dimension, dimension))
+    powers = 3**np.arange(num_cells, dtype=np.int64)
+    lines = line_cells(dimension, end_condition_length)
+    scores = np.full(3**num_cells, UNSOLVED, dtype=np.int8)
+    moves = np.zeros(3**num_cells, dtype=np.uint8)
+    mover_counts, opponent_counts = _stone_counts(num_cells)
+    difference = opponent_counts - mover_counts
+    legal = (difference == 0) | (difference == 1)
+    stones = mover_counts + opponent_counts
+    del mover_counts, opponent_counts, difference
+
+    for layer in range(num_cells, -1, -1):
+        start_time = time.time()
+        layer_indexes = np.flatnonzero(legal & (stones == layer))
+        for chunk_start in range(0, len(layer_indexes), CHUNK):
+            indexes = layer_indexes[chunk_start:chunk_start + CHUNK]
+            cells = ((indexes[:, None] // powers[None, :]) % 3).astype(np.int8)
+            line_marks = cells[:, lines]
+            lost = np.all(line_marks == 2, axis=2).any(axis=1)
+            # the mover completed a line on the previous turn: the game is already over, not a position
+            impossible = np.all(line_marks == 1, axis=2).any(axis=1)
+            del line_marks
+            position_scores = np.zeros(len(indexes), dtype=np.int8)
+            position_moves = np.zeros(len(indexes), dtype=np.uint8)
+            position_scores[lost] = -PLY_SCORE
+            playing = ~lost & ~impossible & (layer < num_cells)
+            if playing.any():
+                playing_cells = cells[playing]
+                # the child seen from the other side: colours swap and the new stone is the opponent's
+                swapped = (np.where(playing_cells == 0, 0, 3 - playing_cells) * powers[None, :]).sum(axis=1)
+                children = swapped[:, None] + 2 * powers[None, :]
+                child_scores = scores[np.where(playing_cells == 0, children, 0)].astype(np.int16)
+                # one ply further from the end, seen from this side
+                candidate = -child_scores + np.sign(child_scores)
+                candidate[playing_cells != 0] = UNSOLVED
+                best = candidate.argmax(axis=1)
+                position_scores[playing] = candidate[np.arange(len(best)), best]
+                position_moves[playing] = best
+            position_scores[impossible] = UNSOLVED
+            scores[indexes] = position_scores
+            moves[indexes] = position_moves
+        if verbose:
+            print("Layer {:2d}: {} positions in {:.1f} s".format(layer, len(layer_indexes), time.time() - start_time))
+
+    values = np.where(scores > 0, WIN, np.where(scores < 0, LOSS, DRAW)).astype(np.uint8)
+    values[scores == UNSOLVED] = 0
+    return (values << MOVE_BITS) | moves
+
+
+def write_table(table, dimension, end_condition_length, path=None):
+    path = table_path(dimension, end_condition_length) if path is None else path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(MAGIC + bytes((dimension, end_condition_length, 0, 0)))
+        f.write(table.tobytes())
+    _tables.pop((dimension, end_condition_length), None)
+    return path
+
+
+# Memory-maps the table of the configuration, or returns None if it has not been solved.
+def load_table(dimension, end_condition_length):
+    key = (dimension, end_condition_length)
+    if key not in _tables:
+        path = table_path(dimension, end_condition_length)
+        table = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                header = f.read(HEADER_BYTES)
+            if header[:4] != MAGIC or tuple(header[4:6]) != key:
+                raise ValueError("Not a solved table of {}x{} with {} to win: {}".format(dimension, dimension,
+                                                                                         end_condition_length, path))
+            table = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_BYTES)
+        _tables[key] = table
+    return _tables[key]
+
+
+def position_index(game_state):
+    grid = game_state.grid
+    mover, opponent = grid.bits(game_state.turn), grid.occupied() & ~grid.bits(game_state.turn)
+    index = 0
+    power = 1
+    for cell in range(0, grid.num_cells):
+        index += power * ((mover >> cell & 1) + 2 * (opponent >> cell & 1))
+        power *= 3
+    return index
+
+
+# Returns (value, move) of the position from the solved table, or None if the configuration is not solved.
+def lookup(game_state):
+    grid = game_state.grid
+    if grid.num_cells > MAX_CELLS or not game_state.game_running:
+        return None
+    table = load_table(grid.dimension, game_state.end_condition_length)
+    if table is None:
+        return None
+    entry = int(table[position_index(game_state)])
+    if entry >> MOVE_BITS == 0:
+        return None
+    return entry >> MOVE_BITS, grid.index_to_coord(entry & ((1 << MOVE_BITS) - 1))
+
+
+# Perfect move of the position, or None if the configuration is not solved.
+def solved_move(game_state):
+    result = lookup(game_state)
+    return None if result is None else result[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solves a small Tic Tac Toe board and writes its table.")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=3, help="Solve a N by N game board.")
+    parser.add_argument("--score", metavar="s", type=int, default=3, help="How many marks straight are needed for win.")
+    parser.add_argument("--output", metavar="path", type=str, default=None, help="Table file (default: bots/tables).")
+    args = parser.parse_args()
+
+    solve_start = time.time()
+    solved = solve(args.dim, args.score, verbose=True)
+    print("Solved in {:.1f} s, wrote {}".format(time.time() - solve_start,
+                                                 write_table(solved, args.dim, args.score, args.output)))
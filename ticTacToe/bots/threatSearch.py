@@ -0,0 +1,201 @@
+"""
+Threat-space search for gomoku-style boards (end_condition_length >= 4).
+
+Only forcing moves are searched, built on the grid's line counts: a "four" is a move after which the attacker
+completes a line with the next move (a line with end_condition_length - 1 attacker marks and no defender marks), and
+a "three" is a move onto a line that then holds end_condition_length - 2 attacker marks and no defender marks.
+
+- Victory by continuous four (VCF): the attacker plays fours only, so every defender reply is forced (block the
+  completing square). The search is exact: it finds a forced win or proves there is none.
+- Victory by continuous threat (VCT): the attacker may also play threes that would be followed by a VCF if the
+  defender ignored them. The defender's replies are limited to the squares of the attacker's threat lines and the
+  defender's own fours, so a VCT is a strong hint rather than a proof.
+
+Both searches stop after node_budget placed marks; exhausted then tells that "no win found" is not a proof.
+"""
+
+import gameLogic as gl
+
+# Three moves tried per VCT node (after all four moves), most promising first.
+MAX_VCT_CANDIDATES = 12
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class ThreatSearch:
+
+    def __init__(self, node_budget=20000, vct_depth=3):
+        self.node_budget = node_budget
+        # Attacker threat moves (fours or threes) in a VCT line before giving up.
+        self.vct_depth = vct_depth
+        self.nodes = 0
+        self.exhausted = False
+        self.vcf_failures = set()
+        self.vct_failures = {}
+        # marks placed by the search, taken back if the budget runs out mid-line
+        self.placed = []
+
+    # Winning sequence (attacker's and forced defender's moves) by continuous fours for the side to move, or None.
+    def vcf(self, game_state):
+        return self.search(game_state, lambda attacker: self.vcf_iter(game_state.grid, attacker,
+                                                                      game_state.end_condition_length))
+
+    # Win by continuous threats for the side to move, starting with the move to play, or None.
+    def vct(self, game_state):
+        return self.search(game_state, lambda attacker: self.vct_iter(game_state.grid, attacker,
+                                                                      game_state.end_condition_length,
+                                                                      self.vct_depth))
+
+    def search(self, game_state, search_iter):
+        self.nodes = 0
+        self.exhausted = False
+        self.vcf_failures = set()
+        self.vct_failures = {}
+        if not game_state.game_running or game_state.end_condition_length < 4:
+            return None
+        try:
+            return search_iter(game_state.turn)
+        except BudgetExceeded:
+            self.exhausted = True
+            while self.placed:
+                self.remove(game_state.grid, self.placed[-1])
+            return None
+
+    def place(self, grid, coord, mark):
+        self.nodes += 1
+        if self.nodes > self.node_budget:
+            raise BudgetExceeded()
+        grid.place_mark(coord, mark)
+        self.placed.append(coord)
+
+    def remove(self, grid, coord):
+        grid.remove_mark(coord)
+        self.placed.pop()
+
+    # VCF for attacker to move, returns the winning sequence or None.
+    def vcf_iter(self, grid, attacker, end_condition_length):
+        defender = "O" if attacker == "X" else "X"
+        wins = grid.completing_cells(attacker, end_condition_length)
+        if wins:
+            return [grid.index_to_coord(next(iter(wins)))]
+        key = grid.zobrist_key
+        if key in self.vcf_failures:
+            return None
+        must_block = grid.completing_cells(defender, end_condition_length)
+        if len(must_block) < 2:
+            for move in four_moves(grid, attacker, end_condition_length):
+                if must_block and grid.coord_to_index(move) not in must_block:
+                    continue
+                self.place(grid, move, attacker)
+                line = None
+                if not grid.completing_cells(defender, end_condition_length):
+                    threats = grid.completing_cells(attacker, end_condition_length)
+                    if len(threats) >= 2:
+                        line = [move, grid.index_to_coord(next(iter(threats)))]
+                    else:
+                        reply = grid.index_to_coord(next(iter(threats)))
+                        self.place(grid, reply, defender)
+                        rest = self.vcf_iter(grid, attacker, end_condition_length)
+                        self.remove(grid, reply)
+                        if rest is not None:
+                            line = [move, reply] + rest
+                self.remove(grid, move)
+                if line is not None:
+                    return line
+        self.vcf_failures.add(key)
+        return None
+
+    # VCT for attacker to move with depth threat moves left, returns moves starting with the one to play or None.
+    def vct_iter(self, grid, attacker, end_condition_length, depth):
+        defender = "O" if attacker == "X" else "X"
+        line = self.vcf_iter(grid, attacker, end_condition_length)
+        if line is not None:
+            return line
+        key = grid.zobrist_key
+        if depth == 0 or self.vct_failures.get(key, -1) >= depth:
+            return None
+        must_block = grid.completing_cells(defender, end_condition_length)
+        if len(must_block) < 2:
+            if must_block:
+                # answer the defender's four, the threats already on the board may still win
+                candidates = [grid.index_to_coord(next(iter(must_block)))]
+            else:
+                candidates = four_moves(grid, attacker, end_condition_length)
+                candidates += [move for move in three_moves(grid, attacker, end_condition_length)[:MAX_VCT_CANDIDATES]
+                               if move not in candidates]
+            for move in candidates:
+                self.place(grid, move, attacker)
+                won = False
+                if not grid.completing_cells(defender, end_condition_length):
+                    replies = self.defences(grid, attacker, end_condition_length)
+                    if replies is not None:
+                        won = True
+                        for reply in replies:
+                            self.place(grid, reply, defender)
+                            refuted = self.vct_iter(grid, attacker, end_condition_length, depth - 1) is None
+                            self.remove(grid, reply)
+                            if refuted:
+                                won = False
+                                break
+                self.remove(grid, move)
+                if won:
+                    return [move]
+        self.vct_failures[key] = depth
+        return None
+
+    # Defender replies to consider after an attacker threat move, or None if the move threatens nothing.
+    def defences(self, grid, attacker, end_condition_length):
+        defender = "O" if attacker == "X" else "X"
+        threats = grid.completing_cells(attacker, end_condition_length)
+        if threats:
+            return [grid.index_to_coord(index) for index in threats]
+        # a three: it has to be followed by a VCF if the defender does nothing
+        if self.vcf_iter(grid, attacker, end_condition_length) is None:
+            return None
+        replies = set(grid.mask_to_coords(threat_line_cells(grid, attacker, end_condition_length)))
+        replies.update(four_moves(grid, defender, end_condition_length))
+        return sorted(replies)
+
+
+# Free squares of the lines holding end_condition_length - 2 or more attacker marks and no defender marks.
+def threat_line_cells(grid, attacker, end_condition_length):
+    _, x_counts, o_counts = grid.line_counts[end_condition_length]
+    own, other = (x_counts, o_counts) if attacker == "X" else (o_counts, x_counts)
+    masks = gl.line_index(grid.dimension, end_condition_length).masks
+    cells = 0
+    for line in range(0, len(masks)):
+        if own[line] >= end_condition_length - 2 and other[line] == 0:
+            cells |= masks[line]
+    return cells & ~grid.occupied()
+
+
+# Free squares on lines with needed attacker marks and no defender marks, most lines first.
+def line_moves(grid, attacker, end_condition_length, needed):
+    if end_condition_length not in grid.line_counts:
+        grid.track_lines(end_condition_length)
+    _, x_counts, o_counts = grid.line_counts[end_condition_length]
+    own, other = (x_counts, o_counts) if attacker == "X" else (o_counts, x_counts)
+    masks = gl.line_index(grid.dimension, end_condition_length).masks
+    free = grid.free_bits()
+    lines_per_cell = {}
+    for line in range(0, len(masks)):
+        if own[line] == needed and other[line] == 0:
+            cells = masks[line] & free
+            while cells:
+                low = cells & -cells
+                index = low.bit_length() - 1
+                lines_per_cell[index] = lines_per_cell.get(index, 0) + 1
+                cells ^= low
+    return [grid.index_to_coord(index) for index in sorted(lines_per_cell, key=lines_per_cell.get, reverse=True)]
+
+
+# Moves that make a four (a line one mark short of end_condition_length).
+def four_moves(grid, attacker, end_condition_length):
+    return line_moves(grid, attacker, end_condition_length, end_condition_length - 2)
+
+
+# Moves that make a three (a line two marks short of end_condition_length).
+def three_moves(grid, attacker, end_condition_length):
+    return line_moves(grid, attacker, end_condition_length, end_condition_length - 3)
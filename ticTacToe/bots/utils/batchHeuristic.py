@@ -0,0 +1,165 @@
+"""
+Scores many positions at once with NumPy, the same way as minimaxUtils.heuristic_with_features.
+
+The boards are stacked into one (B, N, N) array (1 = X, 2 = O, 0 = free, as in batchRollout). For every line length
+the heuristic looks at, the sums over all windows of that many cells in one direction are length shifted slices of
+the boards added up, like a convolution with a line shaped kernel. The X and O marks are weighted so that one sum tells
+both whether a window holds length - 1 X marks and no O and whether it holds length - 1 O marks and no X, and such
+windows mark their single free square as a completing square. Counting the distinct completing squares per board gives
+the same counts as Grid.completing_cells, and the scoring rules of winning_features are applied to the whole batch
+with np.where.
+"""
+
+import numpy as np
+
+from bots.utils.minimaxUtils import MAX_REWARD
+from gameLogic import neighbourhood_shifts
+
+X, O = 1, 2
+# (dr, dc) of the four line directions
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+_shift_cache = {}
+
+
+# neighbourhood_shifts with the masks as boolean arrays over the cells.
+def cell_shifts(dimension, stride):
+    key = (dimension, stride)
+    if key not in _shift_cache:
+        _shift_cache[key] = [(shift, np.array([mask >> cell & 1 for cell in range(0, dimension**2)], dtype=bool))
+                             for shift, mask in neighbourhood_shifts(dimension, stride)]
+    return _shift_cache[key]
+
+
+# Slices of cell j of the windows of length cells in direction (dr, dc), over the window start squares.
+def window_cell(n, length, direction, j):
+    dr, dc = direction
+    rows = n - (length - 1) * dr
+    cols = n - (length - 1) * abs(dc)
+    # right-left diagonals start from the right end
+    col = (length - 1 if dc < 0 else 0) + j * dc
+    return slice(None), slice(j * dr, j * dr + rows), slice(col, col + cols)
+
+
+# Sum of cells over each window of length cells in direction, shape (B, rows, cols), or None if there are none.
+def window_sums(cells, length, direction):
+    n = cells.shape[1]
+    if length > n:
+        return None
+    sums = cells[window_cell(n, length, direction, 0)].copy()
+    for j in range(1, length):
+        sums += cells[window_cell(n, length, direction, j)]
+    return sums
+
+
+# (B, N, N) masks of the free squares that complete a line of length (>= 2) cells, bit 1 for X and bit 2 for O. cells
+# holds 1 for an X and weight (> length - 1) for an O, so a window sums to length - 1 exactly when it holds length - 1
+# X marks and no O, and to weight * (length - 1) when it holds length - 1 O marks and no X. free is 3 on free squares.
+def completing_squares(cells, free, length, weight):
+    batch, n, _ = cells.shape
+    squares = np.zeros((batch, n, n), dtype=np.uint8)
+    for direction in DIRECTIONS:
+        sums = window_sums(cells, length, direction)
+        if sums is None:
+            continue
+        lines = (sums == length - 1).view(np.uint8) | ((sums == weight * (length - 1)).view(np.uint8) << 1)
+        # the one free square of such a window is the completing one
+        for j in range(0, length):
+            square = window_cell(n, length, direction, j)
+            squares[square] |= lines & free[square]
+    return squares
+
+
+# Number of free squares closer than stride to some mark (just the centre on an empty board), per board.
+def candidate_moves(boards, stride=3):
+    batch, n, _ = boards.shape
+    taken = (boards != 0).reshape((batch, n * n))
+    near = np.zeros_like(taken)
+    for shift, cols in cell_shifts(n, stride):
+        if shift >= 0:
+            near[:, shift:] |= taken[:, :n * n - shift] & cols[shift:]
+        else:
+            near[:, :shift] |= taken[:, -shift:] & cols[:shift]
+    counts = np.count_nonzero(near & ~taken, axis=1)
+    return np.where(taken.any(axis=1), counts, 1)
+
+
+# Completing square counts of both players for lines of length cells, as in minimaxUtils.count_completing_moves.
+def completing_counts(boards, cells, free, length, weight):
+    if length >= 2:
+        squares = completing_squares(cells, free, length, weight)
+        return np.count_nonzero(squares & X, axis=(1, 2)), np.count_nonzero(squares & O, axis=(1, 2))
+    elif length == 1:
+        counts = candidate_moves(boards)
+        return counts, counts
+    zeros = np.zeros(len(boards), dtype=np.int64)
+    return zeros, zeros
+
+
+# Winner of each board (X, O or 0).
+def winners(cells, end_condition_length, weight):
+    result = np.zeros(len(cells), dtype=np.int8)
+    for direction in DIRECTIONS:
+        sums = window_sums(cells, end_condition_length, direction)
+        if sums is not None:
+            result[(sums == end_condition_length).any(axis=(1, 2))] = X
+            result[(sums == weight * end_condition_length).any(axis=(1, 2))] = O
+    return result
+
+
+# heuristic_with_features of every board, from X's point of view. to_move holds the side to move of each board (X or
+# O), by default X when both have as many marks and O otherwise (X moved first).
+def batch_heuristic(boards, end_condition_length, to_move=None):
+    boards = np.ascontiguousarray(boards, dtype=np.int8)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    if to_move is None:
+        marks = np.count_nonzero(boards == X, axis=(1, 2)) - np.count_nonzero(boards == O, axis=(1, 2))
+        to_move = np.where(marks == 0, X, O)
+    x_turn = np.asarray(to_move) == X
+    k = end_condition_length
+    weight = k + 1
+    cells = np.where(boards == O, weight, boards == X).astype(np.int8 if weight * k < 2**7 else np.int32)
+    free = np.where(boards == 0, X | O, 0).astype(np.uint8)
+    x_win, o_win = completing_counts(boards, cells, free, k, weight)
+    x_near_win, o_near_win = completing_counts(boards, cells, free, k - 1, weight)
+    x_improving, o_improving = completing_counts(boards, cells, free, k - 2, weight)
+
+    x_bonus = np.where(x_win > 1, 0.01, 0)
+    o_bonus = np.where(o_win > 1, 0.01, 0)
+    # x_turn: X wins next move, O threatens; otherwise O wins next move, X threatens
+    win_score = np.where(x_turn,
+                         np.where(x_win > 0, MAX_REWARD * 0.9 + x_bonus, -(MAX_REWARD * 0.8 + o_bonus)),
+                         np.where(o_win > 0, -(MAX_REWARD * 0.9 + o_bonus), MAX_REWARD * 0.8 + x_bonus))
+
+    x_score = x_near_win * MAX_REWARD * 0.025
+    o_score = o_near_win * MAX_REWARD * 0.025
+    near_score = np.where(x_turn, np.minimum(4 * x_score, MAX_REWARD * 0.7) - o_score,
+                          x_score - np.minimum(4 * o_score, MAX_REWARD * 0.7))
+
+    x_score = x_improving * MAX_REWARD * 0.001
+    o_score = o_improving * MAX_REWARD * 0.001
+    other_score = np.where(x_turn, np.minimum(2 * x_score, MAX_REWARD * 0.1) - o_score,
+                           x_score - np.minimum(2 * o_score, MAX_REWARD * 0.1))
+
+    scores = np.where((x_win > 0) | (o_win > 0), win_score,
+                      np.where((x_near_win > 0) | (o_near_win > 0), near_score, other_score))
+    # terminal positions
+    winner = winners(cells, k, weight)
+    full = np.all(boards != 0, axis=(1, 2))
+    scores = np.where(full, 0.0, scores)
+    scores = np.where(winner == X, MAX_REWARD, np.where(winner == O, -MAX_REWARD, scores))
+    return scores.astype(np.float64)
+
+
+# (B, N, N) boards and side to move of game states of one board size.
+def stack_game_states(game_states):
+    dimension = game_states[0].grid.dimension
+    boards = np.zeros((len(game_states), dimension * dimension), dtype=np.int8)
+    to_move = np.empty(len(game_states), dtype=np.int8)
+    for i, game_state in enumerate(game_states):
+        grid = game_state.grid
+        boards[i, grid.mask_to_indexes(grid.x_bits)] = X
+        boards[i, grid.mask_to_indexes(grid.o_bits)] = O
+        to_move[i] = X if game_state.turn == "X" else O
+    return boards.reshape((-1, dimension, dimension)), to_move
@@ -0,0 +1,64 @@
+"""
+Plays many random playouts from one position at once with NumPy.
+
+A random playout is a random order in which the free squares get filled, the side to move taking the even plies.
+For a whole batch of orders the board is filled in one go, and the winner of each playout is the owner of the
+single-coloured line that was completed first (at the smallest ply); no single-coloured line means a draw. This
+gives exactly the result of playing the moves one by one and stopping at the first win.
+"""
+
+import numpy as np
+
+_line_cache = {}
+
+
+# (num_lines, end_condition_length) array with the cell indices of every possible winning line.
+def line_cells(dimension, end_condition_length):
+    key = (dimension, end_condition_length)
+    if key not in _line_cache:
+        k = end_condition_length
+        lines = []
+        for row in range(0, dimension):
+            for col in range(0, dimension):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    if 0 <= row + (k - 1) * dr < dimension and 0 <= col + (k - 1) * dc < dimension:
+                        lines.append([(row + i * dr) * dimension + col + i * dc for i in range(0, k)])
+        _line_cache[key] = np.array(lines, dtype=np.int32).reshape((-1, k))
+    return _line_cache[key]
+
+
+# Plays batch_size random playouts from game_state and returns (x_wins, o_wins, draws).
+def batch_rollout(game_state, batch_size, rng=np.random):
+    if not game_state.game_running:
+        return (batch_size if game_state.winner == "X" else 0,
+                batch_size if game_state.winner == "O" else 0,
+                batch_size if game_state.winner is None else 0)
+    grid = game_state.grid
+    board = np.zeros(grid.num_cells, dtype=np.int8)  # 1 = X, 2 = O, 0 = free
+    board[grid.mask_to_indexes(grid.x_bits)] = 1
+    board[grid.mask_to_indexes(grid.o_bits)] = 2
+    free = np.flatnonzero(board == 0)
+    mover, other = (1, 2) if game_state.turn == "X" else (2, 1)
+
+    # ply at which each free square gets played in each playout
+    order = rng.random((batch_size, len(free))).argsort(axis=1)
+    ply = np.empty_like(order)
+    np.put_along_axis(ply, order, np.arange(len(free)), axis=1)
+
+    owners = np.tile(board, (batch_size, 1))
+    owners[:, free] = np.where(ply % 2 == 0, mover, other)
+    plies = np.full((batch_size, grid.num_cells), -1, dtype=np.int32)  # squares taken before the playout: -1
+    plies[:, free] = ply
+
+    lines = line_cells(grid.dimension, game_state.end_condition_length)
+    if len(lines) == 0:
+        return 0, 0, batch_size
+    line_owners = owners[:, lines]  # (batch, lines, k)
+    single_coloured = np.all(line_owners == line_owners[:, :, :1], axis=2)
+    completed_at = np.where(single_coloured, plies[:, lines].max(axis=2), np.iinfo(np.int32).max)
+    first = completed_at.argmin(axis=1)
+    has_winner = single_coloured[np.arange(batch_size), first]
+    winners = np.where(has_winner, line_owners[np.arange(batch_size), first, 0], 0)
+    x_wins = int(np.count_nonzero(winners == 1))
+    o_wins = int(np.count_nonzero(winners == 2))
+    return x_wins, o_wins, batch_size - x_wins - o_wins
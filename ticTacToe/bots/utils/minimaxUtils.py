@@ -2,8 +2,6 @@
 Put some utility functions here.
 """
 
-import numpy as np
-
 MAX_REWARD = 100
 
 
@@ -17,22 +15,26 @@ def simple_heuristic(game_state):
         return 0
 
 
+# Number of free squares that would complete a line of length cells for mark.
+def count_completing_moves(game_state, mark, length):
+    if length >= 2:
+        # kept up to date by the grid as marks are placed and removed
+        return len(game_state.grid.completing_cells(mark, length))
+    elif length == 1:
+        # any candidate square completes a line of one, on an empty board that is just the centre
+        grid = game_state.grid
+        return len(grid.frontier(3)) if grid.occupied() > 0 else 1
+    return 0
+
+
 def winning_features(game_state):
-    grid = game_state.grid
     score = game_state.end_condition_length
-    x_win = 0
-    o_win = 0
-    x_near_win = 0
-    o_near_win = 0
-    x_improving = 0
-    o_improving = 0
-    for move in prune_possible_moves(game_state, stride=3):
-        x_win += 1 if grid.test_coordinate_for_win(move, "X", score, look_ahead=True)[0] else 0
-        o_win += 1 if grid.test_coordinate_for_win(move, "O", score, look_ahead=True)[0] else 0
-        x_near_win += 1 if grid.test_coordinate_for_win(move, "X", score - 1, look_ahead=True)[0] else 0
-        o_near_win += 1 if grid.test_coordinate_for_win(move, "O", score - 1, look_ahead=True)[0] else 0
-        x_improving += 1 if grid.test_coordinate_for_win(move, "X", score - 2, look_ahead=True)[0] else 0
-        o_improving += 1 if grid.test_coordinate_for_win(move, "O", score - 2, look_ahead=True)[0] else 0
+    x_win = count_completing_moves(game_state, "X", score)
+    o_win = count_completing_moves(game_state, "O", score)
+    x_near_win = count_completing_moves(game_state, "X", score - 1)
+    o_near_win = count_completing_moves(game_state, "O", score - 1)
+    x_improving = count_completing_moves(game_state, "X", score - 2)
+    o_improving = count_completing_moves(game_state, "O", score - 2)
 
     if x_win > 0 and game_state.turn == "X":
         return MAX_REWARD * 0.9 + (0.01 if x_win > 1 else 0)
@@ -75,32 +77,15 @@ def heuristic_with_features(game_state):
 
 
 """
-Prunes moves so that they are max stride points away from the last move coordinate.
+Prunes moves so that they are closer than stride to some taken square.
 This was meant to be used with bigger game board.
 """
 
 
 def prune_possible_moves(game_state, stride=2):
-
-    def dist(x, y):
-        return np.sqrt((x[0] - y[0])**2 + (x[1] - y[1])**2)
-
-    def taken_coordinates():
-        return {(x, y)
-                for x in range(0, game_state.grid.dimension)
-                for y in range(0, game_state.grid.dimension)
-                if game_state.grid.grid[x, y] in ["X", "O"]}
-
-    taken = taken_coordinates()
-    pruned_moves = set()
-    # 1st move
-    if len(taken) == 0:
-        pruned_moves.add(game_state.grid.possible_moves.pop())
-    else:
-        # 2nd move onwards
-        for move in game_state.grid.possible_moves:
-            for coord in taken:
-                if dist(move, coord) < stride:
-                    pruned_moves.add(move)
-                    break
-    return pruned_moves
+    grid = game_state.grid
+    # 1st move: the centre square
+    if grid.occupied() == 0:
+        return {(grid.dimension // 2, grid.dimension // 2)}
+    # 2nd move onwards: the frontier the grid keeps up to date, copied as the caller plays moves while iterating
+    return set(grid.frontier(stride))
@@ -0,0 +1,88 @@
+"""
+Reads and writes opening books (built with buildBook.py).
+
+A book maps positions to the move a deep offline search picked for them. Positions are keyed by their canonical
+zobrist key (the same for all rotations/reflections), and moves are stored in the canonical orientation.
+
+The book file is a small header followed by fixed size records sorted by key. Bots memory-map it on first use and
+find a position with a binary search, so neither loading nor looking up costs more than a few page reads.
+"""
+
+import os
+
+import numpy as np
+
+import gameLogic as gl
+
+MAGIC = b"TTTB"
+HEADER_BYTES = 16  # magic, dimension, end condition length, 2 bytes padding, number of records (uint64)
+RECORD = np.dtype([("key", "<u8"), ("move", "<u2"), ("depth", "<u2")])
+BOOK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "books")
+
+# (dimension, end_condition_length) -> memory-mapped records, None if there is no book file.
+_books = {}
+
+
+def book_path(dimension, end_condition_length):
+    return os.path.join(BOOK_DIR, "book_{}_{}.bin".format(dimension, end_condition_length))
+
+
+# Writes entries {canonical key: (canonical move index, search depth)} as a sorted book file.
+def write_book(entries, dimension, end_condition_length, path=None):
+    path = book_path(dimension, end_condition_length) if path is None else path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    records = np.zeros(len(entries), dtype=RECORD)
+    for i, (key, (move_index, depth)) in enumerate(sorted(entries.items())):
+        records[i] = (key, move_index, max(depth, 0))
+    with open(path, "wb") as f:
+        f.write(MAGIC + bytes((dimension, end_condition_length, 0, 0)))
+        f.write(np.uint64(len(records)).tobytes())
+        f.write(records.tobytes())
+    _books.pop((dimension, end_condition_length), None)
+    return path
+
+
+# Memory-maps the book of the configuration, or returns None if there is none.
+def load_book(dimension, end_condition_length):
+    key = (dimension, end_condition_length)
+    if key not in _books:
+        path = book_path(dimension, end_condition_length)
+        records = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                header = f.read(HEADER_BYTES)
+            if header[:4] != MAGIC or tuple(header[4:6]) != key:
+                raise ValueError("Not an opening book of {}x{} with {} to win: {}".format(dimension, dimension,
+                                                                                         end_condition_length, path))
+            num_records = int(np.frombuffer(header[8:16], dtype="<u8")[0])
+            if num_records > 0:
+                records = np.memmap(path, dtype=RECORD, mode="r", offset=HEADER_BYTES, shape=(num_records,))
+        _books[key] = records
+    return _books[key]
+
+
+# Returns (move, search depth) of the position from the book, or None if the book does not cover it.
+def lookup(game_state):
+    grid = game_state.grid
+    if not game_state.game_running:
+        return None
+    records = load_book(grid.dimension, game_state.end_condition_length)
+    if records is None:
+        return None
+    key, symmetry = game_state.canonical_key()
+    keys = records["key"]
+    i = int(np.searchsorted(keys, np.uint64(key)))
+    if i == len(keys) or int(keys[i]) != key:
+        return None
+    from_canonical = gl.symmetry_maps(grid.dimension)[gl.INVERSE_SYMMETRY[symmetry]]
+    move = grid.index_to_coord(from_canonical[int(records["move"][i])])
+    if not grid.is_free(move):
+        # zobrist key collision
+        return None
+    return move, int(records["depth"][i])
+
+
+# Book move of the position, or None if the book does not cover it.
+def book_move(game_state):
+    result = lookup(game_state)
+    return None if result is None else result[0]
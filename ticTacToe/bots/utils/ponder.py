@@ -0,0 +1,67 @@
+"""
+Background search on the opponent's time (pondering).
+
+Ponder.start runs search(position) in a daemon thread on a private copy of the game state, so the position shown by
+the display is never touched while the opponent thinks. Ponder.stop is the hard stop: it sets the stopping event,
+which the bots check where they look at the clock, and waits for the thread to finish. Whatever the search left in
+the bot (tree, transposition table) is then picked up by the next get_move, which calls Ponder.hand_off.
+
+The thread shares the interpreter with the display, but input() and the Tk event loop release it while they wait
+for the human, so the search gets the time and the UI stays responsive.
+"""
+
+import threading
+import time
+
+import gameLogic as gl
+
+# Longest a ponder search runs when nobody stops it.
+PONDER_TIME_MS = 5 * 60 * 1000
+
+
+# Copy of the position for the search thread, the moves replayed on a new game state.
+def copy_game_state(game_state):
+    first_turn = game_state.turn
+    if len(game_state.moves) % 2 == 1:
+        first_turn = "O" if game_state.turn == "X" else "X"
+    position = gl.GameState(game_state.grid.dimension, first_turn, game_state.end_condition_length, 1)
+    for move in game_state.moves:
+        position.play_turn(tuple(move))
+    return position
+
+
+class Ponder:
+
+    def __init__(self):
+        self.thread = None
+        self.stopping = threading.Event()
+        self.start_time = None
+        # Seconds the last ponder search ran.
+        self.elapsed = 0.0
+        # A search was started and get_move has not taken its work over yet.
+        self.pending = False
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, search, game_state):
+        self.stop()
+        self.start_time = time.time()
+        self.pending = True
+        self.thread = threading.Thread(target=search, args=(copy_game_state(game_state),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.elapsed = time.time() - self.start_time
+            self.thread = None
+            self.stopping.clear()
+
+    # Stops the search for get_move. Returns True if there was a search since the last hand-off, its counters are
+    # then still in the bot.
+    def hand_off(self):
+        self.stop()
+        pending, self.pending = self.pending, False
+        return pending
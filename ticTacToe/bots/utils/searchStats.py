@@ -0,0 +1,50 @@
+"""
+Helpers for the per move statistics of the bots (see gameLogic.Player.play_move).
+
+Counters the bots keep anyway (nodes, evaluations, cutoffs, simulations) are always on. Timing the parts of a search
+costs two clock reads per call, so the bots only swap in the timed versions of their move generation, evaluation and
+hashing functions while collect_stats is on.
+"""
+
+import json
+import time
+
+# Parts of a search timed separately.
+TIMERS = ("movegen", "evaluation", "hashing")
+
+
+def new_timers():
+    return {name: 0.0 for name in TIMERS}
+
+
+# function wrapped to add the seconds spent in it to timers[name].
+def timed(function, timers, name):
+    def timed_function(*args):
+        start_time = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            timers[name] += time.perf_counter() - start_time
+    return timed_function
+
+
+# Timer totals as record fields ("time_movegen_ms", ...).
+def timer_fields(timers):
+    return {"time_{}_ms".format(name): round(1000 * seconds, 3) for name, seconds in timers.items()}
+
+
+def format_stats(record):
+    fields = []
+    for key, value in record.items():
+        if isinstance(value, float):
+            value = "{:.3g}".format(value)
+        fields.append("{}={}".format(key, value))
+    return " ".join(fields)
+
+
+# Stats hook writing one JSON line per move to the open file f.
+def json_lines_hook(f):
+    def write_record(record):
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+    return write_record
@@ -0,0 +1,92 @@
+"""
+Fixed size transposition table for alpha-beta search.
+
+Entries live in preallocated NumPy arrays (one per field) indexed by zobrist_key % num_entries, so the memory use
+is decided up front from a megabyte cap and never grows. Scores are stored from X's point of view like everywhere
+else in the minimax code, together with the kind of bound the score is.
+"""
+
+import numpy as np
+
+# Bound types of a stored score.
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Replacement policies.
+REPLACE_ALWAYS = "always"  # newest entry always wins the slot
+REPLACE_DEPTH = "depth"  # keep the deeper entry unless the stored one is from an older search
+
+# key (8) + score (8) + depth (2) + move (2) + bound (1) + age (1)
+ENTRY_BYTES = 22
+
+
+class TranspositionTable:
+
+    def __init__(self, size_mb=16, replacement=REPLACE_DEPTH):
+        if replacement not in (REPLACE_ALWAYS, REPLACE_DEPTH):
+            raise ValueError("Unknown replacement policy: {}".format(replacement))
+        self.size_mb = size_mb
+        self.replacement = replacement
+        self.num_entries = max(1, int(size_mb * 2**20) // ENTRY_BYTES)
+        self.keys = np.zeros(self.num_entries, dtype=np.uint64)
+        self.scores = np.zeros(self.num_entries, dtype=np.float64)
+        self.depths = np.full(self.num_entries, -1, dtype=np.int16)  # -1 = empty slot
+        self.moves = np.full(self.num_entries, -1, dtype=np.int16)  # cell index of the best move, -1 = none
+        self.bounds = np.zeros(self.num_entries, dtype=np.int8)
+        self.ages = np.zeros(self.num_entries, dtype=np.uint8)
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        self.depths.fill(-1)
+        self.moves.fill(-1)
+        self.age = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    # Call once per root search so entries of earlier moves become replaceable.
+    def new_search(self):
+        self.age = (self.age + 1) % 256
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes > 0 else 0.0
+
+    # Returns (depth, score, bound, move_index) stored for key or None.
+    def probe(self, key):
+        i = key % self.num_entries
+        if self.depths[i] >= 0 and self.keys[i] == key:
+            self.hits += 1
+            return int(self.depths[i]), float(self.scores[i]), int(self.bounds[i]), int(self.moves[i])
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, move_index=-1):
+        i = key % self.num_entries
+        stored_depth = self.depths[i]
+        if stored_depth >= 0:
+            same_key = self.keys[i] == key
+            if self.replacement == REPLACE_DEPTH and not same_key and depth < stored_depth \
+                    and self.ages[i] == self.age:
+                return
+            if same_key and move_index < 0:
+                # keep the known best move of the position
+                move_index = int(self.moves[i])
+            if not same_key:
+                self.overwrites += 1
+        self.keys[i] = key
+        self.scores[i] = score
+        self.depths[i] = depth
+        self.moves[i] = move_index
+        self.bounds[i] = bound
+        self.ages[i] = self.age
+        self.stores += 1
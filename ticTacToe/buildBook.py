@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+Builds opening books for the bots.
+
+The book is built level by level from the empty board: every position of a level is searched by the minimax bot on
+a process pool, and the next level holds the positions after the book move and after every candidate reply of the
+minimax pruning (rotations/reflections of a position are searched once). The result is written as a sorted binary
+book file (see bots/utils/openingBook.py) that AlphaBetaBot and MCTSBot check before searching.
+
+From the project directory, build a 3 ply book for 15x15 with 5 to win, searching every position for 2 seconds:
+python buildBook.py -d 15 --score 5 --plies 3 --time_ms 2000
+"""
+
+import argparse
+import multiprocessing as mp
+import time
+
+import gameLogic as gl
+from bots.minimax import AlphaBetaBot
+from bots.utils.minimaxUtils import prune_possible_moves
+from bots.utils.openingBook import write_book
+
+# Search bot of the worker process, reused between positions.
+_worker_bot = None
+
+
+def _replay(dimension, end_condition_length, moves):
+    game_state = gl.GameState(dimension, "X", end_condition_length, 1)
+    for move in moves:
+        game_state.play_turn(tuple(move))
+    return game_state
+
+
+# Searches one book position, task = (dimension, end_condition_length, moves, computation_time_ms).
+def search_position(task):
+    global _worker_bot
+    dimension, end_condition_length, moves, computation_time_ms = task
+    if _worker_bot is None:
+        _worker_bot = AlphaBetaBot(use_book=False)
+    _worker_bot.computation_time_ms = computation_time_ms
+    game_state = _replay(dimension, end_condition_length, moves)
+    move = _worker_bot.get_move(game_state)
+    return moves, move, _worker_bot.depth_reached
+
+
+# Builds the book entries of the positions with up to plies marks, X moving first. on_position(moves, move, depth) is
+# called per searched position.
+def build_book(dimension, end_condition_length, plies, computation_time_ms=1000, workers=None, on_position=None):
+    entries = {}
+    level = [[]]
+    with mp.Pool(processes=workers) as pool:
+        for ply in range(0, plies + 1):
+            tasks = [(dimension, end_condition_length, moves, computation_time_ms) for moves in level]
+            next_level = {}
+            for moves, move, depth in pool.imap_unordered(search_position, tasks):
+                if on_position is not None:
+                    on_position(moves, move, depth)
+                game_state = _replay(dimension, end_condition_length, moves)
+                key, symmetry = game_state.canonical_key()
+                to_canonical = gl.symmetry_maps(dimension)[symmetry]
+                entries[key] = (to_canonical[game_state.grid.coord_to_index(move)], depth)
+                if ply == plies:
+                    continue
+                replies = [move] + sorted(prune_possible_moves(game_state) - {move})
+                for reply in replies:
+                    game_state.play_turn(reply)
+                    child_key = game_state.canonical_key()[0]
+                    if game_state.game_running and child_key not in entries and child_key not in next_level:
+                        next_level[child_key] = moves + [reply]
+                    game_state.backtrack_move(reply)
+            level = list(next_level.values())
+    return entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds an opening book for Tic Tac Toe bots.")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=15, help="Board dimension.")
+    parser.add_argument("--score", metavar="s", type=int, default=5, help="How many marks straight are needed for win.")
+    parser.add_argument("--plies", metavar="n", type=int, default=3,
+                        help="Book positions have up to n marks on the board.")
+    parser.add_argument("--time_ms", metavar="ms", type=int, default=2000, help="Search time per position.")
+    parser.add_argument("--workers", metavar="n", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--output", metavar="path", type=str, default=None, help="Book file (default: bots/books).")
+    args = parser.parse_args()
+
+    build_start = time.time()
+    book = build_book(args.dim, args.score, args.plies, args.time_ms, args.workers,
+                      on_position=lambda moves, move, depth: print(moves, "->", move, "depth", depth))
+    path = write_book(book, args.dim, args.score, args.output)
+    print("{} positions in {:.1f} s, wrote {}".format(len(book), time.time() - build_start, path))
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+"""
+Evaluates a stream of positions in bulk on a process pool.
+
+Every input line is a JSON object holding one position, either as the moves that lead to it (X first) or as a board:
+
+{"moves": [[3, 3], [3, 4], [4, 4]], "dimension": 7, "score": 4}
+{"board": "<Grid.grid_to_string() output>", "score": 4}
+{"board": ["X.O", ".X.", "..O"]}
+
+A board's side to move follows from the mark counts (X moves first). dimension and score default to the command
+line values. Each output line carries the input line's index, the bot's move, the static evaluation
+(heuristic_with_features, from X's point of view) and the search statistics of the move, or an "error" for lines
+that can not be read. Results come out in input order.
+
+Lines are sent to the workers in chunks, and at most window chunks are in flight: reading the input waits for the
+oldest chunk's results to be written, so memory stays flat however long the stream is. Each worker keeps one bot for
+the whole run, so its transposition table and other caches stay warm between positions.
+
+From the project directory, evaluate the positions of games.jsonl with a 2 ply minimax search on 4 processes:
+python evaluatePositions.py games.jsonl --output evaluations.jsonl --bot minimax --depth 2 --workers 4
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import gameLogic as gl
+from bots.utils.minimaxUtils import heuristic_with_features
+from ticTacToe import bot_options
+
+EMPTY_MARKS = (".", "-", "_", "", " ")
+
+# Bot of the worker process, made once per run by _init_worker.
+_worker_bot = None
+
+
+def _init_worker(bot, computation_time_ms, max_depth):
+    global _worker_bot
+    _worker_bot = make_bot(bot, computation_time_ms, max_depth)
+
+
+def make_bot(name, computation_time_ms=None, max_depth=None):
+    bot = bot_options[name]()
+    if computation_time_ms is not None and hasattr(bot, "computation_time_ms"):
+        bot.computation_time_ms = computation_time_ms
+    if max_depth is not None and hasattr(bot, "max_depth"):
+        bot.max_depth = max_depth
+        if computation_time_ms is None:
+            # the depth alone decides when the search ends
+            bot.computation_time_ms = 10**9
+    return bot
+
+
+# Rows of marks ("X", "O" or "") of a board given as Grid.grid_to_string() text or as a list of row strings.
+def parse_board(board):
+    if isinstance(board, list):
+        return [["" if mark in EMPTY_MARKS else mark.upper() for mark in row] for row in board]
+    rows = []
+    # the first two lines are the column numbers and a separator, then a row label before every row
+    for line in board.splitlines()[2:]:
+        if line.strip():
+            rows.append([cell.strip().upper() for cell in line[5:].split("|")])
+    return rows
+
+
+# Moves (X first) that lead to a board with the given X and O marks, alternating in row-major order. If last (a mark
+# of the side that moved last) is given, it is played last.
+def board_moves(x_moves, o_moves, last=None):
+    if last is not None:
+        x_moves = [move for move in x_moves if move != last]
+        o_moves = [move for move in o_moves if move != last]
+    moves = [move for pair in zip(x_moves, o_moves) for move in pair] + x_moves[len(o_moves):]
+    return moves if last is None else moves + [last]
+
+
+def replay(moves, dimension, end_condition_length):
+    game_state = gl.GameState(dimension, "X", end_condition_length, 1, bot_move_draw_delay=0)
+    for move in moves:
+        if not game_state.game_running:
+            raise ValueError("The game is already over")
+        if not (game_state.grid.is_valid_coord(move) and game_state.grid.is_free(move)):
+            raise ValueError("Illegal move: {}".format(list(move)))
+        game_state.play_turn(move)
+    return game_state
+
+
+# Position of an input record, dimension and end_condition_length are the defaults for records without them. Raises
+# ValueError for records that do not hold a position.
+def position_from_record(record, dimension=3, end_condition_length=3):
+    if not isinstance(record, dict):
+        raise ValueError("Position must be a JSON object")
+    end_condition_length = int(record.get("score", end_condition_length))
+    if "board" in record:
+        board = record["board"]
+        if not (isinstance(board, str) or isinstance(board, list) and all(isinstance(row, str) for row in board)):
+            raise ValueError("board must be a string or a list of row strings")
+        rows = parse_board(board)
+        dimension = len(rows)
+        if any(len(row) != dimension for row in rows):
+            raise ValueError("Board is not square")
+        x_moves = [(r, c) for r in range(0, dimension) for c in range(0, dimension) if rows[r][c] == "X"]
+        o_moves = [(r, c) for r in range(0, dimension) for c in range(0, dimension) if rows[r][c] == "O"]
+        if any(rows[r][c] not in ("X", "O", "") for r in range(0, dimension) for c in range(0, dimension)):
+            raise ValueError("Board marks must be X, O or empty")
+        if len(x_moves) - len(o_moves) not in (0, 1):
+            raise ValueError("Board has {} X and {} O marks".format(len(x_moves), len(o_moves)))
+        # a finished board has to be reached with the winning line completed last: try the last mover's marks as
+        # the last move until no earlier move ends the game
+        last_marks = x_moves if len(x_moves) > len(o_moves) else o_moves
+        candidates = [board_moves(x_moves, o_moves)] + [board_moves(x_moves, o_moves, last) for last in last_marks]
+    else:
+        dimension = int(record.get("dimension", dimension))
+        moves = record["moves"]
+        if not isinstance(moves, list) or not all(isinstance(move, (list, tuple)) and len(move) == 2 and
+                                                  all(isinstance(x, int) for x in move) for move in moves):
+            raise ValueError("moves must be a list of [row, col] pairs")
+        candidates = [[tuple(move) for move in moves]]
+    if dimension < 1:
+        raise ValueError("Board has no squares")
+    error = None
+    for moves in candidates:
+        try:
+            return replay(moves, dimension, end_condition_length)
+        except ValueError as failure:
+            error = failure if error is None else error
+    raise error
+
+
+# Result record of one input line.
+def evaluate_line(bot, index, line, dimension, end_condition_length):
+    try:
+        game_state = position_from_record(json.loads(line), dimension, end_condition_length)
+    except (ValueError, KeyError, TypeError) as error:
+        return {"index": index, "error": str(error)}
+    result = {"index": index,
+              "turn": game_state.turn,
+              "running": game_state.game_running,
+              "winner": game_state.winner}
+    if not game_state.game_running:
+        return result
+    result["eval"] = heuristic_with_features(game_state)
+    bot.collect_stats = True
+    result["move"] = list(bot.play_move(game_state))
+    stats = dict(bot.stats)
+    for field in ("player", "mark", "ply", "move"):
+        stats.pop(field)
+    result.update(stats)
+    return result
+
+
+# Evaluates a chunk of (index, line) pairs in a worker process.
+def evaluate_chunk(task):
+    chunk, dimension, end_condition_length = task
+    return [evaluate_line(_worker_bot, index, line, dimension, end_condition_length) for index, line in chunk]
+
+
+# Reads lines in chunks of chunk_size (blank lines skipped), yielding lists of (index, line).
+def read_chunks(lines, chunk_size):
+    chunk = []
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        chunk.append((index, line))
+        index += 1
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Yields the result records of the input lines in order, keeping at most window chunks on the pool.
+def evaluate_stream(lines, bot="minimax", computation_time_ms=None, max_depth=None, dimension=3,
+                    end_condition_length=3, workers=None, chunk_size=32, window=None):
+    workers = os.cpu_count() if workers is None else workers
+    window = 2 * workers if window is None else window
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(bot, computation_time_ms, max_depth)) as pool:
+        in_flight = collections.deque()
+        for chunk in read_chunks(lines, chunk_size):
+            if len(in_flight) == window:
+                yield from in_flight.popleft().result()
+            in_flight.append(pool.submit(evaluate_chunk, (chunk, dimension, end_condition_length)))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluates JSON lines of positions on a process pool.")
+    parser.add_argument("input", metavar="file", type=str, nargs="?", default="-", help="Positions ('-' for stdin).")
+    parser.add_argument("--output", metavar="file", type=str, default="-", help="Results ('-' for stdout).")
+    parser.add_argument("--bot", metavar="b", type=str, default="minimax", help="Bot to search with.")
+    parser.add_argument("--time_ms", metavar="t", type=int, default=None, help="Thinking time per position.")
+    parser.add_argument("--depth", metavar="d", type=int, default=None, help="Search depth (minimax).")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=3, help="Board dimension of move lists.")
+    parser.add_argument("--score", metavar="s", type=int, default=3, help="How many marks straight are needed for win.")
+    parser.add_argument("--workers", metavar="w", type=int, default=None, help="Worker processes (default: cores).")
+    parser.add_argument("--chunk", metavar="n", type=int, default=32, help="Positions per worker task.")
+    parser.add_argument("--window", metavar="n", type=int, default=None,
+                        help="Chunks in flight at most (default: 2 per worker).")
+    args = parser.parse_args()
+
+    if args.bot not in bot_options or args.bot is None:
+        raise ValueError("Unknown bot: {}".format(args.bot))
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    start_time = time.time()
+    count = 0
+    for result in evaluate_stream(source, args.bot, args.time_ms, args.depth, args.dim, args.score, args.workers,
+                                  args.chunk, args.window):
+        out.write(json.dumps(result) + "\n")
+        count += 1
+    if out is not sys.stdout:
+        out.close()
+    elapsed = time.time() - start_time
+    print("{} positions in {:.1f} s ({:.1f} positions/s)".format(count, elapsed, count / max(elapsed, 1e-9)),
+          file=sys.stderr)
@@ -4,44 +4,446 @@ Include game logic here.
 
 import numpy as np
 import random as rand
+import time
+from operator import xor
 
 """
 This encodes the play area, aka grid.
 Assume all coordinates are given as (row, col) tuples.
+
+The board is kept as two bitboards, one integer bitmask per player, where cell (row, col) is the bit
+row * dimension + col. Free square checks and move generation are bit operations against masks that are
+precomputed once per board size. For win tests the grid keeps, per line length asked for, how many X and O marks
+every line holds; place_mark/remove_mark update the counts of the lines through the cell. The zobrist keys of the
+board's 8 rotations/reflections are updated the same way, so symmetric positions can share cache entries.
+"""
+
+# Masks shared by all grids of the same size.
+_line_cache = {}
+_cell_line_cache = {}
+_neighbourhood_cache = {}
+_neighbour_cache = {}
+_zobrist_cache = {}
+_symmetry_cache = {}
+_symmetric_zobrist_cache = {}
+
+# Zobrist keys are drawn from a fixed seed so that a position hashes the same in every process and every run.
+ZOBRIST_SEED = 0x7A0B
+ZOBRIST_SIDE = 0x9E3779B97F4A7C15  # xor-ed in when "O" is to move
+
+
+# Random 64-bit (x_key, o_key) per cell.
+def zobrist_keys(dimension):
+    if dimension not in _zobrist_cache:
+        r = rand.Random(ZOBRIST_SEED * 1000 + dimension)
+        _zobrist_cache[dimension] = tuple((r.getrandbits(64), r.getrandbits(64)) for _ in range(0, dimension**2))
+    return _zobrist_cache[dimension]
+
+
+"""
+The 8 symmetries of a square board (rotations and reflections). Symmetry 0 is the identity and INVERSE_SYMMETRY[s]
+undoes symmetry s.
 """
+SYMMETRIES = (lambda r, c, n: (r, c),
+              lambda r, c, n: (c, n - 1 - r),  # rotate 90 degrees
+              lambda r, c, n: (n - 1 - r, n - 1 - c),  # rotate 180 degrees
+              lambda r, c, n: (n - 1 - c, r),  # rotate 270 degrees
+              lambda r, c, n: (r, n - 1 - c),  # mirror left-right
+              lambda r, c, n: (n - 1 - r, c),  # mirror up-down
+              lambda r, c, n: (c, r),  # transpose
+              lambda r, c, n: (n - 1 - c, n - 1 - r))  # anti-transpose
+INVERSE_SYMMETRY = (0, 3, 2, 1, 4, 5, 6, 7)
+
+
+# Per symmetry, the cell index every cell index is mapped to.
+def symmetry_maps(dimension):
+    if dimension not in _symmetry_cache:
+        maps = []
+        for symmetry in SYMMETRIES:
+            images = []
+            for index in range(0, dimension**2):
+                r, c = symmetry(index // dimension, index % dimension, dimension)
+                images.append(r * dimension + c)
+            maps.append(tuple(images))
+        _symmetry_cache[dimension] = tuple(maps)
+    return _symmetry_cache[dimension]
+
+
+# Per cell, (x_keys, o_keys) with the zobrist key of the cell's image under each symmetry.
+def symmetric_zobrist_keys(dimension):
+    if dimension not in _symmetric_zobrist_cache:
+        table = zobrist_keys(dimension)
+        maps = symmetry_maps(dimension)
+        _symmetric_zobrist_cache[dimension] = tuple(
+            (tuple(table[images[index]][0] for images in maps), tuple(table[images[index]][1] for images in maps))
+            for index in range(0, dimension**2))
+    return _symmetric_zobrist_cache[dimension]
+
+
+def _credit(cells, cell):
+    cells[cell] = cells.get(cell, 0) + 1
+
+
+def _uncredit(cells, cell):
+    if cells[cell] == 1:
+        del cells[cell]
+    else:
+        cells[cell] -= 1
+
+
+"""
+Every line of end_condition_length cells on a board, numbered in the order test_coordinate_for_win has always
+scanned them: horizontal, vertical, diagonal left-right and diagonal right-left, each starting from the top/left end.
+For each line the cell indices, bit mask and winning_streak are stored, and for each cell the lines through it.
+"""
+
+
+class LineIndex:
+    def __init__(self, dimension, end_condition_length):
+        self.dimension = dimension
+        self.end_condition_length = end_condition_length
+        self.cells = []
+        self.masks = []
+        self.streaks = []
+        self.cell_lines = [[] for _ in range(0, dimension**2)]
+        k = end_condition_length
+        if k > 0:
+            for row in range(0, dimension):
+                for col in range(0, dimension - k + 1):
+                    self.add_line([(row, col + i) for i in range(0, k)], ((row, col), (row, col + k - 1)))
+            for col in range(0, dimension):
+                for row in range(0, dimension - k + 1):
+                    self.add_line([(row + i, col) for i in range(0, k)], ((row + k - 1, col), (row, col)))
+            for row in range(0, dimension - k + 1):
+                for col in range(0, dimension - k + 1):
+                    self.add_line([(row + i, col + i) for i in range(0, k)],
+                                  ((row, col), (row + k - 1, col + k - 1)))
+            for row in range(0, dimension - k + 1):
+                for col in range(k - 1, dimension):
+                    self.add_line([(row + i, col - i) for i in range(0, k)],
+                                  ((row, col), (row + k - 1, col - k + 1)))
+        self.cell_lines = [tuple(lines) for lines in self.cell_lines]
+
+    def add_line(self, coords, streak):
+        line = len(self.cells)
+        cells = tuple(r * self.dimension + c for r, c in coords)
+        mask = 0
+        for cell in cells:
+            mask |= 1 << cell
+            self.cell_lines[cell].append(line)
+        self.cells.append(cells)
+        self.masks.append(mask)
+        self.streaks.append(streak)
+
+    def __len__(self):
+        return len(self.cells)
+
+
+def line_index(dimension, end_condition_length):
+    key = (dimension, end_condition_length)
+    if key not in _line_cache:
+        _line_cache[key] = LineIndex(dimension, end_condition_length)
+    return _line_cache[key]
+
+
+# For every cell, the (mask, winning_streak) of each line through it.
+def cell_lines(dimension, end_condition_length):
+    key = (dimension, end_condition_length)
+    if key not in _cell_line_cache:
+        index = line_index(dimension, end_condition_length)
+        _cell_line_cache[key] = [tuple((index.masks[line], index.streaks[line]) for line in lines)
+                                 for lines in index.cell_lines]
+    return _cell_line_cache[key]
+
+
+# (shift, mask) pairs that move a bitboard by every offset (dr, dc) with euclidean length < stride. The mask keeps
+# only the columns a shifted cell can land on without wrapping around to the neighbouring row.
+def neighbourhood_shifts(dimension, stride):
+    key = (dimension, stride)
+    if key not in _neighbourhood_cache:
+        shifts = []
+        for dr in range(-stride + 1, stride):
+            for dc in range(-stride + 1, stride):
+                if (dr, dc) == (0, 0) or dr**2 + dc**2 >= stride**2:
+                    continue
+                cols = range(dc, dimension) if dc >= 0 else range(0, dimension + dc)
+                mask = 0
+                for r in range(0, dimension):
+                    for c in cols:
+                        mask |= 1 << (r * dimension + c)
+                shifts.append((dr * dimension + dc, mask))
+        _neighbourhood_cache[key] = tuple(shifts)
+    return _neighbourhood_cache[key]
+
+
+# Per cell index, the (index, coord) of the cells closer than stride to it (same distance as neighbourhood_shifts).
+def neighbour_cells(dimension, stride):
+    key = (dimension, stride)
+    if key not in _neighbour_cache:
+        neighbours = []
+        for row in range(0, dimension):
+            for col in range(0, dimension):
+                cells = []
+                for dr in range(-stride + 1, stride):
+                    for dc in range(-stride + 1, stride):
+                        r, c = row + dr, col + dc
+                        if (dr, dc) != (0, 0) and dr**2 + dc**2 < stride**2 and 0 <= r < dimension \
+                                and 0 <= c < dimension:
+                            cells.append((r * dimension + c, (r, c)))
+                neighbours.append(tuple(cells))
+        _neighbour_cache[key] = neighbours
+    return _neighbour_cache[key]
 
 
 class Grid:
     def __init__(self, dimension):
         self.dimension = dimension
-        self.grid = np.array([" " for x in range(0, dimension**2)]).reshape((dimension, dimension))
+        self.num_cells = dimension**2
+        self.full_mask = (1 << self.num_cells) - 1
+        self.x_bits = 0
+        self.o_bits = 0
+        # xor of the zobrist keys of all marks on the board
+        self.zobrist_key = 0
+        self.zobrist_table = zobrist_keys(dimension)
+        # zobrist key of the board transformed by each symmetry, [0] == zobrist_key
+        self.symmetric_keys = (0,) * len(SYMMETRIES)
+        self.symmetric_table = symmetric_zobrist_keys(dimension)
+        # end_condition_length -> (lines through each cell, X count per line, O count per line)
+        self.line_counts = {}
+        # length -> (line masks, [None, X squares, O squares]) where the squares map each free square that would
+        # complete a line of length cells for the player to the number of such lines
+        self.threats = {}
+        # stride -> (number of marks closer than stride to each cell, free cells with at least one such mark)
+        self.frontiers = {}
         # use row ordering e.g. 0,1,2 (1st row), 3,4,5 (2nd) etc on 3x3
         self.possible_moves = set(map(lambda x: (x // dimension, x % dimension), range(0, dimension**2)))
 
+    # NumPy view of the board, kept for code that wants the old string array.
+    @property
+    def grid(self):
+        return np.array([self.get_mark((x // self.dimension, x % self.dimension))
+                         for x in range(0, self.num_cells)]).reshape((self.dimension, self.dimension))
+
+    def bits(self, mark):
+        if mark == "X":
+            return self.x_bits
+        elif mark == "O":
+            return self.o_bits
+        return 0
+
+    def occupied(self):
+        return self.x_bits | self.o_bits
+
+    def free_bits(self):
+        return self.full_mask & ~(self.x_bits | self.o_bits)
+
+    def coord_to_index(self, coord):
+        return coord[0] * self.dimension + coord[1]
+
+    def index_to_coord(self, index):
+        return index // self.dimension, index % self.dimension
+
+    # All coordinates of the set bits in mask.
+    def mask_to_coords(self, mask):
+        coords = []
+        while mask:
+            low = mask & -mask
+            index = low.bit_length() - 1
+            coords.append((index // self.dimension, index % self.dimension))
+            mask ^= low
+        return coords
+
+    # Cell indices of the set bits in mask as a NumPy array.
+    def mask_to_indexes(self, mask):
+        bits = np.unpackbits(np.frombuffer(mask.to_bytes((self.num_cells + 7) // 8, "little"), dtype=np.uint8),
+                             bitorder="little")
+        return np.flatnonzero(bits[:self.num_cells])
+
+    # Free squares with euclidean distance < stride to any taken square.
+    def neighbourhood(self, stride):
+        taken = self.x_bits | self.o_bits
+        near = 0
+        for shift, mask in neighbourhood_shifts(self.dimension, stride):
+            if shift >= 0:
+                near |= (taken << shift) & mask
+            else:
+                near |= (taken >> -shift) & mask
+        return near & self.full_mask & ~taken
+
+    # (key, symmetry) of the orientation of the board with the smallest zobrist key. Symmetric boards share the key;
+    # symmetry_maps(dimension)[symmetry] takes cells of this board to the canonical orientation.
+    def canonical_key(self):
+        keys = self.symmetric_keys
+        key = min(keys)
+        return key, keys.index(key)
+
+    # Symmetries that leave the board unchanged (always includes the identity 0).
+    def symmetries(self):
+        keys = self.symmetric_keys
+        return [symmetry for symmetry in range(0, len(keys)) if keys[symmetry] == keys[0]]
+
+    # Starts keeping line counts for lines of end_condition_length cells.
+    def track_lines(self, end_condition_length):
+        index = line_index(self.dimension, end_condition_length)
+        tracked = (index.cell_lines,
+                   [bin(self.x_bits & mask).count("1") for mask in index.masks],
+                   [bin(self.o_bits & mask).count("1") for mask in index.masks])
+        self.line_counts[end_condition_length] = tracked
+        return tracked
+
+    # Starts keeping the squares that complete lines of length (>= 2) cells for each player.
+    def track_threats(self, length):
+        if length not in self.line_counts:
+            self.track_lines(length)
+        index = line_index(self.dimension, length)
+        _, x_counts, o_counts = self.line_counts[length]
+        occupied = self.x_bits | self.o_bits
+        cells = [None, {}, {}]
+        for line, mask in enumerate(index.masks):
+            if o_counts[line] == 0 and x_counts[line] == length - 1:
+                _credit(cells[1], (mask & ~occupied).bit_length() - 1)
+            elif x_counts[line] == 0 and o_counts[line] == length - 1:
+                _credit(cells[2], (mask & ~occupied).bit_length() - 1)
+        self.threats[length] = (index.masks, cells)
+
+    # Starts keeping the frontier of free squares closer than stride to some taken square.
+    def track_frontier(self, stride):
+        near = [0] * self.num_cells
+        for index in self.mask_to_indexes(self.x_bits | self.o_bits):
+            for cell, _ in neighbour_cells(self.dimension, stride)[index]:
+                near[cell] += 1
+        self.frontiers[stride] = (near, set(self.mask_to_coords(self.neighbourhood(stride))))
+
+    # Free squares closer than stride to some taken square, kept up to date as marks are placed and removed.
+    # The set is live, copy it before changing the board while iterating over it.
+    def frontier(self, stride):
+        if stride not in self.frontiers:
+            self.track_frontier(stride)
+        return self.frontiers[stride][1]
+
+    # Free squares (cell index -> number of lines) where mark would complete a line of length (>= 2) cells.
+    def completing_cells(self, mark, length):
+        if length not in self.threats:
+            self.track_threats(length)
+        return self.threats[length][1][1 if mark == "X" else 2]
+
     def is_free(self, coord):
-        if self.grid[coord[0], coord[1]] not in ["X", "O"]:
-            return True
-        else:
-            return False
+        return not (self.x_bits | self.o_bits) >> (coord[0] * self.dimension + coord[1]) & 1
 
     def is_valid_coord(self, coord):
         return (0 <= coord[0] < self.dimension) and (0 <= coord[1] < self.dimension)
 
     def get_mark(self, coord):
-        return self.grid[coord[0], coord[1]]
+        index = coord[0] * self.dimension + coord[1]
+        if self.x_bits >> index & 1:
+            return "X"
+        elif self.o_bits >> index & 1:
+            return "O"
+        return " "
 
     def place_mark(self, coord, mark):
         # free square
         if self.is_free(coord):
-            self.grid[coord[0], coord[1]] = mark
+            index = coord[0] * self.dimension + coord[1]
+            if mark == "X":
+                self.x_bits |= 1 << index
+                self.zobrist_key ^= self.zobrist_table[index][0]
+                own = 1
+            else:
+                self.o_bits |= 1 << index
+                self.zobrist_key ^= self.zobrist_table[index][1]
+                own = 2
+            self.symmetric_keys = tuple(map(xor, self.symmetric_keys, self.symmetric_table[index][own - 1]))
+            if self.threats:
+                self.update_threats(index, own, True)
+            for tracked in self.line_counts.values():
+                counts = tracked[own]
+                for line in tracked[0][index]:
+                    counts[line] += 1
+            if self.frontiers:
+                self.update_frontiers(index, coord, 1)
             self.possible_moves.discard(coord)
 
     def remove_mark(self, coord):
-        self.grid[coord[0], coord[1]] = " "
+        index = coord[0] * self.dimension + coord[1]
+        bit = 1 << index
+        if self.x_bits & bit:
+            self.x_bits ^= bit
+            self.zobrist_key ^= self.zobrist_table[index][0]
+            own = 1
+        elif self.o_bits & bit:
+            self.o_bits ^= bit
+            self.zobrist_key ^= self.zobrist_table[index][1]
+            own = 2
+        else:
+            own = 0
+        if own:
+            self.symmetric_keys = tuple(map(xor, self.symmetric_keys, self.symmetric_table[index][own - 1]))
+            if self.threats:
+                self.update_threats(index, own, False)
+            for tracked in self.line_counts.values():
+                counts = tracked[own]
+                for line in tracked[0][index]:
+                    counts[line] -= 1
+            if self.frontiers:
+                self.update_frontiers(index, coord, -1)
         self.possible_moves.add(coord)
 
+    # Updates the frontiers after a mark was placed on (step 1) or removed from (step -1) index.
+    def update_frontiers(self, index, coord, step):
+        occupied = self.x_bits | self.o_bits
+        for stride, (near, frontier) in self.frontiers.items():
+            for cell, neighbour in neighbour_cells(self.dimension, stride)[index]:
+                near[cell] += step
+                if step > 0:
+                    if near[cell] == 1 and not occupied >> cell & 1:
+                        frontier.add(neighbour)
+                elif near[cell] == 0:
+                    frontier.discard(neighbour)
+            if step > 0:
+                frontier.discard(coord)
+            elif near[index] > 0:
+                frontier.add(coord)
+
+    # Updates the completing squares of the lines through index after a mark of player own (1 = X, 2 = O) was
+    # placed on or removed from it. Runs before the line counts are updated, so they still describe the old board.
+    def update_threats(self, index, own, placed):
+        occupied = self.x_bits | self.o_bits
+        other = 3 - own
+        for length, (masks, cells) in self.threats.items():
+            tracked = self.line_counts[length]
+            own_counts, other_counts = tracked[own], tracked[other]
+            own_cells, other_cells = cells[own], cells[other]
+            for line in tracked[0][index]:
+                n_own, n_other = own_counts[line], other_counts[line]
+                if placed:
+                    if n_other == 0:
+                        if n_own == length - 1:
+                            _uncredit(own_cells, index)
+                        elif n_own == length - 2:
+                            _credit(own_cells, (masks[line] & ~occupied).bit_length() - 1)
+                    elif n_own == 0 and n_other == length - 1:
+                        _uncredit(other_cells, index)
+                else:
+                    if n_other == 0:
+                        if n_own == length - 1:
+                            _uncredit(own_cells, (masks[line] & ~occupied & ~(1 << index)).bit_length() - 1)
+                        elif n_own == length:
+                            _credit(own_cells, index)
+                    elif n_own == 1 and n_other == length - 1:
+                        _credit(other_cells, index)
+
     def clear_grid(self):
-        self.grid = np.array([" " for x in range(0, self.dimension**2)]).reshape((self.dimension, self.dimension))
+        self.x_bits = 0
+        self.o_bits = 0
+        self.zobrist_key = 0
+        self.symmetric_keys = (0,) * len(SYMMETRIES)
+        for end_condition_length in list(self.line_counts):
+            self.track_lines(end_condition_length)
+        for length in list(self.threats):
+            self.track_threats(length)
+        for stride in list(self.frontiers):
+            self.track_frontier(stride)
         self.possible_moves = set(map(lambda x: (x // self.dimension, x % self.dimension), range(0, self.dimension**2)))
 
     def grid_to_string(self):
@@ -51,71 +453,31 @@ class Grid:
             s += "{:2s}".format(str(i)) + "   "
             for j in range(0, self.dimension):
                 if j < self.dimension - 1:
-                    s += "{:1s} |  ".format(self.grid[i, j])
+                    s += "{:1s} |  ".format(self.get_mark((i, j)))
                 else:
-                    s += "{:1s}\n".format(self.grid[i, j])
+                    s += "{:1s}\n".format(self.get_mark((i, j)))
         return s
 
     def test_coordinate_for_win(self, coord, test_mark, end_condition_length, look_ahead=False):
-
-        row = coord[0]
-        col = coord[1]
         winning_streak = None  # on canvas ((y0, x0), (y1, x1))
 
-        if not self.is_valid_coord(coord):
+        if not self.is_valid_coord(coord) or test_mark not in ("X", "O"):
             return False, winning_streak
+        index = coord[0] * self.dimension + coord[1]
+        tracked = self.line_counts.get(end_condition_length)
+        if tracked is None:
+            tracked = self.track_lines(end_condition_length)
+        cell_lines, x_counts, o_counts = tracked
+        if test_mark == "X":
+            counts, own = x_counts, self.x_bits >> index & 1
+        else:
+            counts, own = o_counts, self.o_bits >> index & 1
+        # With look_ahead the cell counts as test_mark whatever is on it.
+        needed = end_condition_length - 1 + own if look_ahead else end_condition_length
         # check if move was a winning move
-        counter = 0
-        # horizontal
-        for c in range(col - end_condition_length + 1, col + end_condition_length):
-            if self.is_valid_coord((row, c)):
-                if self.get_mark((row, c)) == test_mark or (look_ahead and (row, c) == coord):
-                    counter += 1
-                else:
-                    counter = 0
-            if counter == end_condition_length:
-                winning_streak = ((row, c - end_condition_length + 1), (row, c))
-                return True, winning_streak
-
-        counter = 0
-        # vertical
-        for r in range(row - end_condition_length + 1, row + end_condition_length):
-            if self.is_valid_coord((r, col)):
-                if self.get_mark((r, col)) == test_mark or (look_ahead and (r, col) == coord):
-                    counter += 1
-                else:
-                    counter = 0
-                if counter == end_condition_length:
-                    winning_streak = (r, col), (r - end_condition_length + 1, col)
-                    return True, winning_streak
-
-        counter = 0
-        # diagonal left-right top-down
-        r = range(row - end_condition_length + 1, row + end_condition_length)
-        c = range(col - end_condition_length + 1, col + end_condition_length)
-        for ii in range(0, len(r)):
-            if self.is_valid_coord((r[ii], c[ii])):
-                if self.get_mark((r[ii], c[ii])) == test_mark or (look_ahead and (r[ii], c[ii]) == coord):
-                    counter += 1
-                else:
-                    counter = 0
-                if counter == end_condition_length:
-                    winning_streak = (r[ii] - end_condition_length + 1, c[ii] - end_condition_length + 1), (r[ii], c[ii])
-                    return True, winning_streak
-
-        counter = 0
-        # diagonal right-left top-down
-        c = range(col + end_condition_length - 1, col - end_condition_length, -1)
-        r = range(row - end_condition_length + 1, row + end_condition_length)
-        for ii in range(0, len(c)):
-            if self.is_valid_coord((r[ii], c[ii])):
-                if self.get_mark((r[ii], c[ii])) == test_mark or (look_ahead and (r[ii], c[ii]) == coord):
-                    counter += 1
-                else:
-                    counter = 0
-                if counter == end_condition_length:
-                    winning_streak = (r[ii] - end_condition_length + 1, c[ii] + end_condition_length - 1), (r[ii], c[ii])
-                    return True, winning_streak
+        for line in cell_lines[index]:
+            if counts[line] == needed:
+                return True, line_index(self.dimension, end_condition_length).streaks[line]
 
         return False, winning_streak
 
@@ -128,11 +490,51 @@ This encodes the player behavior.
 class Player:
 
     def __init__(self):
-        pass
+        # Per move statistics, off by default. When on, every move made through play_move leaves a record in
+        # self.stats and passes it to stats_hook (if set).
+        self.collect_stats = False
+        self.stats = None
+        self.stats_hook = None
 
     def get_move(self, game_state):
         raise NotImplementedError("Will be implemented by subclasses!")
 
+    # Counters of the last get_move (nodes, evaluations, cutoffs, simulations, time split...). Bots override this.
+    def search_stats(self):
+        return {}
+
+    # What the search of the last get_move thought of game_state (the position it was asked about), for training
+    # data: (value of the position for the side to move in [-1, 1], array of num_cells move weights summing to 1).
+    # None when the move did not come from a search. Bots override this.
+    def search_policy(self, game_state):
+        return None
+
+    # get_move, recording the statistics of the move if collect_stats is on.
+    def play_move(self, game_state):
+        if not self.collect_stats:
+            return self.get_move(game_state)
+        mark, ply = game_state.turn, len(game_state.moves)
+        start_time = time.perf_counter()
+        move = self.get_move(game_state)
+        record = {"player": type(self).__name__,
+                  "mark": mark,
+                  "ply": ply,
+                  "move": list(move),
+                  "time_ms": round(1000 * (time.perf_counter() - start_time), 3)}
+        record.update(self.search_stats())
+        self.stats = record
+        if self.stats_hook is not None:
+            self.stats_hook(record)
+        return move
+
+    # Thinking on the opponent's time: called with the position after the player's own move, the search runs in the
+    # background until the next get_move (or stop_pondering) stops it. Players that can not ponder ignore it.
+    def start_pondering(self, game_state):
+        pass
+
+    def stop_pondering(self):
+        pass
+
 
 """
 This is an abstraction of human player. I.e. prompts for moves.
@@ -157,9 +559,7 @@ class RandomBot(Player):
 
     def get_move(self, game_state):
         if len(game_state.grid.possible_moves) > 0:
-            move = rand.sample(game_state.grid.possible_moves, 1)[0]
-            game_state.grid.possible_moves.remove(move)
-            return move
+            return rand.choice(tuple(game_state.grid.possible_moves))
         else:
             raise IndexError("Bot trying to pick move from empty set of free possible moves.")
 
@@ -185,11 +585,45 @@ class GameState:
         self.o_won = 0
         self.winner = None
         self.moves = []
+        # called with the game state when a game ends, before initialize_game_state clears it (see finish_game)
+        self.game_over_hook = None
         # for convenience, if two bots playing vs each other (especially relevant in gui mode)
         self.bot_move_draw_delay = bot_move_draw_delay
 
     def __hash__(self):
-        return hash(self.grid.grid_to_string())
+        return self.zobrist_key
+
+    # 64-bit zobrist key of the position including the side to move. The board part is updated incrementally by
+    # Grid.place_mark/remove_mark (called from play_turn/backtrack_move), so this is O(1).
+    @property
+    def zobrist_key(self):
+        if self.turn == "O":
+            return self.grid.zobrist_key ^ ZOBRIST_SIDE
+        return self.grid.zobrist_key
+
+    # (key, symmetry) shared by all symmetric equivalents of the position, see Grid.canonical_key.
+    def canonical_key(self):
+        key, symmetry = self.grid.canonical_key()
+        if self.turn == "O":
+            return key ^ ZOBRIST_SIDE, symmetry
+        return key, symmetry
+
+    # Lets a bot waiting for a human opponent's move ponder (see Player.start_pondering).
+    def start_pondering(self):
+        mover, waiting = (self.x, self.o) if self.turn == "X" else (self.o, self.x)
+        if self.game_running and isinstance(mover, HumanPlayer) and not isinstance(waiting, HumanPlayer):
+            waiting.start_pondering(self)
+
+    def stop_pondering(self):
+        for player in (self.x, self.o):
+            if player is not None:
+                player.stop_pondering()
+
+    # Hands the finished game to game_over_hook. The game loops call this once per finished game, the searches
+    # (which make and unmake moves on the same game state) do not.
+    def finish_game(self):
+        if self.game_over_hook is not None:
+            self.game_over_hook(self)
 
     def initialize_game_state(self, turn, x_player, o_player, game_running, turn_count):
         self.turn = turn
@@ -206,9 +640,9 @@ class GameState:
             next_coord = (-1, -1)
         while not (self.grid.is_valid_coord(next_coord) and self.grid.is_free(next_coord)):
             if self.turn == "X":
-                next_coord = self.x.get_move(self)
+                next_coord = self.x.play_move(self)
             else:
-                next_coord = self.o.get_move(self)
+                next_coord = self.o.play_move(self)
 
         # do the move and update game state
         self.grid.place_mark(next_coord, self.turn)
@@ -216,7 +650,7 @@ class GameState:
         move_won, winning_streak = self.grid.test_coordinate_for_win(next_coord, self.turn, self.end_condition_length)
         self.turn_count += 1
 
-        if move_won or self.turn_count == self.grid.grid.size:
+        if move_won or self.turn_count == self.grid.num_cells:
             self.game_running = False
             self.game_counter += 1
             if move_won:
@@ -262,7 +696,7 @@ This contains the main game logic
 
 class Game:
     def __init__(self, dimension, end_condition_length, x_player, o_player,
-                 turn="X", display="text", bot_move_draw_delay=0.5, num_games=1, analytics=False):
+                 turn="X", display="text", bot_move_draw_delay=0.5, num_games=1, analytics=False, ponder=False):
 
         x = HumanPlayer() if x_player is None else x_player
         o = RandomBot() if o_player is None else o_player
@@ -276,15 +710,16 @@ class Game:
                                    bot_move_draw_delay=bot_move_draw_delay)
         self.display = display
         self.analytics=analytics
+        self.ponder = ponder
 
     def run(self):
         if self.display == "text":
             import textDisplay as td
-            td.begin_graphics(self.gameState, self.analytics)
+            td.begin_graphics(self.gameState, self.analytics, self.ponder)
 
         elif self.display == "gui":
             import graphicsDisplay as gd
-            gd.begin_graphics(self.gameState, self.analytics)
+            gd.begin_graphics(self.gameState, self.analytics, self.ponder)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+"""
+Compact binary records of finished games.
+
+A record file starts with a file header: the magic b"TTTR", a format version byte and the table of player names
+(a count byte, then a length byte and UTF-8 bytes per name). Every game after it is an 8 byte game header
+
+    dimension, end_condition_length, first mark (0 = X, 1 = O), winner (0 = draw, 1 = X, 2 = O),
+    X player, O player (indices into the name table), number of moves (little endian uint16)
+
+followed by the moves as cell indices (row * dimension + col), one byte each on boards of up to 256 cells and two
+bytes (little endian) on bigger ones. A 3x3 game takes at most 17 bytes, a 15x15 game of 60 moves 68 bytes.
+
+GameRecordWriter only ever appends, and flushes every game. Next to the records it appends the game's start offset
+to an index file (path + ".idx", little endian uint64), which lets GameRecords memory map both and go to any game
+directly: nothing is parsed before a game is asked for, and headers() reads the headers of all games in one NumPy
+gather. A missing or short index (a run that was killed between the two writes) is rebuilt from the records.
+
+Record the games of a run with ticTacToe.py --record games.ttr or tournament.py --record games.ttr. From the
+project directory, summarize a record file and check that every game replays to its recorded winner:
+python gameRecords.py games.ttr --verify
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+import gameLogic as gl
+
+MAGIC = b"TTTR"
+VERSION = 1
+GAME_HEADER = np.dtype([("dimension", "u1"), ("end_condition_length", "u1"), ("first", "u1"), ("winner", "u1"),
+                        ("x_player", "u1"), ("o_player", "u1"), ("num_moves", "<u2")])
+MARKS = ("X", "O")
+WINNERS = (None, "X", "O")
+
+
+# Bytes per move on a board of the given dimension.
+def cell_size(dimension):
+    return 1 if dimension**2 <= 256 else 2
+
+
+def cell_dtype(dimension):
+    return np.dtype("u1") if cell_size(dimension) == 1 else np.dtype("<u2")
+
+
+def encode_file_header(players):
+    header = bytearray(MAGIC)
+    header += bytes((VERSION, len(players)))
+    for name in players:
+        encoded = name.encode("utf-8")
+        header += bytes((len(encoded),)) + encoded
+    return bytes(header)
+
+
+# (player names, header length) of the record file data (bytes or a uint8 array).
+def decode_file_header(data):
+    if bytes(data[:4]) != MAGIC:
+        raise ValueError("Not a game record file")
+    if data[4] != VERSION:
+        raise ValueError("Unsupported game record version: {}".format(data[4]))
+    players = []
+    position = 6
+    for _ in range(0, data[5]):
+        length = int(data[position])
+        players.append(bytes(data[position + 1:position + 1 + length]).decode("utf-8"))
+        position += 1 + length
+    return players, position
+
+
+# Mark of the player who made the first of moves, given the side to move (or, once the game is over, the side that
+# moved last).
+def first_mark(game_state):
+    last = game_state.turn
+    if game_state.game_running:
+        last = "O" if last == "X" else "X"
+    if len(game_state.moves) % 2 == 1:
+        return last
+    return "O" if last == "X" else "X"
+
+
+def encode_game(dimension, end_condition_length, first, winner, x_player, o_player, moves):
+    header = np.zeros(1, dtype=GAME_HEADER)
+    header[0] = (dimension, end_condition_length, MARKS.index(first), WINNERS.index(winner), x_player, o_player,
+                 len(moves))
+    cells = np.array([row * dimension + col for row, col in moves], dtype=cell_dtype(dimension))
+    return header.tobytes() + cells.tobytes()
+
+
+# Offset just past the game that starts at offset.
+def game_end(data, offset):
+    header = np.frombuffer(bytes(data[offset:offset + GAME_HEADER.itemsize]), dtype=GAME_HEADER)[0]
+    return offset + GAME_HEADER.itemsize + int(header["num_moves"]) * cell_size(int(header["dimension"]))
+
+
+# Start offsets of the games of data found after offset start.
+def scan_offsets(data, start):
+    offsets = []
+    position = start
+    while position + GAME_HEADER.itemsize <= len(data):
+        end = game_end(data, position)
+        if end > len(data):
+            # a game cut short by a killed writer
+            break
+        offsets.append(position)
+        position = end
+    return offsets
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+# Offsets of all complete games in the record file, taken from the index and extended from the records if the
+# index is behind. Rewrites the index when it had to be extended.
+def load_index(path, data, header_length):
+    offsets = np.zeros(0, dtype="<u8")
+    if os.path.exists(index_path(path)) and os.path.getsize(index_path(path)) >= 8:
+        offsets = np.fromfile(index_path(path), dtype="<u8")
+    start = header_length
+    if len(offsets) > 0:
+        start = game_end(data, int(offsets[-1]))
+    if start < len(data):
+        missing = scan_offsets(data, start)
+        if missing:
+            offsets = np.concatenate((offsets, np.array(missing, dtype="<u8")))
+            offsets.tofile(index_path(path))
+    return offsets
+
+
+class GameRecordWriter:
+
+    # Opens path for appending, creating it with the player name table players if it does not exist yet. Players
+    # that are not in the table of an existing file can not be recorded into it.
+    def __init__(self, path, players):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                data = f.read()
+            self.players, header_length = decode_file_header(data)
+            missing = [name for name in players if name not in self.players]
+            if missing:
+                raise ValueError("{} holds games of {}, not of {}".format(path, self.players, missing))
+            # bring the index up to date and drop a game a killed writer left half written
+            offsets = load_index(path, data, header_length)
+            end = header_length if len(offsets) == 0 else game_end(data, int(offsets[-1]))
+            if end < len(data):
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+            self.size = end
+        else:
+            if len(players) > 255:
+                raise ValueError("At most 255 players per record file")
+            self.players = list(dict.fromkeys(players))
+            with open(path, "wb") as f:
+                f.write(encode_file_header(self.players))
+            with open(index_path(path), "wb"):
+                pass
+            self.size = os.path.getsize(path)
+        self.records = open(path, "ab")
+        self.index = open(index_path(path), "ab")
+
+    def append(self, moves, dimension, end_condition_length, winner, x_player, o_player, first="X"):
+        data = encode_game(dimension, end_condition_length, first, winner, self.players.index(x_player),
+                           self.players.index(o_player), moves)
+        self.records.write(data)
+        self.records.flush()
+        self.index.write(np.array([self.size], dtype="<u8").tobytes())
+        self.index.flush()
+        self.size += len(data)
+
+    def append_game(self, game_state, x_player, o_player):
+        self.append(game_state.moves, game_state.grid.dimension, game_state.end_condition_length,
+                    game_state.winner, x_player, o_player, first_mark(game_state))
+
+    # GameState.game_over_hook recording the games with the given player names.
+    def game_over_hook(self, x_player, o_player):
+        def record(game_state):
+            self.append_game(game_state, x_player, o_player)
+        return record
+
+    def close(self):
+        self.records.close()
+        self.index.close()
+
+
+class GameRecord:
+
+    def __init__(self, players, header, cells):
+        self.dimension = int(header["dimension"])
+        self.end_condition_length = int(header["end_condition_length"])
+        self.first = MARKS[header["first"]]
+        self.winner = WINNERS[header["winner"]]
+        self.x_player = players[header["x_player"]]
+        self.o_player = players[header["o_player"]]
+        # cell indices of the moves, a view into the memory mapped file
+        self.cells = cells
+
+    def __len__(self):
+        return len(self.cells)
+
+    def moves(self):
+        return [(int(cell) // self.dimension, int(cell) % self.dimension) for cell in self.cells]
+
+    # Plays the game again, returns the final game state and the winning streak of the last move.
+    def replay(self):
+        game_state = gl.GameState(self.dimension, self.first, self.end_condition_length, 1, bot_move_draw_delay=0)
+        winning_streak = None
+        for move in self.moves():
+            if not game_state.game_running:
+                raise ValueError("Moves recorded after the end of the game")
+            _, _, _, winning_streak = game_state.play_turn(move)
+        return game_state, winning_streak
+
+
+class GameRecords:
+
+    def __init__(self, path):
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        self.players, header_length = decode_file_header(self.data)
+        self.offsets = load_index(path, self.data, header_length)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.offsets)
+        if not 0 <= i < len(self.offsets):
+            raise IndexError("Game index out of range")
+        start = int(self.offsets[i])
+        header = self.data[start:start + GAME_HEADER.itemsize].view(GAME_HEADER)[0]
+        dimension = int(header["dimension"])
+        cells_start = start + GAME_HEADER.itemsize
+        cells = self.data[cells_start:cells_start + int(header["num_moves"]) * cell_size(dimension)]
+        return GameRecord(self.players, header, cells.view(cell_dtype(dimension)))
+
+    def __iter__(self):
+        for i in range(0, len(self.offsets)):
+            yield self[i]
+
+    # Game headers of all games as a NumPy structured array (fields as in GAME_HEADER).
+    def headers(self):
+        starts = self.offsets.astype(np.int64)
+        gathered = self.data[starts[:, None] + np.arange(GAME_HEADER.itemsize)]
+        return np.ascontiguousarray(gathered).view(GAME_HEADER).reshape(-1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarizes and checks a game record file.")
+    parser.add_argument("path", metavar="file", type=str, help="Game record file.")
+    parser.add_argument("--verify", action="store_true", help="Replay every game and compare the winners.")
+    parser.add_argument("--show", metavar="i", type=int, default=None, help="Print the final board of game i.")
+    args = parser.parse_args()
+
+    records = GameRecords(args.path)
+    headers = records.headers()
+    print("{} games, players {}".format(len(records), records.players))
+    if len(records) > 0:
+        winners = np.bincount(headers["winner"], minlength=3)
+        print("X won {}, O won {}, draws {}, {:.1f} moves per game".format(
+            winners[1], winners[2], winners[0], headers["num_moves"].mean()))
+    if args.show is not None:
+        record = records[args.show]
+        game_state, winning_streak = record.replay()
+        print("{} (X) vs {} (O), winner {}, streak {}".format(record.x_player, record.o_player, record.winner,
+                                                               winning_streak))
+        print(game_state.grid.grid_to_string())
+    if args.verify:
+        mismatches = 0
+        for i, record in enumerate(records):
+            game_state, _ = record.replay()
+            if game_state.game_running or game_state.winner != record.winner:
+                mismatches += 1
+                print("Game {} replays to winner {}, recorded {}".format(i, game_state.winner, record.winner))
+        print("{} of {} games replay to their recorded result".format(len(records) - mismatches, len(records)))
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+"""
+Hosts many concurrent games over TCP or a Unix socket, one JSON object per line in both directions.
+
+Every game is a GameState session in the server process. Bot moves are searched on a bounded process pool (each
+worker keeps its bots between moves, so caches stay warm) and the event loop only replays the returned move, so a
+slow search never stalls the other games. Requests carry an "id" that is echoed in the response, and the requests of
+one connection are served concurrently:
+
+{"id": 1, "op": "new", "dimension": 7, "score": 4, "bot": "minimax", "bot_plays": "O", "time_ms": 200}
+{"id": 2, "op": "move", "game": 1, "move": [3, 3]}   -> the bot's reply in "bot_move"
+{"id": 3, "op": "state", "game": 1}
+{"id": 4, "op": "close", "game": 1}
+{"id": 5, "op": "stats"}                            -> per op latency percentiles, sessions, pending bot moves
+
+Backpressure: a connection stops being read while it has max_in_flight unanswered requests, bot moves wait for one
+of max_pending pool slots, responses wait for the socket to drain and new games are refused above max_games. The
+games a connection created are closed when it disconnects, and a move whose bot reply fails is taken back.
+
+From the project directory, serve on port 8765 with 4 bot workers (see loadClient.py for a load generator):
+python gameServer.py --port 8765 --workers 4
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import time
+
+import gameLogic as gl
+from ticTacToe import bot_options
+
+# Latencies kept per op for the percentiles.
+LATENCY_WINDOW = 10000
+
+# Bots of the worker process, reused between moves.
+_worker_bots = {}
+
+
+# Searches one bot move in a worker process, task = (bot, computation_time_ms, dimension, score, first_turn, moves).
+def bot_move(task):
+    name, computation_time_ms, dimension, end_condition_length, first_turn, moves = task
+    key = (name, computation_time_ms)
+    if key not in _worker_bots:
+        bot = bot_options[name]()
+        if computation_time_ms is not None and hasattr(bot, "computation_time_ms"):
+            bot.computation_time_ms = computation_time_ms
+        _worker_bots[key] = bot
+    game_state = gl.GameState(dimension, first_turn, end_condition_length, 1, bot_move_draw_delay=0)
+    for move in moves:
+        game_state.play_turn(tuple(move))
+    return tuple(int(x) for x in _worker_bots[key].get_move(game_state))
+
+
+class RequestError(Exception):
+    pass
+
+
+class Client:
+
+    def __init__(self, writer):
+        self.writer = writer
+        # responses of concurrently served requests are written one at a time
+        self.write_lock = asyncio.Lock()
+        # ids of the games created on this connection, closed when it goes away
+        self.games = set()
+
+
+class Session:
+
+    def __init__(self, game_id, owner, dimension, end_condition_length, bot, bot_plays, computation_time_ms):
+        self.game_id = game_id
+        # Client that created the game
+        self.owner = owner
+        self.game_state = gl.GameState(dimension, "X", end_condition_length, 1, bot_move_draw_delay=0)
+        self.bot = bot
+        self.bot_plays = bot_plays
+        self.computation_time_ms = computation_time_ms
+        # requests of one game are served one at a time
+        self.lock = asyncio.Lock()
+
+    def summary(self):
+        game_state = self.game_state
+        return {"game": self.game_id,
+                "turn": game_state.turn,
+                "running": game_state.game_running,
+                "winner": game_state.winner}
+
+
+class LatencyStats:
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self.counts = collections.Counter()
+        self.errors = collections.Counter()
+
+    def record(self, op, seconds, ok=True):
+        self.latencies[op].append(seconds)
+        self.counts[op] += 1
+        if not ok:
+            self.errors[op] += 1
+
+    def summary(self):
+        ops = {}
+        for op, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            ops[op] = {"count": self.counts[op],
+                       "errors": self.errors[op],
+                       "p50_ms": round(1000 * percentile(ordered, 0.5), 3),
+                       "p95_ms": round(1000 * percentile(ordered, 0.95), 3),
+                       "p99_ms": round(1000 * percentile(ordered, 0.99), 3),
+                       "max_ms": round(1000 * ordered[-1], 3)}
+        return ops
+
+
+# q-quantile of an ascending list (nearest rank).
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class GameServer:
+
+    def __init__(self, workers=None, max_games=10000, max_pending=None, max_in_flight=64, max_time_ms=5000):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.max_games = max_games
+        # bot moves queued on the pool at most, more wait for a slot
+        self.bot_slots = asyncio.Semaphore(2 * self.workers if max_pending is None else max_pending)
+        self.pending_moves = 0
+        self.max_in_flight = max_in_flight
+        self.max_time_ms = max_time_ms
+        self.sessions = {}
+        self.next_game_id = 1
+        self.stats = LatencyStats()
+        self.server = None
+        # connection handler task -> its Client
+        self.connections = {}
+
+    async def start(self, host="127.0.0.1", port=8765, unix_path=None):
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # the handlers see the end of their streams and finish
+            for client in self.connections.values():
+                client.writer.close()
+            if self.connections:
+                await asyncio.wait(list(self.connections))
+            await self.server.wait_closed()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        handler = asyncio.current_task()
+        client = Client(writer)
+        self.connections[handler] = client
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        try:
+            while True:
+                # stop reading while the connection has max_in_flight requests open
+                await in_flight.acquire()
+                line = await reader.readline()
+                if not line:
+                    in_flight.release()
+                    break
+                task = asyncio.ensure_future(self.serve_line(line, client))
+                tasks.add(task)
+                task.add_done_callback(lambda done: (tasks.discard(done), in_flight.release()))
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            del self.connections[handler]
+            # nobody can reach the games of the connection any more
+            for game_id in client.games:
+                self.sessions.pop(game_id, None)
+
+    async def serve_line(self, line, client):
+        start_time = time.perf_counter()
+        op, request = "invalid", None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("Request must be a JSON object")
+            op = str(request.get("op", "invalid"))
+            response = await self.handle_request(op, request, client)
+            response.update({"id": request.get("id"), "ok": True})
+        except (RequestError, ValueError, TypeError) as error:
+            response = {"ok": False, "error": str(error)}
+        except Exception as error:
+            # e.g. a bot failing in the pool, the game and the connection stay usable
+            response = {"ok": False, "error": "Internal error: {!r}".format(error)}
+        if not response["ok"]:
+            response["id"] = request.get("id") if isinstance(request, dict) else None
+        self.stats.record(op if op in REQUEST_OPS else "invalid", time.perf_counter() - start_time, response["ok"])
+        async with client.write_lock:
+            client.writer.write((json.dumps(response) + "\n").encode())
+            await client.writer.drain()
+
+    async def handle_request(self, op, request, client):
+        if op not in REQUEST_OPS:
+            raise RequestError("Unknown op: {}".format(op))
+        return await getattr(self, REQUEST_OPS[op])(request, client)
+
+    def session(self, request):
+        session = self.sessions.get(request.get("game"))
+        if session is None:
+            raise RequestError("Unknown game: {}".format(request.get("game")))
+        return session
+
+    async def new_game(self, request, client):
+        if len(self.sessions) >= self.max_games:
+            raise RequestError("Server full: {} games".format(self.max_games))
+        dimension = int(request.get("dimension", 3))
+        end_condition_length = int(request.get("score", 3))
+        bot = request.get("bot", "minimax")
+        bot_plays = request.get("bot_plays", "O")
+        if not 3 <= dimension <= 19 or not 1 <= end_condition_length <= dimension:
+            raise RequestError("Bad board: {}x{} with {} to win".format(dimension, dimension, end_condition_length))
+        if bot not in bot_options or bot is None:
+            raise RequestError("Unknown bot: {}".format(bot))
+        if bot_plays not in ("X", "O"):
+            raise RequestError("bot_plays must be X or O")
+        computation_time_ms = min(int(request.get("time_ms", 1000)), self.max_time_ms)
+        session = Session(self.next_game_id, client, dimension, end_condition_length, bot, bot_plays,
+                          computation_time_ms)
+        self.sessions[session.game_id] = session
+        client.games.add(session.game_id)
+        self.next_game_id += 1
+        response = {}
+        async with session.lock:
+            if bot_plays == "X":
+                try:
+                    response["bot_move"] = await self.play_bot(session)
+                except BaseException:
+                    # a game nobody can move in
+                    self.drop_session(session)
+                    raise
+        response.update(session.summary())
+        return response
+
+    async def move(self, request, client):
+        session = self.session(request)
+        move = request.get("move")
+        if not isinstance(move, list) or len(move) != 2:
+            raise RequestError("move must be [row, col]")
+        move = (int(move[0]), int(move[1]))
+        async with session.lock:
+            game_state = session.game_state
+            if not game_state.game_running:
+                raise RequestError("Game {} is over".format(session.game_id))
+            if game_state.turn == session.bot_plays:
+                raise RequestError("Not your turn")
+            if not (game_state.grid.is_valid_coord(move) and game_state.grid.is_free(move)):
+                raise RequestError("Illegal move: {}".format(list(move)))
+            game_state.play_turn(move)
+            response = {}
+            if game_state.game_running:
+                try:
+                    response["bot_move"] = await self.play_bot(session)
+                except BaseException:
+                    # take the move back, so that the client can send it again
+                    game_state.backtrack_move(move)
+                    raise
+            response.update(session.summary())
+        return response
+
+    async def state(self, request, client):
+        session = self.session(request)
+        response = session.summary()
+        game_state = session.game_state
+        response.update({"dimension": game_state.grid.dimension,
+                         "score": game_state.end_condition_length,
+                         "bot": session.bot,
+                         "bot_plays": session.bot_plays,
+                         "moves": [list(move) for move in game_state.moves]})
+        return response
+
+    async def close_game(self, request, client):
+        session = self.session(request)
+        self.drop_session(session)
+        return session.summary()
+
+    def drop_session(self, session):
+        self.sessions.pop(session.game_id, None)
+        session.owner.games.discard(session.game_id)
+
+    async def server_stats(self, request, client):
+        return {"games": len(self.sessions),
+                "workers": self.workers,
+                "pending_bot_moves": self.pending_moves,
+                "ops": self.stats.summary()}
+
+    # Searches the bot's move on the pool and plays it, the session lock is held by the caller.
+    async def play_bot(self, session):
+        game_state = session.game_state
+        first_turn = game_state.turn if len(game_state.moves) % 2 == 0 else ("O" if game_state.turn == "X" else "X")
+        task = (session.bot, session.computation_time_ms, game_state.grid.dimension,
+                game_state.end_condition_length, first_turn, [list(move) for move in game_state.moves])
+        self.pending_moves += 1
+        try:
+            async with self.bot_slots:
+                move = await asyncio.get_running_loop().run_in_executor(self.pool, bot_move, task)
+        finally:
+            self.pending_moves -= 1
+        game_state.play_turn(move)
+        return list(move)
+
+
+# op -> GameServer coroutine method serving it
+REQUEST_OPS = {"new": "new_game",
+               "move": "move",
+               "state": "state",
+               "close": "close_game",
+               "stats": "server_stats"}
+
+
+async def serve(host, port, unix_path, workers, max_games, max_pending, max_in_flight, max_time_ms):
+    game_server = GameServer(workers, max_games, max_pending, max_in_flight, max_time_ms)
+    await game_server.start(host, port, unix_path)
+    print("Serving on {} with {} bot workers".format(unix_path or game_server.address(), game_server.workers),
+          flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await game_server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves Tic Tac Toe games as JSON lines.")
+    parser.add_argument("--host", metavar="h", type=str, default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", metavar="p", type=int, default=8765, help="TCP port to listen on.")
+    parser.add_argument("--unix", metavar="path", type=str, default=None, help="Listen on a Unix socket instead.")
+    parser.add_argument("--workers", metavar="w", type=int, default=None, help="Bot worker processes (default: cores).")
+    parser.add_argument("--max_games", metavar="n", type=int, default=10000, help="Concurrent games at most.")
+    parser.add_argument("--max_pending", metavar="n", type=int, default=None,
+                        help="Bot moves queued on the pool at most (default: 2 per worker).")
+    parser.add_argument("--max_in_flight", metavar="n", type=int, default=64,
+                        help="Unanswered requests per connection before it stops being read.")
+    parser.add_argument("--max_time_ms", metavar="t", type=int, default=5000, help="Cap of the bots' thinking time.")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.max_games, args.max_pending,
+                          args.max_in_flight, args.max_time_ms))
+    except KeyboardInterrupt:
+        pass
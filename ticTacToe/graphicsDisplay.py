@@ -6,10 +6,12 @@ from time import sleep
 
 class GraphicsDisplay(Frame):
 
-    def __init__(self, root, game_state, canvas_size=(1200, 800), analytics=False):
+    def __init__(self, root, game_state, canvas_size=(1200, 800), analytics=False, ponder=False):
         self.root = root
         self.game_state = game_state
         self.analytics = analytics
+        # let bots think while waiting for the human's click
+        self.ponder = ponder
         self.spacing_x = canvas_size[0] / game_state.grid.dimension
         self.spacing_y = canvas_size[1] / game_state.grid.dimension
         self.canvas_size = canvas_size
@@ -157,6 +159,7 @@ class GraphicsDisplay(Frame):
             print("All games finished!")
             exit(0)
         streak = None
+        moves_before = list(gs.moves)
         if not gs.game_running:
             # re-initialize game and re-draw board
             gs.initialize_game_state(
@@ -184,7 +187,14 @@ class GraphicsDisplay(Frame):
                 streak = __play_bot()
                 if not gs.game_running:
                     break
+            # a click off the board or on a taken square leaves the pondering of the position running
+            if self.ponder and gs.moves != moves_before:
+                gs.start_pondering()
+        else:
+            gs.stop_pondering()
 
+        if not gs.game_running:
+            gs.finish_game()
         # announce game has ended (draw streak)
         if not gs.game_running and gs.winner is not None:
             self.__draw_streak(streak[0], streak[1])
@@ -194,10 +204,11 @@ class GraphicsDisplay(Frame):
             self.update()
 
 
-def begin_graphics(game_state, analytics=False):
+def begin_graphics(game_state, analytics=False, ponder=False):
     root = Tk()
     root.resizable(False, False)
-    gui = GraphicsDisplay(root=root, game_state=game_state, canvas_size=(1200, 800), analytics=analytics)
+    gui = GraphicsDisplay(root=root, game_state=game_state, canvas_size=(1200, 800), analytics=analytics,
+                          ponder=ponder)
     root.mainloop()
 
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+Load generator for gameServer.py.
+
+Plays num_games games against the server's bot over a few connections, keeping up to concurrency games going at
+once. The client side plays random legal moves, so the server's bot moves (and its event loop) are what gets
+measured. Every request's round trip is timed and the client reports requests/s, games/s and latency percentiles,
+together with the server's own per op latencies.
+
+From the project directory, with the server running on port 8765:
+python loadClient.py --port 8765 --num_games 1000 --concurrency 200 --bot random
+Or start a server on a free localhost port for the run:
+python loadClient.py --local --workers 2 --num_games 200 -d 7 --score 4 --bot minimax --time_ms 50
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from gameServer import GameServer, percentile
+
+
+class Connection:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.waiting = {}
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    @staticmethod
+    async def open(host="127.0.0.1", port=8765, unix_path=None):
+        if unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return Connection(reader, writer)
+
+    # Responses come back in any order, they are matched to the requests by id.
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.waiting.pop(response.get("id"), None)
+            if future is not None:
+                future.set_result(response)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("Connection closed by the server"))
+
+    async def request(self, op, **fields):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        fields.update({"id": request_id, "op": op})
+        self.writer.write((json.dumps(fields) + "\n").encode())
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+
+# Plays one game with random moves as the side the bot does not play, returns the finished game's summary.
+async def play_game(connection, rng, latencies, dimension, end_condition_length, bot, time_ms):
+    def timed_request(op, **fields):
+        async def run():
+            start_time = time.perf_counter()
+            response = await connection.request(op, **fields)
+            latencies.append(time.perf_counter() - start_time)
+            if not response["ok"]:
+                raise RuntimeError("{} failed: {}".format(op, response["error"]))
+            return response
+        return run()
+
+    bot_plays = rng.choice(("X", "O"))
+    free = {(r, c) for r in range(0, dimension) for c in range(0, dimension)}
+    response = await timed_request("new", dimension=dimension, score=end_condition_length, bot=bot,
+                                   bot_plays=bot_plays, time_ms=time_ms)
+    game = response["game"]
+    while True:
+        if "bot_move" in response:
+            free.discard(tuple(response["bot_move"]))
+        if not response["running"]:
+            break
+        move = rng.choice(sorted(free))
+        free.discard(move)
+        response = await timed_request("move", game=game, move=list(move))
+    await timed_request("close", game=game)
+    return response
+
+
+async def run_load(host="127.0.0.1", port=8765, unix_path=None, num_games=100, concurrency=50, connections=4,
+                   dimension=3, end_condition_length=3, bot="random", time_ms=100, seed=0):
+    rng = random.Random(seed)
+    links = [await Connection.open(host, port, unix_path) for _ in range(0, connections)]
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    results = []
+
+    async def one_game(index):
+        async with slots:
+            results.append(await play_game(links[index % len(links)], random.Random(rng.random()), latencies,
+                                           dimension, end_condition_length, bot, time_ms))
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one_game(i) for i in range(0, num_games)))
+    elapsed = time.perf_counter() - start_time
+    server_stats = await links[0].request("stats")
+    for link in links:
+        await link.close()
+    ordered = sorted(latencies)
+    winners = [result["winner"] for result in results]
+    return {"games": len(results),
+            "requests": len(latencies),
+            "seconds": round(elapsed, 3),
+            "games_per_second": round(len(results) / elapsed, 2),
+            "requests_per_second": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(1000 * percentile(ordered, 0.5), 3),
+            "p95_ms": round(1000 * percentile(ordered, 0.95), 3),
+            "p99_ms": round(1000 * percentile(ordered, 0.99), 3),
+            "max_ms": round(1000 * ordered[-1], 3) if ordered else 0.0,
+            "x_wins": winners.count("X"),
+            "o_wins": winners.count("O"),
+            "draws": winners.count(None),
+            "server": server_stats["ops"]}
+
+
+# Starts a server on a free localhost port, runs the load against it and shuts it down.
+async def run_local(workers, **load):
+    game_server = GameServer(workers=workers)
+    await game_server.start("127.0.0.1", 0)
+    try:
+        return await run_load("127.0.0.1", game_server.address()[1], **load)
+    finally:
+        await game_server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates load on a Tic Tac Toe game server.")
+    parser.add_argument("--host", metavar="h", type=str, default="127.0.0.1", help="Server address.")
+    parser.add_argument("--port", metavar="p", type=int, default=8765, help="Server TCP port.")
+    parser.add_argument("--unix", metavar="path", type=str, default=None, help="Server Unix socket instead.")
+    parser.add_argument("--local", action="store_true", help="Start a server on a free localhost port for the run.")
+    parser.add_argument("--workers", metavar="w", type=int, default=None, help="Bot workers of the --local server.")
+    parser.add_argument("--num_games", metavar="n", type=int, default=100, help="Games to play.")
+    parser.add_argument("--concurrency", metavar="c", type=int, default=50, help="Games going at once.")
+    parser.add_argument("--connections", metavar="n", type=int, default=4, help="Connections the games share.")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=3, help="Board dimension.")
+    parser.add_argument("--score", metavar="s", type=int, default=3, help="How many marks straight are needed for win.")
+    parser.add_argument("--bot", metavar="b", type=str, default="random", help="Server bot (random/minimax/mcts/pns).")
+    parser.add_argument("--time_ms", metavar="t", type=int, default=100, help="Thinking time of the server bot.")
+    parser.add_argument("--seed", metavar="s", type=int, default=0, help="Seed of the client's moves.")
+    args = parser.parse_args()
+
+    load = dict(num_games=args.num_games, concurrency=args.concurrency, connections=args.connections,
+                dimension=args.dim, end_condition_length=args.score, bot=args.bot, time_ms=args.time_ms,
+                seed=args.seed)
+    if args.local:
+        report = asyncio.run(run_local(args.workers, **load))
+    else:
+        report = asyncio.run(run_load(args.host, args.port, args.unix, **load))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Generates training data by letting a bot play itself on a process pool.
+
+Every position a bot moves in becomes one training sample:
+
+    board       (2, N, N) uint8, the X marks and the O marks
+    to_move     int8, 1 if X is to move, -1 if O is
+    value       float32, the search's value of the position for the side to move in [-1, 1] (NaN if the move did
+                not come from a search, see Player.search_policy)
+    policy      (N * N,) float32, the search's move distribution (MCTS root visits, all weight on the played move
+                for the other bots)
+    outcome     int8, the final result for the side to move (1 win, 0 draw, -1 loss)
+    game        int64, index of the game
+
+The first random_moves plies of every game are played at random (and not recorded), so that deterministic bots do
+not repeat the same game. Samples are written in game order into shards of exactly shard_size positions
+(shard_00000.npz, ...). After every shard the positions left over are saved in pending.npz together with the run's
+progress (the number of finished games, shards and positions), in one atomic replace, so a killed run started again
+with the same arguments carries on from the last shard, and a finished run can be extended by asking for more games.
+progress.json is a readable copy of the progress. Games are seeded by their index, so with the default
+bot options only the bots' time budgets make two runs differ.
+
+From the project directory, generate the data of 1000 games of mcts vs mcts on a 7x7 board with 4 to win:
+python selfPlay.py data/mcts7 --bot mcts -d 7 --score 4 --num_games 1000 --time_ms 200 --shard_size 4096
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import gameLogic as gl
+from evaluatePositions import make_bot
+from ticTacToe import bot_options
+
+FIELDS = ("board", "to_move", "value", "policy", "outcome", "game")
+PROGRESS_FILE = "progress.json"
+PENDING_FILE = "pending.npz"
+
+# Bots of the worker process, one per side so that tree reuse sees only its own moves.
+_worker_bots = {}
+
+
+def _get_bot(mark, name, computation_time_ms, max_depth, max_sims):
+    key = (mark, name, computation_time_ms, max_depth, max_sims)
+    if key not in _worker_bots:
+        bot = make_bot(name, computation_time_ms, max_depth)
+        if max_sims is not None and hasattr(bot, "max_sims"):
+            bot.max_sims = max_sims
+        _worker_bots[key] = bot
+    return _worker_bots[key]
+
+
+# Plays one self-play game and returns its samples as a dict of arrays (see FIELDS).
+def play_game(task):
+    game_index, bot, dimension, end_condition_length, computation_time_ms, max_depth, max_sims, random_moves, \
+        seed = task
+    rng = random.Random(seed * 1000003 + game_index)
+    random.seed(rng.getrandbits(64))
+    np.random.seed(rng.getrandbits(32))
+    players = {mark: _get_bot(mark, bot, computation_time_ms, max_depth, max_sims) for mark in ("X", "O")}
+    game_state = gl.GameState(dimension, "X", end_condition_length, 1, bot_move_draw_delay=0)
+    num_cells = game_state.grid.num_cells
+    boards, to_move, values, policies = [], [], [], []
+    while game_state.game_running:
+        if len(game_state.moves) < random_moves:
+            game_state.play_turn(rng.choice(sorted(game_state.grid.possible_moves)))
+            continue
+        grid = game_state.grid
+        board = np.zeros((2, num_cells), dtype=np.uint8)
+        board[0, grid.mask_to_indexes(grid.x_bits)] = 1
+        board[1, grid.mask_to_indexes(grid.o_bits)] = 1
+        move = players[game_state.turn].get_move(game_state)
+        searched = players[game_state.turn].search_policy(game_state)
+        if searched is None:
+            value, policy = np.nan, np.zeros(num_cells)
+            policy[grid.coord_to_index(move)] = 1.0
+        else:
+            value, policy = searched
+        boards.append(board.reshape((2, dimension, dimension)))
+        to_move.append(1 if game_state.turn == "X" else -1)
+        values.append(value)
+        policies.append(policy)
+        game_state.play_turn(move)
+    to_move = np.array(to_move, dtype=np.int8)
+    winner = {"X": 1, "O": -1, None: 0}[game_state.winner]
+    return {"board": np.array(boards, dtype=np.uint8).reshape((-1, 2, dimension, dimension)),
+            "to_move": to_move,
+            "value": np.array(values, dtype=np.float32),
+            "policy": np.array(policies, dtype=np.float32).reshape((-1, num_cells)),
+            "outcome": (to_move * winner).astype(np.int8),
+            "game": np.full(len(to_move), game_index, dtype=np.int64)}
+
+
+def empty_samples(dimension):
+    return {"board": np.zeros((0, 2, dimension, dimension), dtype=np.uint8),
+            "to_move": np.zeros(0, dtype=np.int8),
+            "value": np.zeros(0, dtype=np.float32),
+            "policy": np.zeros((0, dimension**2), dtype=np.float32),
+            "outcome": np.zeros(0, dtype=np.int8),
+            "game": np.zeros(0, dtype=np.int64)}
+
+
+def concatenate(parts):
+    return {field: np.concatenate([part[field] for part in parts]) for field in FIELDS}
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, "shard_{:05d}.npz".format(shard))
+
+
+# Writes arrays to path through a temporary file, so that path is either the old or the complete new file.
+def save_npz(path, arrays):
+    temporary = path + ".tmp.npz"
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+# Saves the pending samples and the progress of the run (a JSON string in pending.npz, which is what a resumed run
+# reads), then the readable copy progress.json.
+def save_progress(directory, progress, pending):
+    save_npz(os.path.join(directory, PENDING_FILE), dict(pending, progress=np.array(json.dumps(progress))))
+    temporary = os.path.join(directory, PROGRESS_FILE + ".tmp")
+    with open(temporary, "w") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(temporary, os.path.join(directory, PROGRESS_FILE))
+
+
+# (progress, pending samples) of the run in directory, or None if there is none.
+def read_pending(directory):
+    path = os.path.join(directory, PENDING_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as pending:
+        return json.loads(str(pending["progress"])), {field: pending[field] for field in FIELDS}
+
+
+# (progress, pending samples) of an earlier run in directory, or of a new run with config.
+def load_progress(directory, config):
+    saved = read_pending(directory)
+    if saved is None:
+        return {"config": config, "games": 0, "shards": 0, "positions": 0}, empty_samples(config["dimension"])
+    progress, pending = saved
+    if progress["config"] != config:
+        raise ValueError("{} holds data generated with {}".format(directory, progress["config"]))
+    return progress, pending
+
+
+# Progress with the positions generated by this run and their rate.
+def run_report(progress, generated, start_time):
+    elapsed = time.time() - start_time
+    report = dict(progress, generated=generated, seconds=round(elapsed, 3),
+                  positions_per_second=round(generated / max(elapsed, 1e-9), 1))
+    report.pop("config")
+    return report
+
+
+# Plays games until num_games games are done in total, writing full shards as they fill. on_shard is called with the
+# run report (see run_report) after every shard. Returns the final run report.
+def generate(directory, bot, dimension=3, end_condition_length=3, num_games=100, workers=None, shard_size=4096,
+             computation_time_ms=None, max_depth=None, max_sims=None, random_moves=0, seed=0, on_shard=None):
+    config = {"bot": bot, "dimension": dimension, "end_condition_length": end_condition_length,
+              "computation_time_ms": computation_time_ms, "max_depth": max_depth, "max_sims": max_sims,
+              "random_moves": random_moves, "seed": seed, "shard_size": shard_size}
+    os.makedirs(directory, exist_ok=True)
+    progress, pending = load_progress(directory, config)
+    parts, buffered = [pending], len(pending["game"])
+    generated = 0
+    start_time = time.time()
+    tasks = [(i, bot, dimension, end_condition_length, computation_time_ms, max_depth, max_sims, random_moves, seed)
+             for i in range(progress["games"], num_games)]
+    workers = mp.cpu_count() if workers is None else workers
+    with mp.Pool(processes=workers) as pool:
+        # in game order, so that a resumed run writes the same shards
+        for samples in pool.imap(play_game, tasks):
+            parts.append(samples)
+            buffered += len(samples["game"])
+            generated += len(samples["game"])
+            progress["games"] += 1
+            if buffered < shard_size:
+                continue
+            data = concatenate(parts)
+            while len(data["game"]) >= shard_size:
+                save_npz(shard_path(directory, progress["shards"]), {f: data[f][:shard_size] for f in FIELDS})
+                data = {f: data[f][shard_size:] for f in FIELDS}
+                progress["shards"] += 1
+                progress["positions"] += shard_size
+            parts, buffered = [data], len(data["game"])
+            save_progress(directory, progress, data)
+            if on_shard is not None:
+                on_shard(run_report(progress, generated, start_time))
+    save_progress(directory, progress, concatenate(parts))
+    return run_report(progress, generated, start_time)
+
+
+# All samples of directory in order as one dict of arrays, the positions not yet in a full shard included if
+# pending is True.
+def load_dataset(directory, pending=True):
+    saved = read_pending(directory)
+    if saved is None:
+        raise FileNotFoundError("No self-play run in {}".format(directory))
+    progress, pending_samples = saved
+    parts = []
+    for shard in range(0, progress["shards"]):
+        with np.load(shard_path(directory, shard)) as data:
+            parts.append({field: data[field] for field in FIELDS})
+    if pending:
+        parts.append(pending_samples)
+    if not parts:
+        return empty_samples(progress["config"]["dimension"])
+    return concatenate(parts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates self-play training data in sharded .npz files.")
+    parser.add_argument("output", metavar="dir", type=str, help="Directory of the shards (resumed if it has some).")
+    parser.add_argument("--bot", metavar="b", type=str, default="mcts", help="Bot playing itself.")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=3, help="Create a N by N game board.")
+    parser.add_argument("--score", metavar="s", type=int, default=3, help="How many marks straight are needed for win.")
+    parser.add_argument("--num_games", metavar="n", type=int, default=100, help="Games to have played in total.")
+    parser.add_argument("--workers", metavar="w", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--shard_size", metavar="n", type=int, default=4096, help="Positions per shard.")
+    parser.add_argument("--time_ms", metavar="t", type=int, default=None, help="Thinking time per move.")
+    parser.add_argument("--depth", metavar="d", type=int, default=None, help="Search depth (minimax).")
+    parser.add_argument("--sims", metavar="n", type=int, default=None, help="Simulations per move (mcts).")
+    parser.add_argument("--random_moves", metavar="n", type=int, default=0,
+                        help="Random (unrecorded) opening plies of every game.")
+    parser.add_argument("--seed", metavar="s", type=int, default=0, help="Seed of the games.")
+    args = parser.parse_args()
+
+    if args.bot not in bot_options or args.bot is None:
+        raise ValueError("Unknown bot: {}".format(args.bot))
+
+    def report(progress):
+        print("{} games, {} shards, {:.1f} positions/s".format(progress["games"], progress["shards"],
+                                                               progress["positions_per_second"]), file=sys.stderr)
+
+    final = generate(args.output, args.bot, args.dim, args.score, args.num_games, args.workers, args.shard_size,
+                     args.time_ms, args.depth, args.sims, args.random_moves, args.seed, report)
+    print(json.dumps(final, indent=2))
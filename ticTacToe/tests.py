@@ -4,8 +4,35 @@
 """
 Run some tests.
 """
+import asyncio
+import concurrent.futures
+import math
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
 import unittest
+from multiprocessing import shared_memory
+import numpy as np
 import gameLogic as Gl
+from bots import parallelMcts, solver
+from bots.mcts import MCTSBot, MCTSTree, unique_moves
+from bots.minimax import AlphaBetaBot
+from bots.pns import ProofNumberSearch, PNSBot, WIN, DRAW
+from bots.threatSearch import ThreatSearch
+from bots.utils.batchHeuristic import batch_heuristic, stack_game_states
+from bots.utils.batchRollout import batch_rollout
+from bots.utils import openingBook
+from bots.utils.minimaxUtils import heuristic_with_features, prune_possible_moves
+from bots.utils.transpositionTable import TranspositionTable, EXACT, LOWER_BOUND, REPLACE_ALWAYS
+import benchmark
+import evaluatePositions
+import gameRecords
+import gameServer
+import loadClient
+import selfPlay
+import tournament
 
 """
 Grid tests.
@@ -52,14 +79,916 @@ class TestGridWinningConditions(unittest.TestCase):
                         "\n" + self.bigGrid.grid_to_string())
 
 
+class TestGridBitboards(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = Gl.Grid(dimension=5)
+
+    def test_place_and_remove(self):
+        self.grid.place_mark((1, 2), "X")
+        self.grid.place_mark((1, 2), "O")
+        self.assertEqual(self.grid.get_mark((1, 2)), "X")
+        self.assertFalse(self.grid.is_free((1, 2)))
+        self.assertNotIn((1, 2), self.grid.possible_moves)
+        self.grid.remove_mark((1, 2))
+        self.assertTrue(self.grid.is_free((1, 2)))
+        self.assertEqual(self.grid.occupied(), 0)
+        self.assertIn((1, 2), self.grid.possible_moves)
+
+    def test_neighbourhood_does_not_wrap_rows(self):
+        self.grid.place_mark((1, 4), "O")
+        near = set(self.grid.mask_to_coords(self.grid.neighbourhood(2)))
+        self.assertEqual(near, {(0, 3), (0, 4), (1, 3), (2, 3), (2, 4)})
+
+    def test_frontier_follows_place_and_remove(self):
+        self.grid.place_mark((0, 0), "X")
+        self.assertEqual(self.grid.frontier(2), {(0, 1), (1, 0), (1, 1)})
+        self.grid.place_mark((1, 1), "O")
+        self.assertEqual(self.grid.frontier(2), set(self.grid.mask_to_coords(self.grid.neighbourhood(2))))
+        self.grid.remove_mark((0, 0))
+        self.assertEqual(self.grid.frontier(2), set(self.grid.mask_to_coords(self.grid.neighbourhood(2))))
+        self.assertIn((0, 0), self.grid.frontier(2))
+        self.grid.remove_mark((1, 1))
+        self.assertEqual(self.grid.frontier(2), set())
+
+    def test_line_counts_follow_place_and_remove(self):
+        for coord in [(0, 1), (1, 1), (2, 1)]:
+            self.grid.place_mark(coord, "X")
+        self.assertEqual(self.grid.test_coordinate_for_win((3, 1), "X", 4, look_ahead=True), (True, ((3, 1), (0, 1))))
+        self.grid.place_mark((3, 1), "O")
+        self.assertTrue(self.grid.test_coordinate_for_win((3, 1), "X", 4, look_ahead=True)[0])
+        self.assertFalse(self.grid.test_coordinate_for_win((3, 1), "O", 4)[0])
+        self.grid.remove_mark((1, 1))
+        self.assertFalse(self.grid.test_coordinate_for_win((3, 1), "X", 4, look_ahead=True)[0])
+        self.grid.place_mark((1, 1), "X")
+        self.grid.remove_mark((3, 1))
+        self.grid.place_mark((3, 1), "X")
+        self.assertEqual(self.grid.test_coordinate_for_win((1, 1), "X", 4), (True, ((3, 1), (0, 1))))
+
+    def test_completing_cells_follow_place_and_remove(self):
+        self.grid.place_mark((2, 1), "X")
+        self.grid.place_mark((2, 2), "X")
+        self.assertEqual(self.grid.completing_cells("X", 3), {10: 1, 13: 1})
+        self.grid.place_mark((2, 3), "O")
+        self.assertEqual(self.grid.completing_cells("X", 3), {10: 1})
+        self.grid.place_mark((1, 0), "X")
+        self.grid.place_mark((0, 1), "X")
+        self.assertEqual(self.grid.completing_cells("X", 3), {10: 1, 17: 1, 6: 1})
+        self.grid.place_mark((1, 2), "X")
+        self.assertEqual(self.grid.completing_cells("X", 3), {10: 1, 17: 2, 6: 2, 2: 1, 3: 1, 15: 1})
+        self.grid.remove_mark((2, 3))
+        self.assertEqual(self.grid.completing_cells("X", 3), {10: 1, 17: 2, 6: 2, 2: 1, 3: 1, 15: 1, 13: 2})
+        self.assertEqual(self.grid.completing_cells("O", 3), {})
+        self.grid.clear_grid()
+        self.assertEqual(self.grid.completing_cells("X", 3), {})
+
+
+"""
+GameState tests.
+"""
+
+
+class TestGameStateHashing(unittest.TestCase):
+
+    def setUp(self):
+        self.game_state = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+
+    def test_transpositions_share_key(self):
+        gs = self.game_state
+        empty_key = hash(gs)
+        for move in [(0, 0), (1, 1), (2, 2), (3, 3)]:
+            gs.play_turn(move)
+        key = hash(gs)
+        for move in [(3, 3), (2, 2), (1, 1), (0, 0)]:
+            gs.backtrack_move(move)
+        self.assertEqual(hash(gs), empty_key)
+        for move in [(2, 2), (3, 3), (0, 0), (1, 1)]:
+            gs.play_turn(move)
+        self.assertEqual(hash(gs), key)
+
+    def test_symmetric_positions_share_canonical_key(self):
+        gs = self.game_state
+        gs.play_turn((0, 1))
+        gs.play_turn((1, 1))
+        key, symmetry = gs.canonical_key()
+        images = Gl.symmetry_maps(4)[symmetry]
+        rotated = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+        for move in [(1, 3), (1, 2)]:  # the same moves rotated by 90 degrees
+            rotated.play_turn(move)
+        self.assertNotEqual(hash(rotated), hash(gs))
+        self.assertEqual(rotated.canonical_key()[0], key)
+        # the symmetry takes the position to the orientation whose plain key is the canonical one
+        canonical = Gl.Grid(dimension=4)
+        canonical.place_mark(canonical.index_to_coord(images[1]), "X")
+        canonical.place_mark(canonical.index_to_coord(images[5]), "O")
+        self.assertEqual(canonical.zobrist_key, key)
+        # corners, edges and centre squares of the empty board
+        self.assertEqual(len(unique_moves(Gl.Grid(dimension=4))), 3)
+
+    def test_side_to_move_changes_key(self):
+        gs = self.game_state
+        gs.play_turn((0, 0))
+        key = gs.zobrist_key
+        gs.turn = "X"
+        self.assertNotEqual(gs.zobrist_key, key)
+        self.assertLess(key, 2**64)
+
+
+"""
+Search utility tests.
+"""
+
+
+class TestTranspositionTable(unittest.TestCase):
+
+    def test_size_is_bounded(self):
+        tt = TranspositionTable(size_mb=1)
+        self.assertLessEqual(tt.num_entries * 22, 2**20)
+
+    def test_depth_preferred_replacement(self):
+        tt = TranspositionTable(size_mb=1)
+        key = 12345
+        other = key + tt.num_entries  # same slot
+        tt.store(key, 4, 1.5, EXACT, 7)
+        tt.store(other, 2, -3.0, LOWER_BOUND, 1)
+        self.assertEqual(tt.probe(key), (4, 1.5, EXACT, 7))
+        self.assertIsNone(tt.probe(other))
+        tt.new_search()
+        tt.store(other, 2, -3.0, LOWER_BOUND, 1)
+        self.assertEqual(tt.probe(other), (2, -3.0, LOWER_BOUND, 1))
+        self.assertEqual((tt.hits, tt.misses), (2, 1))
+
+    def test_always_replacement(self):
+        tt = TranspositionTable(size_mb=1, replacement=REPLACE_ALWAYS)
+        tt.store(5, 4, 1.0, EXACT, 0)
+        tt.store(5 + tt.num_entries, 0, 2.0, EXACT, 1)
+        self.assertIsNone(tt.probe(5))
+
+
+class TestMinimaxUtils(unittest.TestCase):
+
+    def test_pruning_leaves_board_untouched(self):
+        gs = Gl.GameState(dimension=5, turn="X", end_condition_length=4, num_games=1)
+        self.assertEqual(len(prune_possible_moves(gs)), 1)
+        self.assertEqual(len(gs.grid.possible_moves), 25)
+        gs.play_turn((2, 2))
+        moves = prune_possible_moves(gs)
+        self.assertEqual(len(moves), 8)
+        gs.play_turn(moves.pop())
+        self.assertEqual(len(moves), 7)
+        self.assertEqual(len(gs.grid.possible_moves), 23)
+
+
+class TestSolver(unittest.TestCase):
+
+    def test_small_board_values(self):
+        table = solver.solve(3, 3)
+        gs = Gl.GameState(dimension=3, turn="O", end_condition_length=3, num_games=1)
+        self.assertEqual(table[solver.position_index(gs)] >> solver.MOVE_BITS, solver.DRAW)
+        for move in [(0, 0), (0, 1)]:
+            gs.play_turn(move)
+        # an edge next to the opening corner loses
+        self.assertEqual(table[solver.position_index(gs)] >> solver.MOVE_BITS, solver.WIN)
+        self.assertEqual(solver.lookup(gs)[0], solver.WIN)
+
+    def test_minimax_plays_from_table(self):
+        gs = Gl.GameState(dimension=3, turn="X", end_condition_length=3, num_games=1)
+        for move in [(0, 0), (1, 1), (2, 2), (0, 2)]:
+            gs.play_turn(move)
+        bot = AlphaBetaBot()
+        self.assertEqual(bot.get_move(gs), (2, 0))
+        self.assertEqual(bot.nodes, 0)
+
+
+class TestProofNumberSearch(unittest.TestCase):
+
+    def test_solves_small_boards(self):
+        pns = ProofNumberSearch(size_mb=4)
+        self.assertEqual(pns.solve(Gl.GameState(dimension=3, turn="X", end_condition_length=3, num_games=1)), DRAW)
+        gs = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+        self.assertEqual(pns.solve(gs), WIN)
+        self.assertGreater(pns.proof_tree_size(gs), 1)
+        self.assertEqual(len(gs.moves), 0)
+
+    def test_budget_restores_position(self):
+        gs = Gl.GameState(dimension=5, turn="X", end_condition_length=4, num_games=1)
+        pns = ProofNumberSearch(size_mb=4, max_nodes=50)
+        self.assertIsNone(pns.solve(gs))
+        self.assertEqual((len(gs.moves), gs.grid.occupied()), (0, 0))
+
+    def test_bot_keeps_the_win(self):
+        gs = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+        bot = PNSBot(size_mb=4)
+        while gs.game_running:
+            gs.play_turn(bot.get_move(gs) if gs.turn == "X" else sorted(gs.grid.possible_moves)[0])
+        self.assertEqual(gs.winner, "X")
+
+    def test_solve_shares_one_deadline(self):
+        pns = ProofNumberSearch(size_mb=4, computation_time_ms=10000)
+        deadlines = []
+        mid = pns.mid
+
+        def recording_mid(*args):
+            deadlines.append(pns.deadline)
+            return mid(*args)
+        pns.mid = recording_mid
+        # a draw needs both searches
+        self.assertEqual(pns.solve(Gl.GameState(dimension=3, turn="X", end_condition_length=3, num_games=1)), DRAW)
+        self.assertEqual(len(set(deadlines)), 1)
+        self.assertEqual(pns.attacker, "O")
+
+    def test_bot_plays_without_proof_move(self):
+        gs = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+        bot = PNSBot(size_mb=4)
+        # as if the proof's table entries had been replaced
+        bot.search.proof_move = lambda game_state: None
+        self.assertIn(bot.get_move(gs), gs.grid.possible_moves)
+        self.assertEqual(bot.result, WIN)
+        self.assertIsNone(bot.search_policy(gs))
+
+
+class TestBatchHeuristic(unittest.TestCase):
+
+    def test_matches_heuristic_with_features(self):
+        rng = random.Random(7)
+        for dimension, end_condition_length in [(3, 3), (5, 4), (7, 3), (10, 5), (6, 2)]:
+            positions = []
+            for _ in range(0, 60):
+                gs = Gl.GameState(dimension, "X", end_condition_length, 1)
+                plies = rng.randint(0, dimension**2)
+                while gs.game_running and len(gs.moves) < plies:
+                    gs.play_turn(rng.choice(sorted(gs.grid.possible_moves)))
+                positions.append(gs)
+            boards, to_move = stack_game_states(positions)
+            expected = [heuristic_with_features(gs) for gs in positions]
+            np.testing.assert_allclose(batch_heuristic(boards, end_condition_length, to_move), expected)
+            # X moved first in all of them, so the side to move follows from the boards
+            np.testing.assert_allclose(batch_heuristic(boards, end_condition_length), expected)
+
+    def test_single_board(self):
+        board = np.array([[1, 1, 0], [2, 2, 0], [0, 0, 0]])
+        self.assertEqual(batch_heuristic(board, 3).shape, (1,))
+        self.assertAlmostEqual(batch_heuristic(board, 3)[0], 90.0)
+        self.assertAlmostEqual(batch_heuristic(board, 3, [2])[0], -90.0)
+
+
+class TestThreatSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.game_state = Gl.GameState(dimension=15, turn="X", end_condition_length=5, num_games=1)
+
+    def place(self, x_marks, o_marks):
+        for coord in x_marks:
+            self.game_state.grid.place_mark(coord, "X")
+        for coord in o_marks:
+            self.game_state.grid.place_mark(coord, "O")
+
+    def test_finds_double_four(self):
+        self.place([(7, 7), (7, 8), (7, 9), (8, 11), (9, 11), (10, 11)], [(7, 6), (6, 11), (3, 3), (4, 4), (12, 12)])
+        board = self.game_state.grid.grid_to_string()
+        line = ThreatSearch().vcf(self.game_state)
+        self.assertEqual(line[0], (7, 11))
+        self.assertEqual(self.game_state.grid.grid_to_string(), board)
+
+    def test_double_three_needs_vct(self):
+        self.place([(7, 6), (7, 7), (5, 8), (6, 8)], [(0, 0), (0, 2), (0, 4), (14, 14)])
+        search = ThreatSearch()
+        self.assertIsNone(search.vcf(self.game_state))
+        self.assertFalse(search.exhausted)
+        self.assertEqual(search.vct(self.game_state), [(7, 8)])
+
+    def test_budget_restores_board(self):
+        self.place([(7, 6), (7, 7), (5, 8), (6, 8)], [(0, 0), (0, 2), (0, 4), (14, 14)])
+        board = self.game_state.grid.grid_to_string()
+        search = ThreatSearch(node_budget=5)
+        self.assertIsNone(search.vct(self.game_state))
+        self.assertTrue(search.exhausted)
+        self.assertEqual(self.game_state.grid.grid_to_string(), board)
+
+    def test_minimax_plays_only_vcf_without_search(self):
+        self.place([(7, 7), (7, 8), (7, 9), (8, 11), (9, 11), (10, 11)], [(7, 6), (6, 11), (3, 3), (4, 4), (12, 12)])
+        bot = AlphaBetaBot(max_depth=1, use_book=False)
+        self.assertEqual(bot.get_move(self.game_state), (7, 11))
+        self.assertEqual((bot.source, bot.search_policy(self.game_state)[0]), ("threat", 1.0))
+
+    def test_minimax_searches_vct_move_first(self):
+        self.place([(7, 6), (7, 7), (5, 8), (6, 8)], [(0, 0), (0, 2), (0, 4), (14, 14)])
+        bot = AlphaBetaBot(max_depth=1, use_book=False)
+        bot.get_move(self.game_state)
+        self.assertEqual((bot.source, bot.first_move), ("search", (7, 8)))
+        self.assertEqual(bot.order_moves(self.game_state, [(0, 1), (7, 8)], None, 0)[0], (7, 8))
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    def test_lookup_covers_symmetric_positions(self):
+        book_dir = openingBook.BOOK_DIR
+        with tempfile.TemporaryDirectory() as openingBook.BOOK_DIR:
+            try:
+                gs = Gl.GameState(dimension=6, turn="X", end_condition_length=4, num_games=1)
+                gs.play_turn((1, 2))
+                key, symmetry = gs.canonical_key()
+                # book answer (2, 2) stored in the canonical orientation
+                openingBook.write_book({key: (Gl.symmetry_maps(6)[symmetry][14], 7)}, 6, 4)
+                self.assertEqual(openingBook.lookup(gs), ((2, 2), 7))
+                mirrored = Gl.GameState(dimension=6, turn="X", end_condition_length=4, num_games=1)
+                mirrored.play_turn((1, 3))
+                self.assertEqual(openingBook.book_move(mirrored), (2, 3))
+                self.assertEqual(AlphaBetaBot().get_move(mirrored), (2, 3))
+                mirrored.play_turn((2, 3))
+                self.assertIsNone(openingBook.lookup(mirrored))
+            finally:
+                openingBook.BOOK_DIR = book_dir
+                openingBook._books.pop((6, 4), None)
+
+
+# Claims children of the root of the shared tree until none are left, for TestMCTSBot.
+def claim_root_children(shm_name, max_nodes, lock, results):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    tree = MCTSTree(max_nodes, buffer=shm.buf, lock=lock)
+    claimed = []
+    child = tree.try_child(0)
+    while child >= 0:
+        claimed.append(child)
+        time.sleep(0)
+        child = tree.try_child(0)
+    results.put(claimed)
+    del tree
+    shm.close()
+
+
+class TestMCTSBot(unittest.TestCase):
+
+    def test_takes_win_and_restores_state(self):
+        gs = Gl.GameState(dimension=3, turn="X", end_condition_length=3, num_games=1)
+        for move in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+            gs.play_turn(move)
+        board, key = gs.grid.grid_to_string(), hash(gs)
+        self.assertEqual(MCTSBot(max_sims=500).get_move(gs), (0, 2))
+        self.assertEqual((gs.grid.grid_to_string(), hash(gs), len(gs.moves)), (board, key, 4))
+
+    def test_batched_rollouts(self):
+        gs = Gl.GameState(dimension=3, turn="X", end_condition_length=3, num_games=1)
+        # O to move, the only free squares are (0, 2) (blocks X) and (2, 2) (lets X win)
+        for move in [(0, 0), (1, 0), (0, 1), (1, 1), (1, 2), (2, 1), (2, 0)]:
+            gs.play_turn(move)
+        x_wins, o_wins, draws = batch_rollout(gs, 1000)
+        self.assertEqual(o_wins, 0)
+        self.assertEqual(x_wins + draws, 1000)
+        self.assertTrue(300 < x_wins < 700)
+        self.assertEqual(MCTSBot(max_sims=2000, rollout_batch_size=50).get_move(gs), (0, 2))
+
+    def test_tree_reuse_keeps_reply_subtree(self):
+        bot = MCTSBot(max_sims=2000, use_book=False)
+        gs = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+        gs.play_turn(bot.get_move(gs))
+        tree = bot.tree
+        start, end = tree.children(tree.child(0, gs.grid.coord_to_index(gs.moves[0])))
+        reply = start + int(tree.visits[start:end].argmax())
+        visits = int(tree.visits[reply])
+        gs.play_turn(gs.grid.index_to_coord(int(tree.move[reply])))
+        bot.get_move(gs)
+        self.assertEqual(bot.reused_sims, visits)
+        self.assertEqual(bot.tree.visits[0], visits + 2000)
+        start, end = bot.tree.children(0)
+        self.assertTrue((bot.tree.parent[start:end] == 0).all())
+        # a new game starts from an empty tree
+        gs.initialize_game_state("X", None, None, True, 0)
+        bot.get_move(gs)
+        self.assertEqual(bot.reused_sims, 0)
+
+    def test_parallel_workers_claim_children_once(self):
+        gs = Gl.GameState(dimension=7, turn="X", end_condition_length=4, num_games=1)
+        gs.play_turn((0, 1))
+        max_nodes = 100
+        ctx = mp.get_context("fork")
+        lock, results = ctx.Lock(), ctx.Queue()
+        shm = shared_memory.SharedMemory(create=True, size=MCTSTree.buffer_size(max_nodes))
+        try:
+            tree = MCTSTree(max_nodes, buffer=shm.buf, lock=lock)
+            tree.clear()
+            self.assertTrue(tree.expand(0, gs))
+            start, end = tree.children(0)
+            workers = [ctx.Process(target=claim_root_children, args=(shm.name, max_nodes, lock, results))
+                       for _ in range(0, 2)]
+            for worker in workers:
+                worker.start()
+            claimed = results.get(timeout=30) + results.get(timeout=30)
+            for worker in workers:
+                worker.join()
+            # every child handed out exactly once
+            self.assertEqual(sorted(claimed), list(range(start, end)))
+            self.assertEqual(tree.num_tried[0], end - start)
+            del tree
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_parallel_workers_use_bot_settings(self):
+        gs = Gl.GameState(dimension=4, turn="X", end_condition_length=3, num_games=1)
+        gs.play_turn((0, 1))
+        for mode in (parallelMcts.ROOT_PARALLEL, parallelMcts.TREE_PARALLEL):
+            bot = parallelMcts.ParallelMCTSBot(num_workers=1, mode=mode, computation_time_ms=10000, max_sims=41,
+                                               c=0.25, rollout_batch_size=4)
+            bot.use_book = False
+            try:
+                bot.get_move(gs)
+                # batches of 4 playouts run past 41 to 44
+                self.assertEqual(bot.num_sims, 44)
+            finally:
+                bot.close()
+        # the root workers' search, run on a thread so that its bot can be looked at
+        bot = parallelMcts.ParallelMCTSBot(num_workers=1, computation_time_ms=10000, max_sims=41, c=0.25,
+                                           rollout_batch_size=4)
+        bot.use_book = False
+        bot.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            bot.get_move(gs)
+            self.assertEqual((parallelMcts._worker_bot.c, parallelMcts._worker_bot.rollout_batch_size), (0.25, 4))
+        finally:
+            bot.close()
+
+
+"""
+Search statistics and pondering tests.
+"""
+
+
+class TestSearchStats(unittest.TestCase):
+
+    def test_records_only_when_enabled(self):
+        bot = AlphaBetaBot(max_depth=1, use_book=False, threat_search_budget=None)
+        gs = Gl.GameState(7, "X", 4, 1, x_player=bot, o_player=Gl.RandomBot())
+        gs.play_turn(None)
+        self.assertIsNone(bot.stats)
+        records = []
+        bot.collect_stats = True
+        bot.stats_hook = records.append
+        gs.play_turn(None)
+        gs.play_turn(None)
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual((record["player"], record["mark"], record["ply"], record["source"]),
+                         ("AlphaBetaBot", "X", 2, "search"))
+        self.assertEqual(tuple(record["move"]), gs.moves[2])
+        self.assertGreater(record["leaf_evaluations"], 0)
+        self.assertGreater(record["time_evaluation_ms"], 0)
+        self.assertIs(bot.generate_moves, prune_possible_moves)
+
+    def test_mcts_counts_simulations(self):
+        bot = MCTSBot(max_sims=200, use_book=False)
+        bot.collect_stats = True
+        gs = Gl.GameState(3, "X", 3, 1, x_player=bot)
+        gs.play_turn(None)
+        self.assertEqual(bot.stats["simulations"], 200)
+        self.assertGreater(bot.stats["tree_nodes"], 1)
+
+
+class TestPondering(unittest.TestCase):
+
+    def ponder_and_reply(self, bot, reply=None):
+        gs = Gl.GameState(7, "X", 4, 1, x_player=bot, o_player=Gl.RandomBot())
+        gs.play_turn(None)
+        board, key = gs.grid.grid_to_string(), hash(gs)
+        bot.start_pondering(gs)
+        time.sleep(0.3)
+        self.assertTrue(bot.pondering.running())
+        self.assertEqual((gs.grid.grid_to_string(), hash(gs)), (board, key))
+        gs.play_turn(reply(bot, gs) if reply else None)
+        gs.play_turn(None)
+        self.assertFalse(bot.pondering.running())
+        return gs
+
+    def test_minimax_hands_over_to_search(self):
+        bot = AlphaBetaBot(computation_time_ms=100, use_book=False, threat_search_budget=None)
+        gs = self.ponder_and_reply(bot)
+        self.assertGreater(bot.ponder_nodes, 0)
+        self.assertEqual(len(gs.moves), 3)
+
+    def test_mcts_keeps_subtree_of_reply(self):
+        def most_visited_reply(bot, gs):
+            tree = bot.tree
+            start, end = tree.children(0)
+            return gs.grid.index_to_coord(int(tree.move[start + int(tree.visits[start:end].argmax())]))
+
+        bot = MCTSBot(computation_time_ms=5000, max_sims=100, use_book=False)
+        start_time = time.time()
+        self.ponder_and_reply(bot, lambda bot, gs: (bot.stop_pondering(), most_visited_reply(bot, gs))[1])
+        self.assertGreater(bot.reused_sims, 0)
+        self.assertLess(time.time() - start_time, 5)
+
+    def test_mcts_charges_only_pondered_simulations(self):
+        landed = []
+
+        def least_visited_reply(bot, gs):
+            bot.stop_pondering()
+            tree = bot.tree
+            start, end = tree.children(0)
+            child = start + int(tree.visits[start:end].argmin())
+            move = int(tree.move[child])
+            landed.append(int(tree.visits[child]) - bot.ponder_base.get(move, 0))
+            return gs.grid.index_to_coord(move)
+
+        bot = MCTSBot(computation_time_ms=5000, max_sims=3000, use_book=False)
+        self.ponder_and_reply(bot, least_visited_reply)
+        self.assertLessEqual(landed[0], bot.ponder_sims)
+        self.assertEqual(bot.num_sims, max(1, bot.max_sims - landed[0]))
+
+
+"""
+Game server tests.
+"""
+
+
+class TestGameServer(unittest.TestCase):
+
+    def test_serves_concurrent_games(self):
+        report = asyncio.run(loadClient.run_local(workers=1, num_games=40, concurrency=20, connections=2))
+        self.assertEqual(report["games"], 40)
+        self.assertEqual(report["x_wins"] + report["o_wins"] + report["draws"], 40)
+        self.assertEqual(report["server"]["new"]["count"], 40)
+        self.assertEqual(sum(op["errors"] for op in report["server"].values()), 0)
+
+    def test_rejects_bad_requests(self):
+        async def play():
+            server = gameServer.GameServer(workers=1, max_games=1)
+            await server.start("127.0.0.1", 0)
+            connection = await loadClient.Connection.open("127.0.0.1", server.address()[1])
+            try:
+                new = await connection.request("new", dimension=3, score=3, bot="minimax", bot_plays="X")
+                responses = [await connection.request("move", game=new["game"], move=[9, 9]),
+                             await connection.request("move", game=new["game"] + 1, move=[0, 0]),
+                             await connection.request("new", dimension=3, score=3),
+                             await connection.request("teleport")]
+                state = await connection.request("state", game=new["game"])
+            finally:
+                await connection.close()
+                await server.close()
+            return new, responses, state
+
+        new, responses, state = asyncio.run(play())
+        self.assertTrue(new["ok"])
+        self.assertEqual(state["moves"], [new["bot_move"]])
+        self.assertEqual([response["ok"] for response in responses], [False] * 4)
+        self.assertEqual([response["id"] for response in responses], [2, 3, 4, 5])
+
+    def test_failed_bot_move_is_taken_back(self):
+        async def play():
+            server = gameServer.GameServer(workers=1)
+            await server.start("127.0.0.1", 0)
+            connection = await loadClient.Connection.open("127.0.0.1", server.address()[1])
+            play_bot = server.play_bot
+
+            async def failing_bot(session):
+                raise RuntimeError("bot crashed")
+            try:
+                new = await connection.request("new", dimension=3, score=3, bot="random", bot_plays="O")
+                server.play_bot = failing_bot
+                failed = await connection.request("move", game=new["game"], move=[1, 1])
+                state = await connection.request("state", game=new["game"])
+                server.play_bot = play_bot
+                retried = await connection.request("move", game=new["game"], move=[1, 1])
+            finally:
+                await connection.close()
+                await server.close()
+            return failed, state, retried
+
+        failed, state, retried = asyncio.run(play())
+        self.assertFalse(failed["ok"])
+        self.assertEqual((state["moves"], state["turn"]), ([], "X"))
+        self.assertTrue(retried["ok"])
+
+    def test_disconnect_closes_games(self):
+        async def play():
+            server = gameServer.GameServer(workers=1, max_games=1)
+            await server.start("127.0.0.1", 0)
+            try:
+                first = await loadClient.Connection.open("127.0.0.1", server.address()[1])
+                new = await first.request("new", dimension=3, score=3, bot="random")
+                await first.close()
+                for _ in range(0, 100):
+                    if not server.sessions:
+                        break
+                    await asyncio.sleep(0.01)
+                second = await loadClient.Connection.open("127.0.0.1", server.address()[1])
+                try:
+                    again = await second.request("new", dimension=3, score=3, bot="random")
+                finally:
+                    await second.close()
+            finally:
+                await server.close()
+            return new, again
+
+        new, again = asyncio.run(play())
+        self.assertTrue(new["ok"])
+        self.assertTrue(again["ok"])
+
+
+"""
+Training data tests.
+"""
+
+
+class TestEvaluatePositions(unittest.TestCase):
+
+    def test_board_and_moves_give_same_position(self):
+        gs = Gl.GameState(5, "X", 4, 1)
+        for move in [(2, 2), (1, 1), (2, 3), (0, 4), (4, 0)]:
+            gs.play_turn(move)
+        from_board = evaluatePositions.position_from_record({"board": gs.grid.grid_to_string(), "score": 4})
+        from_moves = evaluatePositions.position_from_record({"moves": gs.moves, "dimension": 5, "score": 4})
+        self.assertEqual((from_board.grid.x_bits, from_board.grid.o_bits, from_board.turn),
+                         (gs.grid.x_bits, gs.grid.o_bits, "O"))
+        self.assertEqual(hash(from_board), hash(from_moves))
+        compact = evaluatePositions.position_from_record({"board": ["X.O", ".X.", "..O"]})
+        self.assertEqual((compact.turn, len(compact.moves)), ("X", 4))
+
+    def test_finished_board(self):
+        # X's line is not the last X mark in row-major order
+        finished = evaluatePositions.position_from_record({"board": ["XXX", "OO.", "X.O"]})
+        self.assertEqual((finished.game_running, finished.winner, len(finished.moves)), (False, "X", 7))
+        text = evaluatePositions.position_from_record({"board": finished.grid.grid_to_string()})
+        self.assertEqual((text.grid.x_bits, text.grid.o_bits), (finished.grid.x_bits, finished.grid.o_bits))
+        o_won = evaluatePositions.position_from_record({"board": ["OX.", "OX.", "O.X"]})
+        self.assertEqual((o_won.game_running, o_won.winner), (False, "O"))
+        with self.assertRaises(ValueError):
+            evaluatePositions.position_from_record({"board": ["XXX", "OOO", "X.."]})
+
+    def test_stream_keeps_input_order(self):
+        lines = ['{"moves": [[0, 0], [1, 1]]}', "", "not json", '{"moves": [[0, 0], [0, 0]]}',
+                 '{"moves": [[0, 0], [1, 0], [0, 1], [1, 1], [0, 2]]}', "[1, 2]", '{"board": 5}', '{"moves": [[0]]}',
+                 '{"board": []}'] + ['{"moves": [[1, 1]]}'] * 10
+        results = list(evaluatePositions.evaluate_stream(lines, workers=1, chunk_size=2, window=2))
+        self.assertEqual([result["index"] for result in results], list(range(0, 18)))
+        self.assertEqual(["error" in result for result in results[:8]], [False, True, True, False] + [True] * 4)
+        self.assertEqual(results[3]["winner"], "X")
+        self.assertTrue(all(result["move"] == [0, 0] for result in results[8:]))
+
+
+class TestGameRecords(unittest.TestCase):
+
+    def play_games(self, writer, dimension, end_condition_length, turn, num_games):
+        expected = []
+        gs = Gl.GameState(dimension, turn, end_condition_length, num_games, x_player=Gl.RandomBot(),
+                          o_player=Gl.RandomBot(), bot_move_draw_delay=0)
+        gs.game_over_hook = writer.game_over_hook("random", "random")
+        while gs.game_counter < num_games:
+            winning_streak = None
+            while gs.game_running:
+                _, _, _, winning_streak = gs.play_turn(None)
+            gs.finish_game()
+            expected.append((list(gs.moves), gs.winner, winning_streak))
+            gs.initialize_game_state(turn, gs.x, gs.o, True, 0)
+        return expected
+
+    def test_replay_reproduces_games(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/games.ttr"
+            writer = gameRecords.GameRecordWriter(path, ["random"])
+            expected = self.play_games(writer, 3, 3, "X", 20) + self.play_games(writer, 17, 5, "O", 2)
+            writer.close()
+            records = gameRecords.GameRecords(path)
+            self.assertEqual(len(records), 22)
+            self.assertEqual(list(records.headers()["num_moves"]), [len(moves) for moves, _, _ in expected])
+            self.assertEqual(records[-1].first, "O")
+            for record, (moves, winner, winning_streak) in zip(records, expected):
+                game_state, replayed_streak = record.replay()
+                self.assertEqual(record.moves(), moves)
+                self.assertEqual((record.winner, game_state.winner, replayed_streak), (winner, winner, winning_streak))
+
+    def test_recovers_from_killed_writer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/games.ttr"
+            writer = gameRecords.GameRecordWriter(path, ["random"])
+            self.play_games(writer, 3, 3, "X", 5)
+            writer.close()
+            # the last index entry and half of a game never made it to disk
+            with open(path + ".idx", "r+b") as f:
+                f.truncate(4 * 8)
+            with open(path, "ab") as f:
+                f.write(gameRecords.encode_game(3, 3, "X", None, 0, 0, [(0, 0), (1, 1)])[:9])
+            self.assertEqual(len(gameRecords.GameRecords(path)), 5)
+            writer = gameRecords.GameRecordWriter(path, ["random"])
+            self.play_games(writer, 3, 3, "X", 1)
+            writer.close()
+            records = gameRecords.GameRecords(path)
+            self.assertEqual(len(records), 6)
+            self.assertFalse(records[5].replay()[0].game_running)
+            with self.assertRaises(ValueError):
+                gameRecords.GameRecordWriter(path, ["minimax"])
+
+
+class TestSelfPlay(unittest.TestCase):
+
+    def test_mcts_search_policy(self):
+        gs = Gl.GameState(3, "X", 3, 1)
+        for move in [(0, 0), (1, 1), (0, 1), (2, 2)]:
+            gs.play_turn(move)
+        bot = MCTSBot(computation_time_ms=10000, max_sims=300)
+        move = bot.get_move(gs)
+        value, policy = bot.search_policy(gs)
+        self.assertEqual(move, (0, 2))
+        self.assertAlmostEqual(policy.sum(), 1.0)
+        self.assertEqual(int(np.argmax(policy)), 2)
+        self.assertGreater(value, 0.5)
+
+    def test_mcts_policy_is_symmetric(self):
+        gs = Gl.GameState(5, "X", 4, 1)
+        bot = MCTSBot(computation_time_ms=10000, max_sims=500, use_book=False)
+        bot.get_move(gs)
+        _, policy = bot.search_policy(gs)
+        self.assertAlmostEqual(policy.sum(), 1.0)
+        # every cell of the empty board gets some of the mass, and symmetric cells the same
+        self.assertTrue(np.all(policy > 0))
+        for images in Gl.symmetry_maps(5):
+            np.testing.assert_allclose(policy[list(images)], policy)
+
+    def test_resumes_into_fixed_size_shards(self):
+        with tempfile.TemporaryDirectory() as directory:
+            options = dict(bot="random", num_games=6, workers=1, shard_size=10, seed=3)
+            first = selfPlay.generate(directory, **options)
+            options["num_games"] = 12
+            second = selfPlay.generate(directory, **options)
+            data = selfPlay.load_dataset(directory)
+            self.assertEqual((first["games"], second["games"]), (6, 12))
+            self.assertEqual(sorted(set(data["game"])), list(range(0, 12)))
+            self.assertEqual(len(data["game"]), first["generated"] + second["generated"])
+            for shard in range(0, second["shards"]):
+                with np.load(selfPlay.shard_path(directory, shard)) as shard_data:
+                    self.assertEqual(len(shard_data["game"]), 10)
+            # X and O marks differ by the side to move, the outcome is the winner's from the mover's side
+            marks = data["board"].sum(axis=(2, 3)).astype(int)
+            self.assertTrue(np.all(marks[:, 0] - marks[:, 1] == (data["to_move"] == -1)))
+            self.assertTrue(np.all(np.isnan(data["value"])))
+            self.assertTrue(np.allclose(data["policy"].sum(axis=1), 1.0))
+            with self.assertRaises(ValueError):
+                selfPlay.generate(directory, **dict(options, seed=4))
+
+    def test_resume_state_lives_in_pending_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            options = dict(bot="random", num_games=2, workers=1, shard_size=100, seed=3)
+            first = selfPlay.generate(directory, **options)
+            self.assertEqual(first["shards"], 0)
+            empty = selfPlay.load_dataset(directory, pending=False)
+            self.assertEqual((empty["board"].shape, empty["policy"].shape), ((0, 2, 3, 3), (0, 9)))
+            # the readable copy is not needed to resume
+            os.remove(os.path.join(directory, selfPlay.PROGRESS_FILE))
+            second = selfPlay.generate(directory, **dict(options, num_games=4))
+            self.assertEqual(second["games"], 4)
+            self.assertEqual(sorted(set(selfPlay.load_dataset(directory)["game"])), list(range(0, 4)))
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(FileNotFoundError):
+                selfPlay.load_dataset(directory)
+
+
+"""
+Tournament tests.
+"""
+
+
+class TestTournament(unittest.TestCase):
+
+    def test_summary(self):
+        summary = tournament.summarize(a_wins=30, b_wins=30, draws=40)
+        self.assertAlmostEqual(summary["elo_difference"], 0.0)
+        self.assertLess(summary["elo_difference_ci"][0], 0.0)
+        self.assertGreater(summary["elo_difference_ci"][1], 0.0)
+        self.assertAlmostEqual(tournament.elo_difference(0.75), 400 * math.log10(3))
+        empty = tournament.summarize(a_wins=0, b_wins=0, draws=0)
+        self.assertEqual((empty["games"], empty["a_win_rate"], empty["a_score_ci"]), (0, 0.0, (0.0, 1.0)))
+
+    def test_games_are_seeded_by_index(self):
+        def move_lists(seed):
+            results = []
+            tournament.run_tournament("random", "random", num_games=6, workers=1, on_result=results.append,
+                                      record_moves=True, seed=seed)
+            return [r["move_list"] for r in sorted(results, key=lambda r: r["game"])]
+        self.assertEqual(move_lists(1), move_lists(1))
+        self.assertNotEqual(move_lists(1), move_lists(2))
+
+    def test_minimax_does_not_lose_on_3x3(self):
+        results = []
+        summary = tournament.run_tournament("random", "minimax", num_games=20, workers=1, on_result=results.append)
+        self.assertEqual(summary["a_wins"], 0)
+        self.assertEqual(sorted(r["game"] for r in results), list(range(0, 20)))
+        self.assertEqual({r["a_plays"] for r in results}, {"X", "O"})
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_positions_are_reproducible(self):
+        first = [p.moves for p in benchmark.random_positions(7, seed=1)]
+        self.assertEqual(first, [p.moves for p in benchmark.random_positions(7, seed=1)])
+        self.assertTrue(all(p.game_running for p in benchmark.random_positions(7, seed=1)))
+
+    def test_regressions_against_baseline(self):
+        report = benchmark.run_benchmarks(cases=["play_and_backtrack", "mcts"], sizes=[3], min_time=0.01, repeats=1)
+        self.assertEqual(sorted(report["results"]), ["mcts/3", "play_and_backtrack/3"])
+        self.assertTrue(all(result["rate"] > 0 for result in report["results"].values()))
+        baseline = {"results": {key: {"rate": 2 * result["rate"]} for key, result in report["results"].items()}}
+        self.assertEqual(len(benchmark.regressions(report, baseline)), 2)
+        self.assertEqual(benchmark.regressions(report, report), [])
+
+
 def grid_suite():
     suite = unittest.TestSuite()
     suite.addTest(TestGridWinningConditions('test_small_grid'))
     suite.addTest(TestGridWinningConditions('test_big_grid'))
+    suite.addTest(TestGridBitboards('test_place_and_remove'))
+    suite.addTest(TestGridBitboards('test_neighbourhood_does_not_wrap_rows'))
+    suite.addTest(TestGridBitboards('test_frontier_follows_place_and_remove'))
+    suite.addTest(TestGridBitboards('test_line_counts_follow_place_and_remove'))
+    suite.addTest(TestGridBitboards('test_completing_cells_follow_place_and_remove'))
+    return suite
+
+
+def game_state_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestGameStateHashing('test_transpositions_share_key'))
+    suite.addTest(TestGameStateHashing('test_symmetric_positions_share_canonical_key'))
+    suite.addTest(TestGameStateHashing('test_side_to_move_changes_key'))
+    return suite
+
+
+def search_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestTranspositionTable('test_size_is_bounded'))
+    suite.addTest(TestTranspositionTable('test_depth_preferred_replacement'))
+    suite.addTest(TestTranspositionTable('test_always_replacement'))
+    suite.addTest(TestMinimaxUtils('test_pruning_leaves_board_untouched'))
+    suite.addTest(TestSolver('test_small_board_values'))
+    suite.addTest(TestSolver('test_minimax_plays_from_table'))
+    suite.addTest(TestProofNumberSearch('test_solves_small_boards'))
+    suite.addTest(TestProofNumberSearch('test_budget_restores_position'))
+    suite.addTest(TestProofNumberSearch('test_bot_keeps_the_win'))
+    suite.addTest(TestProofNumberSearch('test_solve_shares_one_deadline'))
+    suite.addTest(TestProofNumberSearch('test_bot_plays_without_proof_move'))
+    suite.addTest(TestBatchHeuristic('test_matches_heuristic_with_features'))
+    suite.addTest(TestBatchHeuristic('test_single_board'))
+    suite.addTest(TestThreatSearch('test_finds_double_four'))
+    suite.addTest(TestThreatSearch('test_double_three_needs_vct'))
+    suite.addTest(TestThreatSearch('test_budget_restores_board'))
+    suite.addTest(TestThreatSearch('test_minimax_plays_only_vcf_without_search'))
+    suite.addTest(TestThreatSearch('test_minimax_searches_vct_move_first'))
+    suite.addTest(TestOpeningBook('test_lookup_covers_symmetric_positions'))
+    suite.addTest(TestMCTSBot('test_takes_win_and_restores_state'))
+    suite.addTest(TestMCTSBot('test_batched_rollouts'))
+    suite.addTest(TestMCTSBot('test_tree_reuse_keeps_reply_subtree'))
+    suite.addTest(TestMCTSBot('test_parallel_workers_claim_children_once'))
+    suite.addTest(TestMCTSBot('test_parallel_workers_use_bot_settings'))
+    return suite
+
+
+def search_stats_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestSearchStats('test_records_only_when_enabled'))
+    suite.addTest(TestSearchStats('test_mcts_counts_simulations'))
+    suite.addTest(TestPondering('test_minimax_hands_over_to_search'))
+    suite.addTest(TestPondering('test_mcts_keeps_subtree_of_reply'))
+    suite.addTest(TestPondering('test_mcts_charges_only_pondered_simulations'))
+    return suite
+
+
+def game_server_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestGameServer('test_serves_concurrent_games'))
+    suite.addTest(TestGameServer('test_rejects_bad_requests'))
+    suite.addTest(TestGameServer('test_failed_bot_move_is_taken_back'))
+    suite.addTest(TestGameServer('test_disconnect_closes_games'))
+    return suite
+
+
+def training_data_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestEvaluatePositions('test_board_and_moves_give_same_position'))
+    suite.addTest(TestEvaluatePositions('test_finished_board'))
+    suite.addTest(TestEvaluatePositions('test_stream_keeps_input_order'))
+    suite.addTest(TestGameRecords('test_replay_reproduces_games'))
+    suite.addTest(TestGameRecords('test_recovers_from_killed_writer'))
+    suite.addTest(TestSelfPlay('test_mcts_search_policy'))
+    suite.addTest(TestSelfPlay('test_mcts_policy_is_symmetric'))
+    suite.addTest(TestSelfPlay('test_resumes_into_fixed_size_shards'))
+    suite.addTest(TestSelfPlay('test_resume_state_lives_in_pending_file'))
+    return suite
+
+
+def tournament_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestTournament('test_summary'))
+    suite.addTest(TestTournament('test_games_are_seeded_by_index'))
+    suite.addTest(TestTournament('test_minimax_does_not_lose_on_3x3'))
+    suite.addTest(TestBenchmark('test_positions_are_reproducible'))
+    suite.addTest(TestBenchmark('test_regressions_against_baseline'))
     return suite
 
 
 if __name__ == "__main__":
     runner = unittest.TextTestRunner(verbosity=2)
     runner.run(grid_suite())
+    runner.run(game_state_suite())
+    runner.run(search_suite())
+    runner.run(search_stats_suite())
+    runner.run(game_server_suite())
+    runner.run(training_data_suite())
+    runner.run(tournament_suite())
 
@@ -4,9 +4,11 @@ from time import sleep
 
 class TextDisplay:
 
-    def __init__(self, game_state, analytics):
+    def __init__(self, game_state, analytics, ponder=False):
         self.game_state = game_state
         self.analytics = analytics
+        # let bots think while waiting for the human's input
+        self.ponder = ponder
 
     def __print_turn_info(self):
         if not self.analytics:
@@ -47,6 +49,8 @@ class TextDisplay:
             while gs.game_running:
                 self.__print_turn_info()
                 turn, move, move_won, winning_streak = gs.play_turn(None)
+                if self.ponder:
+                    gs.start_pondering()
                 if (gs.turn == "X" and not isinstance(gs.x, HumanPlayer)) or \
                         (gs.turn == "O" and not isinstance(gs.o, HumanPlayer)):
                     sleep(gs.bot_move_draw_delay)
@@ -56,6 +60,8 @@ class TextDisplay:
 
                 # initialize new game
                 if not gs.game_running:
+                    gs.stop_pondering()
+                    gs.finish_game()
                     self.__print_analytics()
                     if gs.game_counter < gs.NUM_GAMES:
                         gs.initialize_game_state(
@@ -70,8 +76,8 @@ class TextDisplay:
         exit(0)
 
 
-def begin_graphics(game_state, analytics=False):
-        td = TextDisplay(game_state, analytics)
+def begin_graphics(game_state, analytics=False, ponder=False):
+        td = TextDisplay(game_state, analytics, ponder)
         td.mainloop()
 
 
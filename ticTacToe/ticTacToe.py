@@ -5,9 +5,14 @@ Start the game here.
 """
 
 import argparse
+import sys
 import gameLogic as gl
 from bots.minimax import AlphaBetaBot
 from bots.mcts import MCTSBot
+from bots.parallelMcts import ParallelMCTSBot
+from bots.pns import PNSBot
+from bots.utils.searchStats import format_stats, json_lines_hook
+from gameRecords import GameRecordWriter
 
 """
 Parse command line arguments.
@@ -15,6 +20,12 @@ Parse command line arguments.
 --turn      Mark of the starting player (X/O).
 --score     How many straight marks are needed to win the game.
 --display   Type of UI (text/gui).
+--mcts_workers  Number of processes the mcts bot searches with.
+--mcts_parallel How the mcts workers share the work (root/tree).
+--ponder    Let bots think on the human opponent's time.
+--stats     Print search statistics of every bot move.
+--stats_file    Write search statistics of every bot move as JSON lines.
+--record    Append the finished games to a binary game record file.
 """
 
 
@@ -23,39 +34,91 @@ parser.add_argument("-d", "--dim", metavar="N", type=int, default=3, help="Creat
 parser.add_argument("--score", metavar="s", type=int, default=3, help="How many marks straight are needed for win.")
 parser.add_argument("--display", metavar="dt", type=str, default="text", help="UI type (text/gui).")
 parser.add_argument("--bot_x", metavar="bx", type=str, default=None,
-                    help="Assign bot player to 'X' (None/random/minimax).")
+                    help="Assign bot player to 'X' (None/random/minimax/mcts/pns).")
 parser.add_argument("--bot_o", metavar="bo", type=str, default=None,
-                    help="Assign bot player to 'O' (None/random/minimax).")
+                    help="Assign bot player to 'O' (None/random/minimax/mcts/pns).")
 parser.add_argument("--bot_delay", metavar="s", type=float, default=0.2, help="Bot thinking time before move.")
 parser.add_argument("--num_games", metavar="n", type=int, default=1, help="Number of games to play.")
 parser.add_argument("--analytics",
                     action='store_true',
                     help="Only print analytics (bot vs bot mode does not print UI).")
+parser.add_argument("--mcts_workers", metavar="n", type=int, default=1,
+                    help="Number of processes for the mcts bot (1 = single process).")
+parser.add_argument("--mcts_parallel", metavar="mode", type=str, default="root", choices=["root", "tree"],
+                    help="Parallel mcts mode: independent trees merged at the root (root) or one shared tree (tree).")
+parser.add_argument("--ponder", action="store_true",
+                    help="Bots (minimax/mcts) keep searching while the human opponent thinks.")
+parser.add_argument("--stats", action="store_true", help="Print search statistics (nodes, time split...) per bot move.")
+parser.add_argument("--stats_file", metavar="file", type=str, default=None,
+                    help="Write search statistics of every bot move as JSON lines to file ('-' for stdout).")
+parser.add_argument("--record", metavar="file", type=str, default=None,
+                    help="Append every finished game to a game record file (see gameRecords.py).")
 
-args = parser.parse_args()
-
-bot_options = {None: gl.HumanPlayer(),
-               "random": gl.RandomBot(),
-               "minimax": AlphaBetaBot(),
-               "mcts": MCTSBot()
+# Players selectable from the command line (None = human).
+bot_options = {None: gl.HumanPlayer,
+               "random": gl.RandomBot,
+               "minimax": AlphaBetaBot,
+               "mcts": MCTSBot,
+               "pns": PNSBot
                }
 
-x_player = bot_options[args.bot_x]
-o_player = bot_options[args.bot_o]
-
-if args.dim < 3:
-    raise ValueError("Board size must be > 2")
-elif args.dim == 3 and args.score != 3:
-    raise ValueError("For 3x3 game score needs to be 3")
-
-ticTacToe = gl.Game(
-    dimension=args.dim,
-    end_condition_length=args.score,
-    x_player=x_player,
-    o_player=o_player,
-    display=args.display,
-    bot_move_draw_delay=args.bot_delay,
-    num_games=args.num_games,
-    analytics=False if args.analytics is None else args.analytics)
-
-ticTacToe.run()
+
+def create_player(name, mcts_workers=1, mcts_parallel="root"):
+    if name == "mcts" and mcts_workers > 1:
+        return ParallelMCTSBot(num_workers=mcts_workers, mode=mcts_parallel)
+    return bot_options[name]()
+
+
+# Turns on the per move statistics of the bots, printed and/or written with write_record.
+def enable_stats(players, print_stats=False, write_record=None):
+    def on_stats(record):
+        if print_stats:
+            print(format_stats(record))
+        if write_record is not None:
+            write_record(record)
+
+    for player in players:
+        if not isinstance(player, gl.HumanPlayer):
+            player.collect_stats = True
+            player.stats_hook = on_stats
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    x_player = create_player(args.bot_x, args.mcts_workers, args.mcts_parallel)
+    o_player = create_player(args.bot_o, args.mcts_workers, args.mcts_parallel)
+
+    stats_file = None
+    if args.stats_file == "-":
+        stats_file = sys.stdout
+    elif args.stats_file is not None:
+        stats_file = open(args.stats_file, "w")
+    if args.stats or stats_file is not None:
+        enable_stats((x_player, o_player), args.stats, None if stats_file is None else json_lines_hook(stats_file))
+
+    if args.dim < 3:
+        raise ValueError("Board size must be > 2")
+    elif args.dim == 3 and args.score != 3:
+        raise ValueError("For 3x3 game score needs to be 3")
+
+    ticTacToe = gl.Game(
+        dimension=args.dim,
+        end_condition_length=args.score,
+        x_player=x_player,
+        o_player=o_player,
+        display=args.display,
+        bot_move_draw_delay=args.bot_delay,
+        num_games=args.num_games,
+        analytics=False if args.analytics is None else args.analytics,
+        ponder=args.ponder)
+
+    recorder = None
+    if args.record is not None:
+        names = ["human" if name is None else name for name in (args.bot_x, args.bot_o)]
+        recorder = GameRecordWriter(args.record, names)
+        ticTacToe.gameState.game_over_hook = recorder.game_over_hook(*names)
+
+    ticTacToe.run()
+    if stats_file is not None and stats_file is not sys.stdout:
+        stats_file.close()
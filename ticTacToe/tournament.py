@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+Plays headless bot vs bot matches on a process pool.
+
+Games are played directly through GameState.play_turn, without a display, move delays or board printing. The two
+bots alternate colours (bot A plays X in even numbered games), each worker process keeps its bots between games so
+caches stay warm, and results are streamed as games finish. Every game seeds random and np.random from its index
+and the tournament seed, so the same arguments give the same games wherever they are played. At the end the
+win/draw/loss rates of bot A are reported with 95% confidence intervals together with the Elo difference implied by
+its score.
+
+From the project directory, play 10000 games of random vs minimax on a 3x3 board:
+python tournament.py --bot_a random --bot_b minimax --num_games 10000
+"""
+
+import argparse
+import json
+import math
+import multiprocessing as mp
+import random
+import sys
+import time
+
+import numpy as np
+
+import gameLogic as gl
+from gameRecords import GameRecordWriter
+from ticTacToe import bot_options
+
+Z_95 = 1.959964
+
+# Bots of the worker process, reused between games.
+_worker_bots = {}
+
+
+def _get_bot(role, name, computation_time_ms):
+    key = (role, name, computation_time_ms)
+    if key not in _worker_bots:
+        bot = bot_options[name]()
+        if computation_time_ms is not None and hasattr(bot, "computation_time_ms"):
+            bot.computation_time_ms = computation_time_ms
+        _worker_bots[key] = bot
+    return _worker_bots[key]
+
+
+# Plays one game and returns its result record.
+def play_game(task):
+    game_index, bot_a, bot_b, dimension, end_condition_length, computation_time_ms, record_moves, seed = task
+    rng = random.Random(seed * 1000003 + game_index)
+    random.seed(rng.getrandbits(64))
+    np.random.seed(rng.getrandbits(32))
+    a_is_x = game_index % 2 == 0
+    # separate instances per side, so a bot can play itself
+    player_a = _get_bot("a", bot_a, computation_time_ms)
+    player_b = _get_bot("b", bot_b, computation_time_ms)
+    x_player, o_player = (player_a, player_b) if a_is_x else (player_b, player_a)
+    game_state = gl.GameState(dimension, "X", end_condition_length, 1, x_player=x_player, o_player=o_player,
+                              bot_move_draw_delay=0)
+    start_time = time.time()
+    while game_state.game_running:
+        game_state.play_turn(None)
+    if game_state.winner is None:
+        result = "draw"
+    else:
+        result = "a" if (game_state.winner == "X") == a_is_x else "b"
+    record = {"game": game_index,
+              "a_plays": "X" if a_is_x else "O",
+              "winner": game_state.winner,
+              "result": result,
+              "moves": len(game_state.moves),
+              "seconds": round(time.time() - start_time, 6)}
+    if record_moves:
+        record["move_list"] = [list(move) for move in game_state.moves]
+    return record
+
+
+# Wilson score interval of a proportion.
+def wilson_interval(successes, n, z=Z_95):
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denominator = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+# Elo difference that makes score the expected score.
+def elo_difference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+# Summary of a match from bot A's point of view.
+def summarize(a_wins, b_wins, draws):
+    n = a_wins + b_wins + draws
+    if n == 0:
+        # nothing known yet, the score can be anything
+        score, margin = 0.5, 0.5
+    else:
+        score = (a_wins + 0.5 * draws) / n
+        # standard error of the mean per game score (1, 0.5 or 0)
+        variance = (a_wins * (1 - score)**2 + draws * (0.5 - score)**2 + b_wins * score**2) / n
+        margin = Z_95 * math.sqrt(variance / n)
+    return {"games": n,
+            "a_wins": a_wins,
+            "b_wins": b_wins,
+            "draws": draws,
+            "a_win_rate": a_wins / max(n, 1),
+            "a_win_rate_ci": wilson_interval(a_wins, n),
+            "b_win_rate": b_wins / max(n, 1),
+            "b_win_rate_ci": wilson_interval(b_wins, n),
+            "draw_rate": draws / max(n, 1),
+            "draw_rate_ci": wilson_interval(draws, n),
+            "a_score": score,
+            "a_score_ci": (max(0.0, score - margin), min(1.0, score + margin)),
+            "elo_difference": elo_difference(score),
+            "elo_difference_ci": (elo_difference(score - margin), elo_difference(score + margin))}
+
+
+# Plays num_games games between bot_a and bot_b. on_result is called with each game record as it finishes, with
+# record_moves the records carry the moves of the game too ("move_list").
+def run_tournament(bot_a, bot_b, dimension=3, end_condition_length=3, num_games=100, workers=None,
+                   computation_time_ms=None, on_result=None, record_moves=False, seed=0):
+    tasks = [(i, bot_a, bot_b, dimension, end_condition_length, computation_time_ms, record_moves, seed)
+             for i in range(0, num_games)]
+    counts = {"a": 0, "b": 0, "draw": 0}
+    workers = mp.cpu_count() if workers is None else workers
+    with mp.Pool(processes=workers) as pool:
+        chunk_size = max(1, min(64, num_games // (4 * workers)))
+        for record in pool.imap_unordered(play_game, tasks, chunksize=chunk_size):
+            counts[record["result"]] += 1
+            if on_result is not None:
+                on_result(record)
+    return summarize(counts["a"], counts["b"], counts["draw"])
+
+
+def format_summary(bot_a, bot_b, summary, elapsed):
+    def interval(ci):
+        return "[{:.2f}%, {:.2f}%]".format(100 * ci[0], 100 * ci[1])
+
+    lines = ["{} games of {} (A) vs {} (B) in {:.2f}s".format(summary["games"], bot_a, bot_b, elapsed),
+             "A wins {:6.2f}% {}".format(100 * summary["a_win_rate"], interval(summary["a_win_rate_ci"])),
+             "B wins {:6.2f}% {}".format(100 * summary["b_win_rate"], interval(summary["b_win_rate_ci"])),
+             "draws  {:6.2f}% {}".format(100 * summary["draw_rate"], interval(summary["draw_rate_ci"])),
+             "A score {:.4f} {}, Elo difference A - B {:+.1f} [{:+.1f}, {:+.1f}]".format(
+                 summary["a_score"], interval(summary["a_score_ci"]), summary["elo_difference"],
+                 summary["elo_difference_ci"][0], summary["elo_difference_ci"][1])]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a headless bot vs bot tournament")
+    parser.add_argument("--bot_a", metavar="a", type=str, default="random", help="First bot (random/minimax/mcts).")
+    parser.add_argument("--bot_b", metavar="b", type=str, default="minimax", help="Second bot (random/minimax/mcts).")
+    parser.add_argument("-d", "--dim", metavar="N", type=int, default=3, help="Create a N by N game board.")
+    parser.add_argument("--score", metavar="s", type=int, default=3, help="How many marks straight are needed for win.")
+    parser.add_argument("--num_games", metavar="n", type=int, default=100, help="Number of games to play.")
+    parser.add_argument("--workers", metavar="w", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--time_ms", metavar="t", type=int, default=None, help="Thinking time per move for bots.")
+    parser.add_argument("--results", metavar="file", type=str, default=None,
+                        help="Write one JSON line per finished game to file ('-' for stdout).")
+    parser.add_argument("--record", metavar="file", type=str, default=None,
+                        help="Append every game to a game record file (see gameRecords.py).")
+    parser.add_argument("--seed", metavar="s", type=int, default=0, help="Seed of the games.")
+    args = parser.parse_args()
+
+    for name in (args.bot_a, args.bot_b):
+        if name not in bot_options or name is None:
+            raise ValueError("Unknown bot: {}".format(name))
+
+    out = None
+    if args.results == "-":
+        out = sys.stdout
+    elif args.results is not None:
+        out = open(args.results, "w")
+
+    recorder = None
+    if args.record is not None:
+        recorder = GameRecordWriter(args.record, [args.bot_a, args.bot_b])
+
+    def write_result(record):
+        if recorder is not None:
+            a_is_x = record["a_plays"] == "X"
+            x_bot, o_bot = (args.bot_a, args.bot_b) if a_is_x else (args.bot_b, args.bot_a)
+            recorder.append(record.pop("move_list"), args.dim, args.score, record["winner"], x_bot, o_bot)
+        if out is not None:
+            out.write(json.dumps(record) + "\n")
+
+    start = time.time()
+    summary = run_tournament(args.bot_a, args.bot_b, args.dim, args.score, args.num_games, args.workers,
+                             args.time_ms, write_result, recorder is not None, args.seed)
+    if out is not None and out is not sys.stdout:
+        out.close()
+    if recorder is not None:
+        recorder.close()
+    print(format_summary(args.bot_a, args.bot_b, summary, time.time() - start))